@@ -0,0 +1,108 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class AudioBuffer:
+    """Growable int16 sample arena filled in place from the audio callback.
+
+    Samples are stored in fixed-size preallocated chunks, so appending never
+    moves audio that was already captured and reading it back hands out
+    views instead of joining everything into one big bytes object.
+    """
+
+    def __init__(self, chunk_samples=1 << 20):
+        self.chunk_samples = chunk_samples
+        self._chunks = []
+        self._fill = chunk_samples  # Forces allocation on first append
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, data):
+        """Copy a block of int16 samples (bytes or ndarray) into the arena"""
+        if not isinstance(data, np.ndarray):
+            data = np.frombuffer(data, dtype=np.int16)
+        offset = 0
+        remaining = len(data)
+        while remaining > 0:
+            if self._fill == self.chunk_samples:
+                self._chunks.append(np.empty(self.chunk_samples, dtype=np.int16))
+                self._fill = 0
+            chunk = self._chunks[-1]
+            count = min(remaining, self.chunk_samples - self._fill)
+            chunk[self._fill:self._fill + count] = data[offset:offset + count]
+            self._fill += count
+            offset += count
+            remaining -= count
+        # Publish the new length last so readers never see unwritten samples
+        self.length += len(data)
+
+    def views(self, start=0, end=None):
+        """Yield zero-copy views covering samples [start, end)"""
+        end = self.length if end is None else min(end, self.length)
+        position = 0
+        for chunk in self._chunks:
+            if position >= end:
+                break
+            chunk_end = position + self.chunk_samples
+            if chunk_end > start:
+                lo = max(start, position) - position
+                hi = min(end, chunk_end) - position
+                yield chunk[lo:hi]
+            position = chunk_end
+
+    def to_array(self, start=0, end=None):
+        """Return samples [start, end) as one array, copying only if they span chunks"""
+        parts = list(self.views(start, end))
+        if not parts:
+            return np.zeros(0, dtype=np.int16)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def clear(self):
+        """Release all chunks"""
+        self._chunks = []
+        self._fill = self.chunk_samples
+        self.length = 0
+
+class RingBuffer:
+    """Fixed-size int16 ring that keeps only the most recent samples"""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = np.zeros(size, dtype=np.int16)
+        self.pos = 0
+        self.filled = 0
+
+    def __len__(self):
+        return self.filled
+
+    def write(self, samples):
+        count = len(samples)
+        if count >= self.size:
+            self.data[:] = samples[-self.size:]
+            self.pos = 0
+            self.filled = self.size
+            return
+        end = self.pos + count
+        if end <= self.size:
+            self.data[self.pos:end] = samples
+        else:
+            first = self.size - self.pos
+            self.data[self.pos:] = samples[:first]
+            self.data[:count - first] = samples[first:]
+        self.pos = end % self.size
+        self.filled = min(self.size, self.filled + count)
+
+    def read(self):
+        """Return the buffered samples, oldest first, and empty the ring"""
+        start = (self.pos - self.filled) % self.size
+        if start + self.filled <= self.size:
+            samples = self.data[start:start + self.filled].copy()
+        else:
+            samples = np.concatenate((self.data[start:], self.data[:self.pos]))
+        self.filled = 0
+        return samples
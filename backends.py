@@ -0,0 +1,279 @@
+import io
+import logging
+import os
+import threading
+import time
+import wave
+import httpx
+import numpy as np
+from settings import Settings
+from http_client import cancel_on
+from request_policy import RequestPolicy, offline_errors
+
+logger = logging.getLogger(__name__)
+
+def _language(settings):
+    language = settings.get('language', '')
+    return None if language in ('', 'auto') else language
+
+class ApiBackend:
+    """Transcription through the OpenAI API or a compatible server.
+
+    Every request runs under the RequestPolicy (deadline, retries,
+    optional hedging). Without `retry_offline`, connection failures and
+    expired deadlines are not retried, so that a router can fall back to
+    the local model right away.
+    """
+    name = 'api'
+    description = "OpenAI Whisper API"
+
+    def __init__(self, client, request_stats, retry_offline=True):
+        self.client = client
+        self.request_stats = request_stats
+        self.retry_offline = retry_offline
+
+    @property
+    def model_name(self):
+        return Settings().get('model', 'whisper-1')
+
+    @property
+    def engines(self):
+        return [self]
+
+    def served_by(self):
+        return self
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        """Send one (name, bytes) upload and return the stripped text"""
+        settings = Settings()
+        options = {}
+        if prompt:
+            options['prompt'] = prompt
+        # Left out for auto-detection
+        language = _language(settings)
+        if language:
+            options['language'] = language
+
+        def send(time_left, cancelled):
+            # Retries are done by the policy, not by the client. The HTTP
+            # client's timeouts (the Request Timeout setting, connects capped
+            # at 10s) still apply, but none outlasts the attempt's deadline
+            limits = httpx.Timeout(self.client.timeout)
+            timeout = httpx.Timeout(**{name: time_left if limit is None else min(limit, time_left)
+                                       for name, limit in limits.as_dict().items()})
+            client = self.client.with_options(timeout=timeout, max_retries=0)
+            # A losing hedge or an expired attempt stops uploading
+            with cancel_on(cancelled):
+                return client.audio.transcriptions.create(
+                    file=upload,
+                    model=settings.get('model', 'whisper-1'),
+                    **options
+                )
+
+        no_retry = () if self.retry_offline else offline_errors()
+        response = RequestPolicy(self.request_stats, no_retry).call(send, duration)
+        return response.text.strip()
+
+class LocalBackend:
+    """Offline transcription on the CPU with faster-whisper (CTranslate2).
+
+    The model is loaded once, in the background, and then stays resident;
+    jobs that arrive before it is ready wait for it. Requests are
+    serialized because the model already spreads each one over
+    `threads` cores.
+    """
+    name = 'local'
+    description = "local Whisper model"
+
+    def __init__(self, model_size='base', threads=4, compute_type='int8'):
+        self.model_size = model_size
+        self.threads = threads
+        self.compute_type = compute_type
+        self.model = None
+        self.error = None
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return f"local-{self.model_size}"
+
+    @property
+    def engines(self):
+        return [self]
+
+    def served_by(self):
+        return self
+
+    def load_async(self):
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        started = time.monotonic()
+        try:
+            # Optional dependency, only needed for offline transcription
+            from faster_whisper import WhisperModel
+            self.model = WhisperModel(self.model_size, device='cpu', compute_type=self.compute_type,
+                                      cpu_threads=self.threads)
+            logger.info(f"Loaded local {self.model_size} model ({self.compute_type}, {self.threads} threads) "
+                        f"in {time.monotonic() - started:.1f}s")
+        except ImportError:
+            self.error = "Local transcription needs faster-whisper: pip install faster-whisper"
+            logger.error(self.error)
+        except Exception as e:
+            self.error = f"Failed to load local {self.model_size} model: {e}"
+            logger.error(self.error)
+        finally:
+            self.ready.set()
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        """Transcribe one (name, bytes) upload and return the stripped text"""
+        self.ready.wait()
+        if self.model is None:
+            raise RuntimeError(self.error)
+
+        name, data = upload
+        if os.path.splitext(name)[1].lower() == '.wav':
+            with wave.open(io.BytesIO(data), 'rb') as wf:
+                samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+            audio = samples.astype(np.float32) / 32768.0
+        else:
+            # Anything else is decoded by faster-whisper itself
+            audio = io.BytesIO(data)
+
+        started = time.monotonic()
+        with self._lock:
+            segments, _ = self.model.transcribe(audio, language=_language(Settings()),
+                                                initial_prompt=prompt, beam_size=5)
+            text = "".join(segment.text for segment in segments).strip()
+        elapsed = time.monotonic() - started
+        logger.info(f"Local transcription of {duration:.1f}s took {elapsed:.2f}s "
+                    f"({duration / max(elapsed, 1e-6):.1f}x realtime)")
+        return text
+
+def create_local_backend():
+    """Build the local backend from settings and start loading its model"""
+    settings = Settings()
+    try:
+        threads = int(settings.get('local_threads', 0))
+    except (ValueError, TypeError):
+        threads = 0
+    if threads <= 0:
+        # Leave half the cores to the desktop and the recorder
+        threads = max(1, (os.cpu_count() or 2) // 2)
+    backend = LocalBackend(settings.get('local_model', 'base'), threads,
+                           settings.get('local_compute_type', 'int8'))
+    backend.load_async()
+    return backend
+
+class LatencyEstimate:
+    """Running estimate of seconds of latency per second of audio (at least one)"""
+
+    def __init__(self, weight=0.3):
+        self.weight = weight
+        self.rate = None
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, duration):
+        rate = elapsed / max(duration, 1.0)
+        with self._lock:
+            self.rate = rate if self.rate is None else (1 - self.weight) * self.rate + self.weight * rate
+
+    def predict(self, duration):
+        return None if self.rate is None else self.rate * max(duration, 1.0)
+
+class RoutingBackend:
+    """Chooses the local or the API engine for every request.
+
+    Clips up to `local_seconds` go to the local model unless the API has
+    lately been faster for clips like it; longer ones go to the API. An
+    engine that is unavailable (local model not loaded, API unreachable)
+    is skipped, and a request that fails on one engine because of it is
+    retried on the other. The API counts as unreachable for
+    `offline_seconds` after a connection failure or a missed deadline;
+    build its backend with `retry_offline=False` so that the first one
+    already falls back.
+    """
+    name = 'auto'
+
+    def __init__(self, local, api, local_seconds=10.0, offline_seconds=60.0):
+        self.local = local
+        self.api = api
+        self.local_seconds = local_seconds
+        self.offline_seconds = offline_seconds
+        self.estimates = {'local': LatencyEstimate(), 'api': LatencyEstimate()}
+        self._offline_until = 0.0
+        # Workers share the router, each one asks about its own requests
+        self._served = threading.local()
+
+    @property
+    def description(self):
+        return "local model or OpenAI API"
+
+    @property
+    def engines(self):
+        return [self.local] + ([self.api] if self.api else [])
+
+    def served_by(self):
+        """Return the engine that answered this thread's last request"""
+        return getattr(self._served, 'backend', None)
+
+    def set_online(self, online):
+        """Record the outcome of a connectivity check, such as a connection pre-warm"""
+        self._offline_until = 0.0 if online else time.monotonic() + self.offline_seconds
+
+    def api_available(self):
+        return self.api is not None and time.monotonic() >= self._offline_until
+
+    def local_available(self):
+        # While the model is still loading, don't make the job wait for it
+        return self.local.ready.is_set() and self.local.model is not None
+
+    def choose(self, duration):
+        """Return (backend, reason) for audio of `duration` seconds"""
+        if not self.api_available():
+            return self.local, "API unavailable"
+        if not self.local_available():
+            return self.api, "local model unavailable"
+        if duration > self.local_seconds:
+            return self.api, f"longer than {self.local_seconds:.0f}s"
+        local_estimate = self.estimates['local'].predict(duration)
+        api_estimate = self.estimates['api'].predict(duration)
+        if local_estimate is not None and api_estimate is not None and api_estimate < local_estimate:
+            return self.api, f"API faster ({api_estimate:.2f}s vs {local_estimate:.2f}s)"
+        return self.local, f"shorter than {self.local_seconds:.0f}s"
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        self._served.backend = None
+        backend, reason = self.choose(duration)
+        started = time.monotonic()
+        try:
+            text = backend.transcribe(upload, size, duration, prompt)
+        except offline_errors() as e:
+            if backend is not self.api:
+                raise
+            self.set_online(False)
+            logger.warning(f"API unreachable ({e}), falling back to the local model")
+            backend, reason = self.local, "fallback, API unreachable"
+            started = time.monotonic()
+            text = backend.transcribe(upload, size, duration, prompt)
+        except RuntimeError:
+            # The local model failed to load after all
+            if backend is not self.local or not self.api_available():
+                raise
+            backend, reason = self.api, "fallback, local model failed"
+            started = time.monotonic()
+            text = backend.transcribe(upload, size, duration, prompt)
+        elapsed = time.monotonic() - started
+        self._served.backend = backend
+        self.estimates[backend.name].record(elapsed, duration)
+        logger.info(f"Routed {duration:.1f}s of audio to {backend.name} ({reason}), took {elapsed:.2f}s")
+        return text
+
+def create_routing_backend(local, api):
+    """Build the router between an already created local backend and the API backend, if any"""
+    try:
+        local_seconds = float(Settings().get('route_local_seconds', 10))
+    except (ValueError, TypeError):
+        local_seconds = 10.0
+    return RoutingBackend(local, api, local_seconds)
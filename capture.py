@@ -0,0 +1,303 @@
+import collections
+import logging
+import threading
+import time
+from typing import List
+import numpy as np
+from capture_health import CaptureHealth
+from devices import DeviceInfo, DeviceRegistry
+
+logger = logging.getLogger(__name__)
+
+# Length of each callback's block, 1024 frames at 48kHz
+BLOCK_SECONDS = 1024 / 48000
+
+# Whisper's rate; devices that capture at it natively need no resampling
+NATIVE_RATE = 16000
+
+class Subscription:
+    """One consumer of a capture stream.
+
+    With a callback, every block is handed to it on the audio thread, so it
+    must be cheap and never block (the recorder only copies and resamples).
+    Without one, blocks are kept in a bounded queue that the consumer
+    drains at its own pace; when it falls behind, the oldest blocks are
+    dropped and counted instead of holding up the device or the other
+    subscribers.
+    """
+
+    def __init__(self, hub, device_index, rate, callback=None, max_blocks=64, health=None):
+        self.hub = hub
+        self.device_index = device_index
+        self.rate = rate
+        self.health = health  # The stream's CaptureHealth, shared with its other subscribers
+        self.callback = callback
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self._blocks = collections.deque(maxlen=max_blocks)
+
+    def deliver(self, samples, now):
+        self.delivered += 1
+        if self.callback is not None:
+            self.callback(samples, now)
+            return
+        if len(self._blocks) == self._blocks.maxlen:
+            self.dropped += 1
+        self._blocks.append(samples)
+
+    def drain(self):
+        """Return the queued blocks, oldest first"""
+        blocks = []
+        while True:
+            try:
+                blocks.append(self._blocks.popleft())
+            except IndexError:
+                return blocks
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class CaptureStream:
+    """A device's input stream, shared by all of its subscribers"""
+
+    def __init__(self, pyaudio, audio, device_info, rate, health):
+        self.pyaudio = pyaudio
+        self.device_info = device_info
+        self.rate = rate
+        self.health = health
+        # Replaced, never mutated, so the callback can read it without a lock
+        self.subscribers = ()
+        frames_per_buffer = max(1, round(rate * BLOCK_SECONDS))
+        self.stream = audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            input=True,
+            input_device_index=device_info['index'],
+            frames_per_buffer=frames_per_buffer,
+            stream_callback=self._callback
+        )
+        health.stream_opened(rate, frames_per_buffer, self.stream.get_input_latency())
+        self._xruns_at_open = health.xruns()
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        started = time.perf_counter()
+        now = time.monotonic()
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        for subscription in self.subscribers:
+            try:
+                subscription.deliver(samples, now)
+            except Exception as e:
+                # One broken consumer must not stop the others
+                subscription.errors += 1
+                if subscription.errors == 1:
+                    logger.error(f"Capture subscriber failed: {e}")
+        # Xruns are only counted here, logging each one would add to the load
+        # that causes them; close() reports them
+        self.health.record(status, frame_count, started, time.perf_counter())
+        return (in_data, self.pyaudio.paContinue)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        xruns = self.health.xruns() - self._xruns_at_open
+        if xruns:
+            logger.warning(f"Capture on {self.device_info['name']} had {xruns} overflows or "
+                           f"underflows while the stream was open")
+
+class CaptureHub:
+    """Process-wide audio engine.
+
+    Owns the only PyAudio instance and opens at most one input stream per
+    device, which every subscriber (recorder, standby pre-roll, mic tests,
+    meters) shares. A stream is opened with its first subscriber and closed
+    with its last one.
+
+    PortAudio only enumerates devices when it starts, so the engine is
+    started once, on first use, and restarted after a hotplug event
+    (`refresh_devices`).
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or DeviceRegistry()
+        # The pyaudio module, once the engine has started
+        self.pyaudio = None
+        self._audio = None
+        self._streams = {}
+        # Device name -> CaptureHealth, kept across stream reopens and restarts
+        self._health = {}
+        self.refresh_pending = False
+        # Saved device last looked for by enumerating again, so a missing one costs one restart
+        self._rescanned_for = None
+        self._lock = threading.Lock()
+
+    @property
+    def audio(self):
+        if self._audio is None:
+            started = time.monotonic()
+            # Imported on first use, so the modules built on the hub load without PortAudio
+            import pyaudio
+            self.pyaudio = pyaudio
+            self._audio = pyaudio.PyAudio()
+            self.registry.enumerate(self._audio)
+            logger.info(f"Audio engine initialized in {(time.monotonic() - started) * 1000:.0f} ms")
+        return self._audio
+
+    def start(self):
+        """Bring up PortAudio ahead of the first stream, e.g. from a startup thread"""
+        with self._lock:
+            self.audio
+            
+    def device_info(self, device_index=None):
+        """Return the info of an input device, or of the default one"""
+        with self._lock:
+            if device_index is None:
+                return self.audio.get_default_input_device_info()
+            return self.audio.get_device_info_by_index(device_index)
+
+    def input_devices(self) -> List[DeviceInfo]:
+        """List input devices, from the cache when possible, without starting PortAudio"""
+        with self._lock:
+            devices = self.registry.cached()
+            if devices is None:
+                self.audio
+                devices = self.registry.devices
+            return list(devices)
+
+    def resolve_device(self, name='', index=None):
+        """Return the connected input device a setting refers to, or None for the default one.
+
+        A device chosen by name that the running engine does not know may
+        have been plugged in unnoticed, so the devices are enumerated again
+        once, unless a stream holds the engine open.
+        """
+        with self._lock:
+            # Indexes are only valid for the engine that is running
+            started = self._audio is None
+            self.audio
+            if (name and not started and name != self._rescanned_for and not self._streams
+                    and self.registry.find(name, index) is None):
+                self._rescanned_for = name
+                self._restart()
+                self.audio
+            return self.registry.resolve(name, index)
+
+    def refresh_devices(self):
+        """Enumerate devices again after a hotplug event.
+
+        PortAudio has to be restarted for that, which waits until no stream
+        is open; returns whether it happened right away.
+        """
+        with self._lock:
+            # After a device event, a missing device is worth looking for again
+            self._rescanned_for = None
+            if self._streams:
+                self.refresh_pending = True
+                logger.info("Device change noticed, refreshing once the open streams are closed")
+                return False
+            self._restart()
+            return True
+
+    def _restart(self):
+        self.refresh_pending = False
+        self.registry.invalidate()
+        if self._audio is not None:
+            self._audio.terminate()
+            self._audio = None
+        logger.info("Audio engine will restart to pick up device changes")
+
+    def _supports_native_rate(self, info):
+        """Whether the device captures 16kHz mono int16 itself, probed once per device"""
+        supported = self.registry.rate_supported(info['name'], NATIVE_RATE)
+        if supported is None:
+            try:
+                supported = bool(self.audio.is_format_supported(
+                    NATIVE_RATE, input_device=info['index'], input_channels=1,
+                    input_format=self.pyaudio.paInt16))
+            except ValueError:
+                supported = False
+            self.registry.record_rate(info['name'], NATIVE_RATE, supported)
+            logger.info(f"{info['name']} {'supports' if supported else 'does not support'} "
+                        f"{NATIVE_RATE} Hz capture")
+        return supported
+
+    def _open(self, info):
+        audio = self.audio
+        health = self._health.get(info['name'])
+        if health is None:
+            health = self._health[info['name']] = CaptureHealth(info['name'])
+        default_rate = int(info['defaultSampleRate'])
+        if default_rate != NATIVE_RATE and self._supports_native_rate(info):
+            try:
+                return CaptureStream(self.pyaudio, audio, info, NATIVE_RATE, health)
+            except (OSError, ValueError) as e:
+                # Advertised but refused; don't try again on this device
+                logger.warning(f"{info['name']} refused {NATIVE_RATE} Hz capture: {e}")
+                self.registry.record_rate(info['name'], NATIVE_RATE, False)
+        return CaptureStream(self.pyaudio, audio, info, default_rate, health)
+
+    def subscribe(self, device_index=None, callback=None, max_blocks=64):
+        """Receive the blocks of a device (the default one if None) as int16 arrays.
+
+        `callback(samples, now)` runs on the audio thread; without it the
+        blocks are queued for `Subscription.drain`. The stream runs at 16kHz
+        when the device supports it and at its default rate otherwise; the
+        returned subscription's `rate` says which.
+        """
+        info = self.device_info(device_index)
+        index = info['index']
+        with self._lock:
+            stream = self._streams.get(index)
+            if stream is None:
+                started = time.monotonic()
+                stream = self._open(info)
+                self._streams[index] = stream
+                logger.info(f"Opened capture stream on {info['name']} at {stream.rate} Hz "
+                            f"in {(time.monotonic() - started) * 1000:.0f} ms")
+            subscription = Subscription(self, index, stream.rate, callback, max_blocks,
+                                        stream.health)
+            stream.subscribers = stream.subscribers + (subscription,)
+        return subscription
+
+    def health(self):
+        """Return the capture statistics of every device opened so far"""
+        with self._lock:
+            return list(self._health.values())
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            stream = self._streams.get(subscription.device_index)
+            if stream is None or subscription not in stream.subscribers:
+                return
+            stream.subscribers = tuple(s for s in stream.subscribers if s is not subscription)
+            if subscription.dropped:
+                logger.info(f"Capture subscriber dropped {subscription.dropped} of "
+                            f"{subscription.delivered} blocks")
+            if not stream.subscribers:
+                del self._streams[subscription.device_index]
+                stream.close()
+                logger.info(f"Closed capture stream on {stream.device_info['name']}")
+                if self.refresh_pending and not self._streams:
+                    self._restart()
+
+    def shutdown(self):
+        with self._lock:
+            for stream in self._streams.values():
+                stream.close()
+            self._streams = {}
+            if self._audio is not None:
+                self._audio.terminate()
+                self._audio = None
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def capture_hub():
+    """Return the process-wide CaptureHub"""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = CaptureHub()
+        return _hub
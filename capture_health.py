@@ -0,0 +1,138 @@
+import bisect
+import csv
+import json
+import time
+
+# PortAudio's callback status flags (pyaudio.paInputUnderflow and
+# paInputOverflow), so the statistics load without PortAudio
+INPUT_UNDERFLOW = 0x1
+INPUT_OVERFLOW = 0x2
+
+# Histogram bucket upper bounds in milliseconds; one more bucket holds the rest
+CALLBACK_EDGES_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20)
+JITTER_EDGES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Counts of values in fixed buckets, cheap enough to fill from the audio thread"""
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding that fraction of the values, or None"""
+        if not self.total:
+            return None
+        rank = max(1, round(fraction * self.total))
+        seen = 0
+        for edge, count in zip(self.edges + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(edge, self.max)
+        return self.max
+
+    def buckets(self):
+        """Return [(label, count)], e.g. ('<= 0.5', 12) and ('> 20', 1)"""
+        labels = [f"<= {edge:g}" for edge in self.edges] + [f"> {self.edges[-1]:g}"]
+        return list(zip(labels, self.counts))
+
+class CaptureHealth:
+    """Running statistics of one device's capture stream.
+
+    `record` runs on the audio thread once per block and only bumps
+    counters; the GUI reads them through `snapshot` whenever it likes.
+    Statistics carry over when the device's stream is closed and opened
+    again, so a whole session's dropouts add up in one place.
+    """
+
+    def __init__(self, device_name):
+        self.device_name = device_name
+        self.since = time.time()
+        self.streams_opened = 0
+        self.rate = None
+        self.block_ms = None
+        self.input_latency_ms = None
+        self._last_callback = None
+        self.reset()
+
+    def reset(self):
+        # The audio thread may be mid-update; replacing objects instead of
+        # clearing them keeps that harmless
+        self.since = time.time()
+        self.callbacks = 0
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self.callback_time = Histogram(CALLBACK_EDGES_MS)
+        self.jitter = Histogram(JITTER_EDGES_MS)
+
+    def stream_opened(self, rate, frames_per_buffer, input_latency):
+        self.streams_opened += 1
+        self.rate = rate
+        self.block_ms = frames_per_buffer / rate * 1000
+        self.input_latency_ms = input_latency * 1000
+        # The gap since the last stream is not jitter
+        self._last_callback = None
+
+    def xruns(self):
+        return self.input_overflows + self.input_underflows
+
+    def record(self, status, frame_count, started, finished):
+        """Count one callback; `started` and `finished` are perf_counter() times"""
+        self.callbacks += 1
+        if status & INPUT_OVERFLOW:
+            self.input_overflows += 1
+        if status & INPUT_UNDERFLOW:
+            self.input_underflows += 1
+        self.callback_time.add((finished - started) * 1000)
+        if self._last_callback is not None:
+            expected = frame_count / self.rate
+            self.jitter.add(abs(started - self._last_callback - expected) * 1000)
+        self._last_callback = started
+
+    def snapshot(self):
+        """Return the statistics as a JSON-serializable dict"""
+        def histogram(h):
+            return {
+                'count': h.total,
+                'p50_ms': h.percentile(0.5),
+                'p99_ms': h.percentile(0.99),
+                'max_ms': round(h.max, 3),
+                'buckets_ms': dict(h.buckets()),
+            }
+        return {
+            'device': self.device_name,
+            'since': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.since)),
+            'streams_opened': self.streams_opened,
+            'rate': self.rate,
+            'block_ms': self.block_ms,
+            'input_latency_ms': self.input_latency_ms,
+            'callbacks': self.callbacks,
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+            'callback_time': histogram(self.callback_time),
+            'jitter': histogram(self.jitter),
+        }
+
+def export_json(snapshots, path):
+    with open(path, 'w') as f:
+        json.dump(snapshots, f, indent=2)
+
+def export_csv(snapshots, path):
+    """One row per device and histogram bucket, with the device's counters repeated"""
+    fields = ['device', 'since', 'rate', 'block_ms', 'input_latency_ms', 'callbacks',
+              'input_overflows', 'input_underflows', 'histogram', 'bucket_ms', 'count']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for snapshot in snapshots:
+            for name in ('callback_time', 'jitter'):
+                for bucket, count in snapshot[name]['buckets_ms'].items():
+                    writer.writerow(dict(snapshot, histogram=name, bucket_ms=bucket, count=count))
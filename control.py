@@ -0,0 +1,92 @@
+"""Send a command to the running Telly Spelly instance over D-Bus.
+
+Global hotkeys run this on every key press, so it only loads QtCore and
+QtDBus. There is no QApplication, and none of the recorder, transcriber
+or widget modules are imported.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import logging
+import sys
+from PyQt6.QtCore import QCoreApplication
+from PyQt6.QtDBus import QDBus, QDBusConnection, QDBusMessage
+
+logger = logging.getLogger(__name__)
+
+# D-Bus constants for single instance application
+DBUS_SERVICE_NAME = "org.kde.telly_spelly"
+DBUS_OBJECT_PATH = "/org/kde/telly_spelly/Instance"
+DBUS_INTERFACE = "local.GlobalShortcuts"  # Interface PyQt exports GlobalShortcuts under
+
+# Command line flag -> slot of GlobalShortcuts
+COMMANDS = {
+    'start_recording': 'activateStartRecording',
+    'stop_recording': 'activateStopRecording',
+    'toggle_recording': 'activateToggleRecording',
+}
+
+CALL_TIMEOUT_MS = 2000
+
+def call_instance(method, timeout_ms=CALL_TIMEOUT_MS):
+    """Call a slot of the running instance and return (status, reply arguments).
+
+    The status is 0 when the instance handled it, 1 on a D-Bus error and 2
+    when no instance is running. The method is called directly, without a
+    QDBusInterface, which would introspect the remote object first.
+    """
+    # QtDBus wants an application object, QCoreApplication is enough
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    bus = QDBusConnection.sessionBus()
+    if not bus.isConnected():
+        logger.error("D-Bus session bus not connected. Cannot send command to existing instance.")
+        return 1, []
+    message = QDBusMessage.createMethodCall(DBUS_SERVICE_NAME, DBUS_OBJECT_PATH,
+                                            DBUS_INTERFACE, method)
+    reply = bus.call(message, QDBus.CallMode.Block, timeout_ms)
+    if reply.type() == QDBusMessage.MessageType.ErrorMessage:
+        if reply.errorName() == "org.freedesktop.DBus.Error.ServiceUnknown":
+            logger.error("Telly Spelly is not running")
+            return 2, []
+        logger.error(f"D-Bus call failed: {reply.errorMessage()}")
+        return 1, []
+    logger.info("D-Bus command sent successfully to existing instance.")
+    return 0, reply.arguments()
+
+def send_command(command, timeout_ms=CALL_TIMEOUT_MS):
+    """Send one of COMMANDS to the running instance; returns the status of call_instance"""
+    return call_instance(COMMANDS[command], timeout_ms)[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control a running Telly Spelly instance")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--start-recording", action="store_true", help="Start recording.")
+    group.add_argument("--stop-recording", action="store_true", help="Stop recording.")
+    group.add_argument("--toggle-recording", action="store_true", help="Start or stop recording.")
+    group.add_argument("--latency-summary", action="store_true",
+                       help="Print p50/p95/p99 latencies of recent recordings.")
+    parser.add_argument("--timing", action="store_true",
+                        help="Print how long startup and the D-Bus call took.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.latency_summary:
+        result, reply = call_instance('latencySummary')
+        if reply:
+            print(reply[0])
+        return result
+
+    command = next(name for name in COMMANDS if getattr(args, name))
+    imported = time.perf_counter()
+    result = send_command(command)
+    if args.timing:
+        done = time.perf_counter()
+        print(f"{command}: imports {(imported - STARTED) * 1000:.1f} ms, "
+              f"D-Bus call {(done - imported) * 1000:.1f} ms, "
+              f"total {(done - STARTED) * 1000:.1f} ms after interpreter startup", file=sys.stderr)
+    return result
+
+if __name__ == "__main__":
+    sys.exit(main())
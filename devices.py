@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import TypedDict
+from PyQt6.QtCore import QObject, QFileSystemWatcher, QProcess, QSocketNotifier, QTimer, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+# Capabilities kept per device, both in memory and in the on-disk cache
+DEVICE_FIELDS = ('index', 'name', 'hostApi', 'maxInputChannels', 'maxOutputChannels',
+                 'defaultSampleRate', 'defaultLowInputLatency', 'defaultHighInputLatency')
+
+class DeviceInfo(TypedDict, total=False):
+    index: int
+    name: str
+    maxInputChannels: int
+    defaultSampleRate: float
+    hostApi: int
+    maxOutputChannels: int
+    defaultLowInputLatency: float
+    defaultHighInputLatency: float
+
+def default_devices_path():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'telly-spelly', 'devices.json')
+
+def stable_name(name):
+    """Device name without the ALSA card/device numbers, which change on replug"""
+    return re.sub(r'\s*\(hw:\d+,\d+\)$', '', name or '').strip()
+
+class DeviceRegistry:
+    """Input devices and their capabilities, enumerated once per audio engine.
+
+    The list is also kept on disk, so it can be shown before PortAudio is
+    started at all. It is only enumerated again after a hotplug event
+    (see `invalidate`). Sample rates probed on a device are remembered by
+    device name, across hotplugs and runs. The selected microphone is
+    stored by name and looked up here, because PortAudio indexes change
+    whenever a device comes or goes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_devices_path()
+        self.devices = None
+        # Stable device name -> {rate: supported}, from probing
+        self.rates = {}
+        # The disk cache is only trusted until the first hotplug event
+        self._disk_checked = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._disk_checked:
+            return
+        self._disk_checked = True
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.rates = {name: {int(rate): ok for rate, ok in rates.items()}
+                          for name, rates in data.get('rates', {}).items()}
+            if self.devices is None:
+                self.devices = [DeviceInfo(d) for d in data['devices']]
+                logger.info(f"Loaded {len(self.devices)} input devices from {self.path}")
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    def cached(self):
+        """Return the known devices, reading the disk cache if nothing was enumerated yet"""
+        with self._lock:
+            self._load()
+            return self.devices
+
+    def enumerate(self, audio):
+        """Read every input device from a freshly started PyAudio instance"""
+        devices = []
+        for i in range(audio.get_device_count()):
+            info = audio.get_device_info_by_index(i)
+            if info.get('maxInputChannels') > 0:
+                devices.append(DeviceInfo({k: info[k] for k in DEVICE_FIELDS if k in info}))
+        with self._lock:
+            self._load()
+            changed = devices != self.devices
+            self.devices = devices
+            if changed:
+                self._save()
+        logger.info(f"Found {len(devices)} input devices")
+        return devices
+
+    def rate_supported(self, name, rate):
+        """Return whether a device was found to capture at `rate`, or None if never probed"""
+        with self._lock:
+            self._load()
+            return self.rates.get(stable_name(name), {}).get(rate)
+
+    def record_rate(self, name, rate, supported):
+        with self._lock:
+            self.rates.setdefault(stable_name(name), {})[rate] = supported
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'devices': self.devices or [], 'rates': self.rates}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save the device cache: {e}")
+
+    def invalidate(self):
+        with self._lock:
+            self._load()
+            self.devices = None
+
+    def find(self, name='', index=None):
+        """Find the device a setting refers to: by name, then by legacy index.
+
+        Returns None when it is not connected or nothing was chosen.
+        """
+        devices = self.devices or []
+        if name:
+            for device in devices:
+                if device['name'] == name:
+                    return device
+            wanted = stable_name(name)
+            for device in devices:
+                if stable_name(device['name']) == wanted:
+                    return device
+            return None
+        if index is not None and index >= 0:
+            for device in devices:
+                if device['index'] == index:
+                    return device
+        return None
+
+    def resolve(self, name='', index=None):
+        """Like `find`, but warns when a device chosen by name is missing.
+
+        Returns None when it should fall back to the default device.
+        """
+        device = self.find(name, index)
+        if device is None and name:
+            logger.warning(f"Input device '{name}' is not connected, using the default one")
+        return device
+
+# `pactl subscribe` lines for sources and cards coming or going; 'change'
+# events (volume, mute, default device) are not hotplugs
+PULSE_EVENT = re.compile(r"Event '(new|remove)' on (source|card) #\d+")
+
+class DeviceWatcher(QObject):
+    """Reports when sound cards are plugged in or removed.
+
+    Follows the sound server's events through `pactl subscribe`, which
+    PipeWire (through pipewire-pulse) and PulseAudio both answer, so
+    Bluetooth headsets are seen as well. Card events come from udev
+    through pyudev where it is installed, and from the ALSA device nodes
+    otherwise. Several events in quick succession are reported once.
+
+    `live` is False when only the ALSA nodes are watched; devices that
+    appear without a node are then only found by enumerating again (see
+    `TrayRecorder.toggle_settings` and `CaptureHub.resolve_device`).
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, path='/dev/snd', settle_ms=1000):
+        super().__init__()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(settle_ms)
+        self.timer.timeout.connect(self.changed)
+        self.process = None
+        self.monitor = None
+        self.watcher = None
+        self.live = self._watch_sound_server()
+        if self._watch_udev():
+            self.live = True
+        else:
+            self.watcher = QFileSystemWatcher(self)
+            if os.path.isdir(path):
+                self.watcher.addPath(path)
+            else:
+                logger.info(f"{path} not found, device hotplug is not watched")
+            self.watcher.directoryChanged.connect(lambda _: self.timer.start())
+
+    def _watch_sound_server(self):
+        if shutil.which('pactl') is None:
+            return False
+        self.process = QProcess(self)
+        self.process.readyReadStandardOutput.connect(self._read_sound_server)
+        self.process.finished.connect(self._sound_server_gone)
+        self.process.start('pactl', ['subscribe'])
+        if not self.process.waitForStarted(1000):
+            logger.info("Could not subscribe to sound server events")
+            self.process = None
+            return False
+        return True
+
+    def _read_sound_server(self):
+        output = bytes(self.process.readAllStandardOutput()).decode(errors='replace')
+        if PULSE_EVENT.search(output):
+            self.timer.start()
+
+    def _sound_server_gone(self):
+        logger.info("Sound server event subscription ended, e.g. no sound server is running")
+        self.process = None
+        self.live = self.monitor is not None
+
+    def _watch_udev(self):
+        try:
+            # Optional dependency, the ALSA nodes are watched without it
+            import pyudev
+        except ImportError:
+            return False
+        try:
+            self.monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            self.monitor.filter_by('sound')
+            self.monitor.start()
+        except OSError as e:
+            logger.info(f"Could not monitor udev: {e}")
+            self.monitor = None
+            return False
+        self.notifier = QSocketNotifier(self.monitor.fileno(), QSocketNotifier.Type.Read, self)
+        self.notifier.activated.connect(self._read_udev)
+        return True
+
+    def _read_udev(self):
+        # Drain what is queued, the notifier fires again while anything is left
+        while self.monitor.poll(timeout=0) is not None:
+            self.timer.start()
+
+    def close(self):
+        if self.process is not None:
+            self.process.finished.disconnect(self._sound_server_gone)
+            self.process.kill()
+            self.process.waitForFinished(1000)
+            self.process = None
@@ -0,0 +1,149 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import wave
+import numpy as np
+from settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class EncodedAudio:
+    """An encoded recording held in memory.
+
+    Carries the file name hint the transcription API uses to detect the
+    format, so the audio never has to touch the filesystem. `digest`
+    identifies the PCM it was encoded from, for the transcript cache.
+    """
+
+    def __init__(self, data, filename, duration, digest=None):
+        self.data = data
+        self.filename = filename
+        self.duration = duration
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.data)
+
+    def as_upload(self):
+        """Return a (name, bytes) pair for the API client, safe to send more than once"""
+        return (self.filename, self.data)
+
+class ChunkedAudio:
+    """A long recording split at pauses into separately encoded chunks.
+
+    `overlaps[i]` is how many seconds chunk i repeats from the end of chunk
+    i - 1; it is zero whenever the split fell into a pause.
+    """
+
+    def __init__(self, chunks, overlaps):
+        self.chunks = chunks
+        self.overlaps = overlaps
+        self.duration = sum(chunk.duration for chunk in chunks)
+        digests = [chunk.digest for chunk in chunks]
+        self.digest = "+".join(digests) if all(digests) else None
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+class WavEncoder:
+    """Uncompressed mono 16-bit WAV, always available"""
+    name = 'wav'
+    suffix = '.wav'
+
+    def encode(self, blocks, output, rate):
+        """Write blocks to `output`, a file name or a writable binary file object"""
+        wf = wave.open(output, 'wb')
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        for block in blocks:
+            wf.writeframes(block)
+        wf.close()
+
+class FfmpegEncoder:
+    """Compressed formats produced by piping raw PCM through ffmpeg"""
+
+    def __init__(self, name, suffix, container, codec_args):
+        self.name = name
+        self.suffix = suffix
+        self.container = container
+        self.codec_args = codec_args
+
+    def encode(self, blocks, output, rate):
+        """Write blocks to `output`, a file name or a writable binary file object"""
+        to_file = isinstance(output, str)
+        process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+             '-f', 's16le', '-ar', str(rate), '-ac', '1', '-i', 'pipe:0',
+             *self.codec_args, '-f', self.container, output if to_file else 'pipe:1'],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+            stdout=subprocess.DEVNULL if to_file else subprocess.PIPE)
+
+        # Drain stdout concurrently so ffmpeg never blocks on a full pipe
+        reader = None
+        if not to_file:
+            reader = threading.Thread(target=shutil.copyfileobj, args=(process.stdout, output))
+            reader.start()
+        try:
+            for block in blocks:
+                process.stdin.write(np.asarray(block, dtype='<i2'))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg died early, the error is reported below
+        stderr = process.stderr.read()
+        process.wait()
+        if reader:
+            reader.join()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.name}: {stderr.decode(errors='replace').strip()}")
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+def get_encoder(name):
+    """Return the encoder for a format name, falling back to WAV"""
+    if name == 'flac':
+        encoder = FfmpegEncoder('flac', '.flac', 'flac', ['-c:a', 'flac', '-compression_level', '5'])
+    elif name == 'opus':
+        settings = Settings()
+        try:
+            bitrate = int(settings.get('opus_bitrate', 24))
+        except (ValueError, TypeError):
+            bitrate = 24
+        encoder = FfmpegEncoder('opus', '.ogg', 'ogg', ['-c:a', 'libopus', '-b:a', f'{bitrate}k',
+                                                        '-application', 'voip'])
+    else:
+        return WavEncoder()
+
+    if not ffmpeg_available():
+        logger.warning(f"ffmpeg not found, uploading WAV instead of {name}")
+        return WavEncoder()
+    return encoder
+
+def select_encoder(duration):
+    """Pick the upload format for a recording of `duration` seconds.
+
+    In 'auto' mode short recordings go up as WAV, since encoding would
+    take about as long as the upload it saves; longer ones are worth
+    FLAC, and very long ones the lossy Opus encoder.
+    """
+    settings = Settings()
+    if settings.get('transcription_backend', 'api') == 'local':
+        # Nothing is uploaded, the local engine reads the PCM straight from WAV
+        return WavEncoder()
+    name = settings.get('audio_format', 'auto')
+    if name == 'auto':
+        if duration < 10:
+            name = 'wav'
+        elif duration < 120:
+            name = 'flac'
+        else:
+            name = 'opus'
+    return get_encoder(name)
+
+def encoder_for_file(filename):
+    """Return the encoder matching a file name's extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return get_encoder({'.flac': 'flac', '.ogg': 'opus', '.opus': 'opus'}.get(extension, 'wav'))
@@ -0,0 +1,123 @@
+import logging
+import threading
+from contextlib import contextmanager
+import httpx
+from settings import Settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+class ConnectionStats:
+    """Counts requests that reused a pooled connection versus new handshakes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    @property
+    def reused(self):
+        return self.requests - self.new_connections
+
+    def record(self, connected, tls):
+        with self._lock:
+            self.requests += 1
+            self.new_connections += connected
+            self.tls_handshakes += tls
+
+    def summary(self):
+        return (f"{self.requests} requests, {self.reused} on reused connections, "
+                f"{self.new_connections} new connections, {self.tls_handshakes} TLS handshakes")
+
+class RequestCancelled(Exception):
+    """The request was abandoned by its caller, e.g. it lost a hedge or ran out of time"""
+
+# Bytes of the upload sent between two checks for cancellation
+UPLOAD_CHUNK = 64 * 1024
+
+_local = threading.local()
+
+@contextmanager
+def cancel_on(event):
+    """Abort this thread's requests once `event` is set.
+
+    The upload stops within one chunk and the response at its next read;
+    the connection is closed rather than returned to the pool, so the
+    server sees the request go away.
+    """
+    previous = getattr(_local, 'cancelled', None)
+    _local.cancelled = event
+    try:
+        yield
+    finally:
+        _local.cancelled = previous
+
+class CancellableStream(httpx.SyncByteStream):
+    """Request or response body that raises RequestCancelled once its event is set"""
+
+    def __init__(self, stream, cancelled, chunk_size=None):
+        self.stream = stream
+        self.cancelled = cancelled
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for data in self.stream:
+            step = self.chunk_size or len(data) or 1
+            for start in range(0, len(data), step):
+                if self.cancelled.is_set():
+                    raise RequestCancelled("Request cancelled")
+                yield data[start:start + step]
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close:
+            close()
+
+class CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that reports whether each request had to open a connection"""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        events = set()
+
+        def trace(name, info):
+            if name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                events.add(name)
+
+        request.extensions = {**request.extensions, 'trace': trace}
+        cancelled = getattr(_local, 'cancelled', None)
+        if cancelled is not None:
+            request.stream = CancellableStream(request.stream, cancelled, UPLOAD_CHUNK)
+        response = super().handle_request(request)
+        self.stats.record('connection.connect_tcp.complete' in events,
+                          'connection.start_tls.complete' in events)
+        if cancelled is not None:
+            if cancelled.is_set():
+                response.close()
+                raise RequestCancelled("Request cancelled")
+            response.stream = CancellableStream(response.stream, cancelled)
+        return response
+
+def _float_setting(settings, key, default):
+    try:
+        return float(settings.get(key, default))
+    except (ValueError, TypeError):
+        return default
+
+def build_http_client(stats):
+    """Create the pooled keep-alive client shared by all transcription requests"""
+    settings = Settings()
+    pool_size = int(_float_setting(settings, 'http_pool_size', 8))
+    keepalive = _float_setting(settings, 'http_keepalive', 60.0)
+    timeout = _float_setting(settings, 'http_timeout', 60.0)
+    limits = httpx.Limits(max_connections=pool_size,
+                          max_keepalive_connections=pool_size,
+                          keepalive_expiry=keepalive)
+    logger.info(f"HTTP pool: {pool_size} connections, {keepalive:.0f}s keep-alive, {timeout:.0f}s timeout")
+    return httpx.Client(transport=CountingTransport(stats, limits=limits),
+                        timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)))
@@ -60,7 +60,14 @@ def install_application():
     # Copy application files
     python_files = ["main.py", "recorder.py", "transcriber.py", "settings.py", 
                    "progress_window.py", "processing_window.py", "settings_window.py",
-                   "loading_window.py", "shortcuts.py", "volume_meter.py"]
+                   "loading_window.py", "shortcuts.py", "volume_meter.py",
+                   "audio_buffer.py", "resampler.py",
+                   "segmenter.py", "vad.py",
+                   "encoder.py", "http_client.py", "request_policy.py",
+                   "transcript_cache.py", "backends.py",
+                   "realtime.py", "meter.py", "capture.py", "devices.py", "journal.py",
+                   "control.py", "startup.py", "tracing.py",
+                   "capture_health.py", "mic_debug.py"]
     
     for file in python_files:
         if os.path.exists(file):
@@ -84,6 +91,15 @@ exec python3 {app_dir}/main.py "$@"
     # Make launcher executable
     launcher_path.chmod(0o755)
     
+    # Lightweight launcher for global hotkeys, it only talks to the running instance
+    control_path = bin_dir / f"{app_name}-ctl"
+    with open(control_path, 'w') as f:
+        f.write(f'''#!/bin/bash
+export PYTHONPATH="$HOME/.local/lib/python{sys.version_info.major}.{sys.version_info.minor}/site-packages:$PYTHONPATH"
+exec python3 {app_dir}/control.py "$@"
+''')
+    control_path.chmod(0o755)
+    
     # Copy desktop file
     desktop_file = "org.kde.telly_spelly.desktop"
     if os.path.exists(desktop_file):
@@ -0,0 +1,164 @@
+import fcntl
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def default_journal_dir():
+    base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'telly-spelly', 'journal')
+
+class JournalBuffer:
+    """Recording buffer kept in an on-disk journal instead of in memory.
+
+    Works like AudioBuffer. `append` only queues the block, and a writer
+    thread appends it to a raw 16-bit PCM file through a large write
+    buffer. The file is fsynced every `sync_seconds`, so a crash, OOM kill
+    or power loss costs at most the last few seconds. Reads memory-map
+    the file, so memory use stays flat however long the recording gets.
+
+    The file is locked while a JournalBuffer has it open. A journal that
+    nobody holds a lock on was left behind by a crash; see
+    `find_orphaned_journals`.
+    """
+
+    def __init__(self, directory=None, sync_seconds=2.0, write_buffer=1 << 20, path=None):
+        self.sync_seconds = sync_seconds
+        self.length = 0
+        self.error = None
+        self._map = None
+        self._queue = None
+        if path is None:
+            directory = directory or default_journal_dir()
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            path = os.path.join(directory, time.strftime('recording-%Y%m%d-%H%M%S') + f'-{os.getpid()}.pcm')
+            # Dictation is private, only the user may read it
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            self._file = os.fdopen(fd, 'wb', buffering=write_buffer)
+            self._written = 0
+        else:
+            self._file = open(path, 'rb')
+            # A torn final sample from a power loss is dropped
+            self._written = self.length = os.path.getsize(path) // 2
+        self.path = path
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if self._file.writable():
+            self._queue = queue.SimpleQueue()
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing journal read-only, e.g. to recover it"""
+        return cls(path=path)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, data):
+        """Queue a block of int16 samples (bytes or ndarray) for the writer thread"""
+        if not isinstance(data, np.ndarray):
+            data = np.frombuffer(data, dtype=np.int16)
+        self._queue.put(np.ascontiguousarray(data, dtype='<i2'))
+        self.length += len(data)
+
+    def _write_loop(self):
+        last_sync = time.monotonic()
+        while True:
+            block = self._queue.get()
+            try:
+                if block is None:
+                    self._sync_file()
+                    return
+                if isinstance(block, threading.Event):
+                    self._file.flush()
+                    block.set()
+                    continue
+                self._file.write(block)
+                self._written += len(block)
+                if time.monotonic() - last_sync >= self.sync_seconds:
+                    self._sync_file()
+                    last_sync = time.monotonic()
+            except OSError as e:
+                if self.error is None:
+                    self.error = str(e)
+                    logger.error(f"Writing the recording journal failed: {e}")
+                if isinstance(block, threading.Event):
+                    block.set()
+
+    def _sync_file(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def sync(self):
+        """Wait until everything appended so far is in the file"""
+        if self._queue is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def views(self, start=0, end=None):
+        """Yield a view of samples [start, end) mapped from the journal"""
+        self.sync()
+        end = self._written if end is None else min(end, self._written)
+        if end <= start:
+            return
+        if self._map is None or len(self._map) < end:
+            self._map = np.memmap(self.path, dtype='<i2', mode='r', shape=(self._written,))
+        yield self._map[start:end]
+
+    def to_array(self, start=0, end=None):
+        """Return samples [start, end) as one array"""
+        parts = list(self.views(start, end))
+        return np.array(parts[0]) if parts else np.zeros(0, dtype=np.int16)
+
+    def finish(self):
+        """Write out everything appended and stop the writer, keeping the file and its lock"""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._queue = None
+        self._map = None
+
+    def close(self, delete=True):
+        """Finish the journal; it is kept for recovery unless `delete` is set"""
+        if self.path is None:
+            return
+        self.finish()
+        self._file.close()
+        if delete:
+            os.unlink(self.path)
+        else:
+            logger.info(f"Recording journal kept at {self.path}")
+        self.path = None
+
+    def clear(self):
+        """Delete the journal, once the recording no longer needs it"""
+        self.close(delete=True)
+        self.length = 0
+
+def find_orphaned_journals(directory=None):
+    """Return journals that no running instance holds, oldest first.
+
+    Empty ones are deleted on the way.
+    """
+    orphans = []
+    for path in sorted(glob.glob(os.path.join(directory or default_journal_dir(), '*.pcm'))):
+        try:
+            with open(path, 'rb') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if os.path.getsize(path) < 2:
+                    os.unlink(path)
+                    continue
+            orphans.append(path)
+        except BlockingIOError:
+            continue  # Still being recorded
+        except OSError as e:
+            logger.warning(f"Could not check journal {path}: {e}")
+    return orphans
@@ -1,23 +1,37 @@
+import time
+
+STARTED = time.perf_counter()
+
 import sys
+from startup import StartupProfiler
+
+# Created first, so --profile-startup also sees the imports below
+profiler = StartupProfiler(STARTED, enabled='--profile-startup' in sys.argv)
+
 from PyQt6.QtWidgets import (QApplication, QMessageBox, QSystemTrayIcon, QMenu)
-from PyQt6.QtCore import Qt, QTimer, QCoreApplication
+from PyQt6.QtCore import Qt, QTimer, QCoreApplication, QEventLoop
 from PyQt6.QtGui import QIcon, QAction
 import logging
-from settings_window import SettingsWindow
+import importlib
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from progress_window import ProgressWindow
 from processing_window import ProcessingWindow
-from recorder import AudioRecorder
-from transcriber import WhisperTranscriber
+from devices import DeviceWatcher
 from loading_window import LoadingWindow
 from PyQt6.QtCore import pyqtSignal
 import warnings
 import ctypes
 import os
+from collections import deque
 from shortcuts import GlobalShortcuts
+from control import send_command
+from tracing import tracer
+import html
 from settings import Settings
 from PyQt6.QtDBus import QDBusConnection, QDBusInterface, QDBusMessage
 import argparse
-# from mic_debug import MicDebugWindow
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -42,13 +56,12 @@ except:
     warnings.warn("Failed to suppress ALSA warnings", RuntimeWarning)
 
 def check_dependencies():
-    required_packages = ['whisper', 'pyaudio', 'keyboard']
+    required_packages = ['numpy', 'scipy', 'pyaudio', 'openai', 'httpx', 'websockets']
     missing_packages = []
     
+    # Only looked up, they are imported later in the background
     for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
+        if importlib.util.find_spec(package) is None:
             missing_packages.append(package)
             logger.error(f"Failed to import required dependency: {package}")
     
@@ -77,10 +90,23 @@ class TrayRecorder(QSystemTrayIcon):
         self.progress_window = None
         self.processing_window = None
         self.recorder = None
+        self.device_watcher = None
         self.transcriber = None
-        
-        # Create debug window but don't show it
-        # self.debug_window = MicDebugWindow()
+        # Trace of the current recording session, from hotkey to clipboard
+        self.trace = None
+        # Transcription jobs still in flight, with the trace of their recording
+        self.pending_jobs = {}
+        # Job id of the recording being streamed in realtime mode
+        self.realtime_job = None
+        # (realtime job, trace) of each stopped recording still being encoded, oldest first
+        self.finalizing = deque()
+        # Encoded audio of the last whole recording, kept for "Retry Last Recording"
+        self.last_audio = None
+        # Journals of recordings whose transcript is still on its way, by trace
+        self.journals = {}
+        
+        # Created the first time it is shown
+        self.debug_window = None
         
         # Set tooltip
         self.setToolTip("Telly Spelly")
@@ -96,6 +122,7 @@ class TrayRecorder(QSystemTrayIcon):
         self.shortcuts.start_recording_triggered.connect(self.start_recording)
         logger.info("self.shortcuts set.")
         self.shortcuts.stop_recording_triggered.connect(self.stop_recording)
+        self.shortcuts.toggle_recording_triggered.connect(self.toggle_recording)
 
     def initialize(self):
         """Initialize the tray recorder after showing loading window"""
@@ -133,10 +160,21 @@ class TrayRecorder(QSystemTrayIcon):
         self.settings_action.triggered.connect(self.toggle_settings)
         menu.addAction(self.settings_action)
         
-        # Add debug window action
-        # self.debug_action = QAction("Show Debug Window", menu)
-        # self.debug_action.triggered.connect(self.toggle_debug_window)
-        # menu.addAction(self.debug_action)
+        # Sends the last recording again, answered from the cache if it was transcribed before
+        self.retry_action = QAction("Retry Last Recording", menu)
+        self.retry_action.triggered.connect(self.retry_last_recording)
+        self.retry_action.setEnabled(False)
+        menu.addAction(self.retry_action)
+        
+        # Where the time goes between hotkey and clipboard
+        latency_action = QAction("Latency Summary", menu)
+        latency_action.triggered.connect(self.show_latency_summary)
+        menu.addAction(latency_action)
+        
+        # Input levels and capture health, for diagnosing dropouts
+        self.debug_action = QAction("Show Debug Window", menu)
+        self.debug_action.triggered.connect(self.toggle_debug_window)
+        menu.addAction(self.debug_action)
         
         # Add separator before quit
         menu.addSeparator()
@@ -157,6 +195,7 @@ class TrayRecorder(QSystemTrayIcon):
         if self.recording:
             # Stop recording
             self.recording = False
+            self.trace.mark('stop_requested')
             self.record_action.setText("Start Recording")
             self.setIcon(self.normal_icon)
             
@@ -168,7 +207,19 @@ class TrayRecorder(QSystemTrayIcon):
             # Stop the actual recording
             if self.recorder:
                 try:
-                    self.recorder.stop_recording()
+                    if self.recorder.stop_recording():
+                        self.finalizing.append((self.realtime_job, self.trace))
+                        if self.realtime_job is not None:
+                            # The live text usually arrives before the audio is encoded
+                            self.pending_jobs[self.realtime_job] = self.trace
+                        if self.progress_window:
+                            self.progress_window.set_finalizing(True)
+                    else:
+                        tracer().finish(self.trace, 'no_audio')
+                        if self.realtime_job is not None:
+                            self.recorder.realtime_session = None
+                            self.transcriber.cancel_realtime(self.realtime_job)
+                    self.realtime_job = None
                 except Exception as e:
                     logger.error(f"Error stopping recording: {e}")
                     if self.progress_window:
@@ -178,16 +229,31 @@ class TrayRecorder(QSystemTrayIcon):
         else:
             # Start recording
             self.recording = True
+            self.trace = tracer().start_session()
+            self.trace.mark('start_requested')
             # Show progress window
             if not self.progress_window:
                 self.progress_window = ProgressWindow("Voice Recording")
                 self.progress_window.stop_clicked.connect(self.stop_recording)
+                self.progress_window.cancel_clicked.connect(self.recorder.cancel_finalize)
+                self.progress_window.set_meter(self.recorder.meter.reader())
+            else:
+                # Earlier recordings may still be transcribing in the background
+                self.progress_window.set_recording_mode()
             self.progress_window.show()
             
+            # Stream to the realtime API while recording, if enabled
+            self.realtime_job = None
+            session = None
+            if self.transcriber and Settings().get('realtime_mode', False):
+                session = self.transcriber.start_realtime(self.trace)
+                if session is not None:
+                    self.realtime_job = session.job_id
+            
             # Start recording
             self.record_action.setText("Stop Recording")
             self.setIcon(self.recording_icon)
-            self.recorder.start_recording()
+            self.recorder.start_recording(self.trace, session)
 
     def stop_recording(self):
         """Handle stopping the recording and starting processing"""
@@ -199,12 +265,17 @@ class TrayRecorder(QSystemTrayIcon):
 
     def toggle_settings(self):
         if not self.settings_window:
+            from settings_window import SettingsWindow
             self.settings_window = SettingsWindow()
             self.settings_window.shortcuts_changed.connect(self.update_shortcuts)
+            self.settings_window.standby_changed.connect(self.update_standby)
         
         if self.settings_window.isVisible():
             self.settings_window.hide()
         else:
+            if self.device_watcher is not None and not self.device_watcher.live:
+                # Without device events a headset may have come or gone unnoticed
+                self.handle_devices_changed()
             self.settings_window.show()
             
     def update_shortcuts(self, start_key, stop_key):
@@ -214,6 +285,51 @@ class TrayRecorder(QSystemTrayIcon):
                            f"Start: {start_key}\nStop: {stop_key}",
                            self.normal_icon)
 
+    def update_standby(self):
+        """Open or close the pre-roll standby stream after a settings change"""
+        if self.recorder:
+            self.recorder.start_standby()
+
+    def handle_devices_changed(self):
+        """Pick up microphones that were plugged in or removed"""
+        logger.info("Audio devices changed")
+        from capture import capture_hub
+        capture_hub().refresh_devices()
+        if self.recorder:
+            # Moves the standby stream to the restarted engine, or waits for the recording to end
+            self.recorder.start_standby()
+        if self.settings_window:
+            self.settings_window.populate_devices()
+
+    def recover_recordings(self):
+        """Offer to transcribe recordings that a crash left in their journals"""
+        from journal import find_orphaned_journals
+        from recorder import TARGET_RATE
+        journals = find_orphaned_journals()
+        if not journals:
+            return
+        minutes = sum(os.path.getsize(path) for path in journals) / 2 / TARGET_RATE / 60
+        box = QMessageBox(QMessageBox.Icon.Question, "Unfinished Recordings",
+                          f"{len(journals)} recording(s) ({minutes:.1f} min) were not finished "
+                          "because Telly Spelly stopped unexpectedly. Transcribe them now?")
+        transcribe = box.addButton("Transcribe", QMessageBox.ButtonRole.AcceptRole)
+        discard = box.addButton("Discard", QMessageBox.ButtonRole.DestructiveRole)
+        box.addButton("Later", QMessageBox.ButtonRole.RejectRole)
+        box.exec()
+        
+        for path in journals:
+            try:
+                if box.clickedButton() is transcribe:
+                    trace = tracer().start_session()
+                    trace.mark('stop_requested')
+                    if self.recorder.recover_journal(path, trace):
+                        self.finalizing.append((None, trace))
+                elif box.clickedButton() is discard:
+                    os.unlink(path)
+                    logger.info(f"Discarded journal {path}")
+            except OSError as e:
+                logger.error(f"Could not recover {path}: {e}")
+
     def on_activate(self, reason):
         if reason == QSystemTrayIcon.ActivationReason.Trigger:  # Left click
             self.toggle_recording()
@@ -223,6 +339,20 @@ class TrayRecorder(QSystemTrayIcon):
         if self.recorder:
             self.recorder.cleanup()
             self.recorder = None
+        # Closes any stream still open and releases PortAudio
+        from capture import capture_hub
+        capture_hub().shutdown()
+        if self.device_watcher:
+            self.device_watcher.close()
+            
+        # Stop the transcription workers
+        if self.transcriber:
+            self.transcriber.shutdown()
+        
+        # Recordings that never got their transcript are offered again on the next start
+        for journal in self.journals.values():
+            journal.close(delete=False)
+        self.journals = {}
         
         # Close all windows
         if self.settings_window and self.settings_window.isVisible():
@@ -231,6 +361,9 @@ class TrayRecorder(QSystemTrayIcon):
         if self.progress_window and self.progress_window.isVisible():
             self.progress_window.close()
             
+        if self.debug_window and self.debug_window.isVisible():
+            self.debug_window.close()
+            
         # Stop recording if active
         if self.recording:
             self.stop_recording()
@@ -238,17 +371,8 @@ class TrayRecorder(QSystemTrayIcon):
         # Quit the application
         QApplication.quit()
 
-    def update_volume_meter(self, value):
-        # Update debug window first
-        if hasattr(self, 'debug_window'):
-            self.debug_window.update_values(value)
-            
-        # Then update volume meter as before
-        if self.progress_window and self.recording:
-            self.progress_window.update_volume(value)
-    
-    def handle_recording_finished(self, audio_file):
-        """Called when recording is saved to file"""
+    def handle_recording_finished(self, audio):
+        """Called when the recording has been encoded in memory"""
         logger.info("TrayRecorder: Recording finished, starting transcription")
         
         # Ensure progress window is in processing mode
@@ -256,8 +380,17 @@ class TrayRecorder(QSystemTrayIcon):
             self.progress_window.set_processing_mode()
             self.progress_window.set_status("Starting transcription...")
         
-        if self.transcriber:
-            self.transcriber.transcribe_file(audio_file)
+        self.last_audio = audio
+        self.retry_action.setEnabled(True)
+        
+        realtime_job, trace = self.finalizing[0] if self.finalizing else (None, None)
+        if self.transcriber and realtime_job is not None:
+            # Already transcribed while recording, the audio is only a fallback
+            self.finalizing[0] = (None, trace)
+            self.transcriber.finish_realtime(realtime_job, audio)
+        elif self.transcriber:
+            job_id = self.transcriber.transcribe_file(audio, trace)
+            self.pending_jobs[job_id] = trace
         else:
             logger.error("Transcriber not initialized")
             if self.progress_window:
@@ -265,34 +398,113 @@ class TrayRecorder(QSystemTrayIcon):
                 self.progress_window = None
             QMessageBox.critical(None, "Error", "Transcriber not initialized")
     
+    def retry_last_recording(self):
+        """Transcribe the last recording again, e.g. after an error or a settings change"""
+        if self.last_audio is None or not self.transcriber:
+            return
+        trace = tracer().start_session()
+        trace.mark('stop_requested')
+        logger.info("Retrying the last recording")
+        job_id = self.transcriber.transcribe_file(self.last_audio, trace)
+        self.pending_jobs[job_id] = trace
+    
+    def handle_segment_ready(self, trace, index, audio, is_last):
+        """Called for each pause-delimited segment in pipeline mode"""
+        if self.transcriber:
+            # Segments may come in after the next recording has started, the
+            # trace says which recording they belong to
+            job_id = self.transcriber.transcribe_segment(trace, index, audio, is_last)
+            self.pending_jobs[job_id] = trace
+        else:
+            logger.error("Transcriber not initialized")
+    
     def handle_recording_error(self, error):
         """Handle recording errors"""
         logger.error(f"TrayRecorder: Recording error: {error}")
         QMessageBox.critical(None, "Recording Error", error)
         self.stop_recording()
+        if self.realtime_job is not None:
+            self.recorder.realtime_session = None
+            self.transcriber.cancel_realtime(self.realtime_job)
+            self.realtime_job = None
         if self.progress_window:
             self.progress_window.close()
             self.progress_window = None
     
+    def handle_finalize_progress(self, done, total):
+        if self.progress_window and not self.recording:
+            self.progress_window.set_status(f"Encoding audio ({done}/{total} chunks)...")
+            
+    def handle_finalized(self, task):
+        """Called once a stopped recording has been encoded, cancelled or failed"""
+        realtime_job, trace = self.finalizing.popleft() if self.finalizing else (None, None)
+        if task.error:
+            tracer().finish(trace, 'error')
+        elif task.cancelled and task.segments is None:
+            tracer().finish(trace, 'cancelled')
+        if (task.cancelled or task.error) and realtime_job is not None and self.transcriber:
+            self.transcriber.cancel_realtime(realtime_job)
+        reported = False
+        if task.error and task.segments is not None and self.transcriber:
+            # The segments already out still get transcribed, the job then fails with this
+            reported = self.transcriber.abandon_segments(task.trace, task.error)
+        if task.error and not reported:
+            QMessageBox.critical(None, "Recording Error", task.error)
+        if task.journal is not None:
+            if task.cancelled or task.trace.last('clipboard_set') is not None:
+                # Discarded, or (in realtime mode) already delivered
+                task.journal.clear()
+            else:
+                self.journals[task.trace] = task.journal
+        if self.progress_window and not self.finalizing:
+            self.progress_window.set_finalizing(False)
+        self.close_progress_window_if_idle()
+    
+    def show_latency_summary(self):
+        QMessageBox.information(None, "Latency Summary",
+                                f"<pre>{html.escape(tracer().summary())}</pre>"
+                                f"<p>Every session is logged to {html.escape(tracer().path)}</p>")
+    
     def update_processing_status(self, status):
         if self.progress_window:
             self.progress_window.set_status(status)
     
-    def handle_transcription_finished(self, text):
+    def handle_transcription_partial(self, job_id, text):
+        if self.progress_window:
+            self.progress_window.set_partial_text(text)
+    
+    def handle_transcription_finished(self, job_id, text):
+        trace = self.pending_jobs.pop(job_id, None)
+        journal = self.journals.pop(trace, None)
+        if journal is not None:
+            # Without text, the journal is left for recovery on the next start
+            journal.close(delete=bool(text))
         if text:
             # Copy text to clipboard
             QApplication.clipboard().setText(text)
+            if trace is not None:
+                trace.mark('clipboard_set')
+                stop_time = trace.last('stop_requested')
+                if stop_time is not None:
+                    logger.info(f"Job {job_id}: stop-to-clipboard latency: {time.monotonic() - stop_time:.3f}s")
             self.showMessage("Transcription Complete", 
                            "Text has been copied to clipboard",
                            self.normal_icon)
+        tracer().finish(trace, 'ok' if text else 'no_text')
         
-        # Close the progress window
-        if self.progress_window:
-            self.progress_window.close()
-            self.progress_window = None
+        self.close_progress_window_if_idle()
     
-    def handle_transcription_error(self, error):
+    def handle_transcription_error(self, job_id, error):
         QMessageBox.critical(None, "Transcription Error", error)
+        self.close_progress_window_if_idle()
+        
+    def close_progress_window_if_idle(self):
+        """Close the progress window unless a recording or transcription is still going"""
+        if self.recording or self.pending_jobs or self.finalizing:
+            if self.progress_window and not self.recording and not self.finalizing:
+                self.progress_window.set_status(
+                    f"Transcribing {len(self.pending_jobs)} recording(s)...")
+            return
         if self.progress_window:
             self.progress_window.close()
             self.progress_window = None
@@ -311,6 +523,12 @@ class TrayRecorder(QSystemTrayIcon):
 
     def toggle_debug_window(self):
         """Toggle debug window visibility"""
+        if not self.debug_window:
+            from capture import capture_hub
+            from mic_debug import MicDebugWindow
+            self.debug_window = MicDebugWindow(capture_hub())
+            self.debug_window.set_meter(self.recorder.meter.reader())
+        
         if self.debug_window.isVisible():
             self.debug_window.hide()
             self.debug_action.setText("Show Debug Window")
@@ -322,30 +540,27 @@ def main():
     parser = argparse.ArgumentParser(description="Telly Spelly Application")
     parser.add_argument("--start-recording", action="store_true", help="Signal running instance to start recording.")
     parser.add_argument("--stop-recording", action="store_true", help="Signal running instance to stop recording.")
+    parser.add_argument("--toggle-recording", action="store_true", help="Signal running instance to start or stop recording.")
+    parser.add_argument("--profile-startup", action="store_true", help="Print how long each startup stage and import took.")
     args, unknown = parser.parse_known_args()
 
+    # Only a D-Bus call, no need for a QApplication (telly-spelly-ctl is faster still)
+    for command in ('start_recording', 'stop_recording', 'toggle_recording'):
+        if getattr(args, command):
+            return send_command(command)
+
     app = QApplication(sys.argv)
     app.setApplicationName("Telly Spelly")
     app.setApplicationVersion("1.0")
     app.setOrganizationName("KDE")
     app.setOrganizationDomain("kde.org")
 
-    session_bus = QDBusConnection.sessionBus()
-
-    if args.start_recording or args.stop_recording:
-        shortcuts = GlobalShortcuts(session_bus)
-        if args.start_recording:
-            shortcuts.callExistingInstance("start_recording")
-        elif args.stop_recording:
-            shortcuts.callExistingInstance("stop_recording")
-        QApplication.exit(0)
-        return
-    
 
     try:
-        loading_window = LoadingWindow()
-        loading_window.show()
-        app.processEvents()
+        with profiler.stage("loading window"):
+            loading_window = LoadingWindow()
+            loading_window.show()
+            app.processEvents()
         loading_window.set_status("Checking system requirements...")
         app.processEvents()
 
@@ -364,7 +579,7 @@ def main():
         
         app.setQuitOnLastWindowClosed(False)
         
-        QTimer.singleShot(100, lambda: initialize_tray(tray, loading_window, app))
+        QTimer.singleShot(0, lambda: initialize_tray(tray, loading_window, app))
         
         exit_code = app.exec()
         
@@ -375,31 +590,73 @@ def main():
         QMessageBox.critical(None, "Error", f"Failed to start application: {str(e)}")
         return 1
 
+def start_audio_engine():
+    """Import the recorder and bring up PortAudio"""
+    import recorder
+    from capture import capture_hub
+    capture_hub().start()
+    
+def import_api_modules():
+    """Import the transcriber, and the OpenAI client when it is going to be used"""
+    import transcriber
+    if Settings().get('openai_api_key', None):
+        import openai
+        # httpx only loads its transport once the first client is built
+        import httpcore
+        
+def wait_for(future, app):
+    """Keep the loading window painting until a background stage is done"""
+    while not wait([future], timeout=0.02).done:
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 20)
+    return future.result()
+
 def initialize_tray(tray, loading_window, app):
     try:
+        # These don't depend on each other or on the GUI, so they run on
+        # worker threads while the GUI thread sets up the tray. Most of
+        # their time is import I/O and PortAudio probing the sound cards.
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup')
+        audio_engine = pool.submit(profiler.run, "audio engine", start_audio_engine)
+        api_modules = pool.submit(profiler.run, "API client modules", import_api_modules)
+        pool.shutdown(wait=False)
+        
         # Initialize basic tray setup
         loading_window.set_status("Initializing application...")
         app.processEvents()
-        tray.initialize()
+        with profiler.stage("tray icons and menu"):
+            tray.initialize()
         
         # Initialize recorder
         loading_window.set_status("Initializing audio system...")
         app.processEvents()
-        tray.recorder = AudioRecorder()
+        wait_for(audio_engine, app)
+        with profiler.stage("recorder"):
+            from recorder import AudioRecorder
+            tray.recorder = AudioRecorder()
+            tray.recorder.start_standby()
+            tray.device_watcher = DeviceWatcher()
+            tray.device_watcher.changed.connect(tray.handle_devices_changed)
         
         # Initialize transcriber
         loading_window.set_status("Loading Whisper model...")
         app.processEvents()
-        tray.transcriber = WhisperTranscriber()
+        wait_for(api_modules, app)
+        with profiler.stage("transcriber"):
+            from transcriber import WhisperTranscriber
+            tray.transcriber = WhisperTranscriber()
         
         # Connect signals
         loading_window.set_status("Setting up signal handlers...")
         app.processEvents()
-        tray.recorder.volume_updated.connect(tray.update_volume_meter)
-        tray.recorder.recording_finished.connect(tray.handle_recording_finished)
+        tray.recorder.audio_ready.connect(tray.handle_recording_finished)
+        tray.recorder.segment_ready.connect(tray.handle_segment_ready)
         tray.recorder.recording_error.connect(tray.handle_recording_error)
+        tray.recorder.finalize_progress.connect(tray.handle_finalize_progress)
+        tray.recorder.finalized.connect(tray.handle_finalized)
         
+        tray.recorder.recording_started.connect(tray.transcriber.prewarm)
         tray.transcriber.transcription_progress.connect(tray.update_processing_status)
+        tray.transcriber.transcription_partial.connect(tray.handle_transcription_partial)
         tray.transcriber.transcription_finished.connect(tray.handle_transcription_finished)
         tray.transcriber.transcription_error.connect(tray.handle_transcription_error)
         
@@ -410,6 +667,17 @@ def initialize_tray(tray, loading_window, app):
         
         # Signal completion
         tray.initialization_complete.emit()
+        logger.info(f"Started in {(time.perf_counter() - STARTED) * 1000:.0f} ms")
+        if profiler.enabled:
+            profiler.report()
+        
+        # The resampling filter design is only needed for devices that can't
+        # capture at 16kHz, load it now rather than on the first recording
+        threading.Thread(target=importlib.import_module, args=('scipy.signal',),
+                         name='prewarm', daemon=True).start()
+        
+        # Recordings cut short by a crash, once everything is connected
+        tray.recover_recordings()
         
     except Exception as e:
         logger.error(f"Initialization failed: {e}")
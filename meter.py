@@ -0,0 +1,76 @@
+import numpy as np
+
+class LevelMeter:
+    """Lock-free level metering fed from the audio callback.
+
+    The callback only publishes each block: a copy into a preallocated ring
+    followed by advancing the published-sample counter, which no other
+    thread writes. Readers compute RMS and peak from the ring at their own
+    refresh rate, so the work happens once per display frame instead of
+    once per audio block, and nobody ever waits on the callback.
+    """
+
+    def __init__(self, capacity=1 << 15):
+        self.capacity = capacity
+        self._ring = np.zeros(capacity, dtype=np.int16)
+        self.published = 0
+
+    def publish(self, samples):
+        """Add a block of int16 samples; call from the producer thread only"""
+        count = len(samples)
+        if count > self.capacity // 2:
+            samples = samples[-(self.capacity // 2):]
+        size = len(samples)
+        # Skipped samples still count, so the counter keeps matching the ring
+        start = (self.published + count - size) % self.capacity
+        end = start + size
+        if end <= self.capacity:
+            self._ring[start:end] = samples
+        else:
+            first = self.capacity - start
+            self._ring[start:] = samples[:first]
+            self._ring[:size - first] = samples[first:]
+        # Publish only after the samples are in place
+        self.published += count
+
+    def latest(self, since):
+        """Return (samples published after counter value `since`, new counter value).
+
+        At most half the ring is returned, the half the producer is not
+        about to overwrite.
+        """
+        published = self.published
+        count = min(published - since, self.capacity // 2)
+        if count <= 0:
+            return self._ring[:0], published
+        end = published % self.capacity
+        start = (published - count) % self.capacity
+        if start < end:
+            return self._ring[start:end].copy(), published
+        return np.concatenate((self._ring[start:], self._ring[:end])), published
+
+    def reader(self):
+        return MeterReader(self)
+
+class MeterReader:
+    """One consumer's view of a LevelMeter, with its own read position"""
+
+    def __init__(self, meter):
+        self.meter = meter
+        self.position = meter.published
+        self.rms = 0.0
+        self.peak = 0.0
+
+    def level(self):
+        """Return (rms, peak) in 0-1 of the samples since the previous call"""
+        samples, self.position = self.meter.latest(self.position)
+        if len(samples):
+            values = samples.astype(np.float32)
+            self.rms = float(np.sqrt(np.mean(values * values))) / 32768.0
+            self.peak = float(np.max(np.abs(values))) / 32768.0
+        return self.rms, self.peak
+
+    def reset(self):
+        self.position = self.meter.published
+        self.rms = 0.0
+        self.peak = 0.0
@@ -1,49 +1,144 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel
-from PyQt6.QtCore import Qt
-import numpy as np
+import logging
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPlainTextEdit,
+                             QPushButton, QFileDialog, QMessageBox)
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QFontDatabase
+from capture_health import export_csv, export_json
+
+logger = logging.getLogger(__name__)
 
 class MicDebugWindow(QWidget):
-    def __init__(self):
+    """Input levels and capture health (xruns, callback timing, latency) per device"""
+
+    def __init__(self, hub):
         super().__init__()
+        self.hub = hub
+        self.meter_reader = None
         self.setWindowTitle("Microphone Debug")
-        self.setMinimumSize(300, 150)
-        
+        self.setMinimumSize(520, 480)
+
         layout = QVBoxLayout()
-        
+
         # Current value display
         self.value_label = QLabel("Current Value: 0")
         self.value_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.value_label)
-        
+
         # Peak value display
         self.peak_label = QLabel("Peak Value: 0")
         self.peak_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.peak_label)
-        
+
         # Min/Max display
         self.minmax_label = QLabel("Min/Max: 0/0")
         self.minmax_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.minmax_label)
-        
+
+        # Capture statistics of every device opened so far
+        self.health_text = QPlainTextEdit()
+        self.health_text.setReadOnly(True)
+        self.health_text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.health_text)
+
+        buttons = QHBoxLayout()
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.reset)
+        buttons.addWidget(self.reset_button)
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.export)
+        buttons.addWidget(self.export_button)
+        layout.addLayout(buttons)
+
         self.setLayout(layout)
-        
+
         # Keep track of values
         self.min_value = float('inf')
         self.max_value = float('-inf')
         self.peak_value = 0
-        
+
+        # Only refreshed while shown
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_meter(self, reader):
+        """Poll input levels from a MeterReader"""
+        self.meter_reader = reader
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        if self.meter_reader is not None:
+            self.update_values(self.meter_reader.level()[0])
+        self.health_text.setPlainText("\n\n".join(
+            self.format_health(health.snapshot()) for health in self.hub.health())
+            or "No capture stream has been opened yet")
+
     def update_values(self, value):
         if value is None:
             return
-            
+
         # Update min/max
         self.min_value = min(self.min_value, value)
         self.max_value = max(self.max_value, value)
-        
+
         # Update peak with decay
         self.peak_value = max(value, self.peak_value * 0.95)
-        
+
         # Update labels
         self.value_label.setText(f"Current Value: {value:.6f}")
         self.peak_label.setText(f"Peak Value: {self.peak_value:.6f}")
-        self.minmax_label.setText(f"Min/Max: {self.min_value:.6f}/{self.max_value:.6f}") 
\ No newline at end of file
+        self.minmax_label.setText(f"Min/Max: {self.min_value:.6f}/{self.max_value:.6f}")
+
+    @staticmethod
+    def format_health(snapshot):
+        def ms(value):
+            return "-" if value is None else f"{value:.2f} ms"
+        lines = [
+            f"{snapshot['device']} (since {snapshot['since']}, opened {snapshot['streams_opened']}x)",
+            f"  rate {snapshot['rate']} Hz, block {ms(snapshot['block_ms'])}, "
+            f"reported input latency {ms(snapshot['input_latency_ms'])}",
+            f"  callbacks {snapshot['callbacks']}, input overflows {snapshot['input_overflows']}, "
+            f"input underflows {snapshot['input_underflows']}",
+        ]
+        for name, title in (('callback_time', 'Callback time'), ('jitter', 'Callback jitter')):
+            histogram = snapshot[name]
+            lines.append(f"  {title}: p50 {ms(histogram['p50_ms'])}, p99 {ms(histogram['p99_ms'])}, "
+                         f"max {ms(histogram['max_ms'] if histogram['count'] else None)}")
+            largest = max(histogram['buckets_ms'].values()) or 1
+            for bucket, count in histogram['buckets_ms'].items():
+                bar = "#" * round(30 * count / largest)
+                lines.append(f"    {bucket:>8} ms {count:>8} {bar}")
+        return "\n".join(lines)
+
+    def reset(self):
+        for health in self.hub.health():
+            health.reset()
+        self.min_value = float('inf')
+        self.max_value = float('-inf')
+        self.peak_value = 0
+        self.refresh()
+
+    def export(self):
+        path, selected = QFileDialog.getSaveFileName(
+            self, "Export Capture Statistics", "capture-health.json",
+            "JSON (*.json);;CSV (*.csv)")
+        if not path:
+            return
+        snapshots = [health.snapshot() for health in self.hub.health()]
+        try:
+            if path.endswith('.csv') or (selected.startswith('CSV') and not path.endswith('.json')):
+                export_csv(snapshots, path)
+            else:
+                export_json(snapshots, path)
+            logger.info(f"Exported capture statistics to {path}")
+        except OSError as e:
+            logger.error(f"Could not export capture statistics: {e}")
+            QMessageBox.warning(self, "Export Failed", f"Could not export capture statistics: {e}")
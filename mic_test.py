@@ -1,8 +1,9 @@
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QComboBox, 
                            QPushButton, QLabel)
 from PyQt6.QtCore import Qt, QTimer
-import pyaudio
 from volume_meter import VolumeMeter
+from capture import capture_hub
+from meter import LevelMeter
 import numpy as np
 import logging
 
@@ -14,9 +15,11 @@ class MicTestDialog(QDialog):
         self.setWindowTitle("Microphone Test")
         self.setFixedSize(400, 200)
         
-        # Initialize PyAudio
-        self.audio = pyaudio.PyAudio()
+        # Shares the process-wide audio engine instead of starting another one
+        self.hub = capture_hub()
         self.stream = None
+        self.meter = LevelMeter()
+        self.meter_reader = self.meter.reader()
         self.is_testing = False
         
         self.init_ui()
@@ -59,12 +62,10 @@ class MicTestDialog(QDialog):
         
     def populate_mic_list(self):
         self.mic_combo.clear()
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
-            if device_info.get('maxInputChannels') > 0:  # If it's an input device
-                name = device_info.get('name')
-                self.mic_combo.addItem(name, device_info)
-                logger.info(f"Found input device: {name}")
+        for device_info in self.hub.input_devices():
+            name = device_info.get('name')
+            self.mic_combo.addItem(name, device_info)
+            logger.info(f"Found input device: {name}")
                 
     def toggle_test(self):
         if not self.is_testing:
@@ -78,17 +79,14 @@ class MicTestDialog(QDialog):
             if not device_info:
                 raise ValueError("No microphone selected")
                 
-            self.stream = self.audio.open(
-                format=pyaudio.paFloat32,
-                channels=1,
-                rate=44100,
-                input=True,
-                input_device_index=device_info['index'],
-                frames_per_buffer=1024,
-                stream_callback=self._audio_callback
-            )
-            
-            self.stream.start_stream()
+            # The listed index may be from the device cache, the name is what counts
+            device_info = self.hub.resolve_device(device_info['name'])
+            if not device_info:
+                raise ValueError("Microphone is not connected")
+                
+            # Joins the device's stream if the recorder already has it open
+            self.meter_reader.reset()
+            self.stream = self.hub.subscribe(device_info['index'], self._audio_callback)
             self.is_testing = True
             self.test_button.setText("Stop Test")
             self.update_timer.start()
@@ -101,7 +99,6 @@ class MicTestDialog(QDialog):
             
     def stop_test(self):
         if self.stream:
-            self.stream.stop_stream()
             self.stream.close()
             self.stream = None
             
@@ -113,19 +110,16 @@ class MicTestDialog(QDialog):
         self.level_label.setText("Level: -∞ dB")
         logger.info("Stopped microphone test")
         
-    def _audio_callback(self, in_data, frame_count, time_info, status):
-        if status:
-            logger.warning(f"Audio callback status: {status}")
-        return (in_data, pyaudio.paContinue)
+    def _audio_callback(self, samples, now):
+        self.meter.publish(samples)
         
     def update_level(self):
         if not self.stream or not self.is_testing:
             return
             
         try:
-            data = self.stream.read(1024, exception_on_overflow=False)
-            audio_data = np.frombuffer(data, dtype=np.float32)
-            rms = np.sqrt(np.mean(np.square(audio_data)))
+            # Never blocks: only what arrived since the last frame is looked at
+            rms, _ = self.meter_reader.level()
             
             # Convert to dB
             if rms > 0:
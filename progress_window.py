@@ -1,10 +1,11 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QProgressBar, 
                             QApplication, QPushButton, QHBoxLayout)
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer
 from volume_meter import VolumeMeter
 
 class ProgressWindow(QWidget):
     stop_clicked = pyqtSignal()  # Signal emitted when stop button is clicked
+    cancel_clicked = pyqtSignal()  # Discard the recordings still being encoded
 
     def __init__(self, title="Recording"):
         super().__init__()
@@ -25,15 +26,33 @@ class ProgressWindow(QWidget):
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.status_label)
         
-        # Create volume meter
+        # Live text in realtime mode, hidden until the first words arrive
+        self.partial_label = QLabel()
+        self.partial_label.setWordWrap(True)
+        self.partial_label.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignBottom)
+        self.partial_label.setFixedHeight(70)
+        self.partial_label.hide()
+        layout.addWidget(self.partial_label)
+        
+        # Create volume meter, polled from the recorder's level meter
         self.volume_meter = VolumeMeter()
         layout.addWidget(self.volume_meter)
+        self.meter_reader = None
+        self.meter_timer = QTimer(self)
+        self.meter_timer.setInterval(33)  # ~30fps
+        self.meter_timer.timeout.connect(self.poll_meter)
         
         # Add stop button
         self.stop_button = QPushButton("Stop Recording")
         self.stop_button.clicked.connect(self.stop_clicked.emit)
         layout.addWidget(self.stop_button)
         
+        # Shown while stopped recordings are being encoded
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_clicked.emit)
+        self.cancel_button.hide()
+        layout.addWidget(self.cancel_button)
+        
         # Set window size
         self.setFixedSize(350, 150)
         
@@ -55,19 +74,59 @@ class ProgressWindow(QWidget):
     
     def update_volume(self, value):
         self.volume_meter.set_value(value)
+        
+    def set_meter(self, reader):
+        """Poll levels from a MeterReader while in recording mode"""
+        self.meter_reader = reader
+        if not self.processing:
+            self.meter_timer.start()
+            
+    def poll_meter(self):
+        rms, _ = self.meter_reader.level()
+        self.update_volume(rms)
+        
+    def set_partial_text(self, text):
+        """Show the live transcript, keeping its most recent words in view"""
+        if len(text) > 200:
+            text = "…" + text[-200:].split(" ", 1)[-1]
+        self.partial_label.setText(text)
+        if self.partial_label.isHidden():
+            self.partial_label.show()
+            self.setFixedHeight(self.height() + self.partial_label.height())
     
+    def set_finalizing(self, active):
+        """Offer to cancel while a recording is being encoded"""
+        self.cancel_button.setVisible(active)
+        if self.processing:
+            self.setFixedHeight(self._processing_height())
+            
+    def _processing_height(self):
+        height = 80
+        if not self.partial_label.isHidden():
+            height += self.partial_label.height()
+        if not self.cancel_button.isHidden():
+            height += self.cancel_button.sizeHint().height() + 6
+        return height
+        
     def set_processing_mode(self):
         """Switch UI to processing mode"""
         self.processing = True
+        self.meter_timer.stop()
         self.volume_meter.hide()
         self.stop_button.hide()
         self.status_label.setText("Processing audio with Whisper...")
-        self.setFixedHeight(80)
+        self.setFixedHeight(self._processing_height())
     
     def set_recording_mode(self):
         """Switch back to recording mode"""
         self.processing = False
+        if self.meter_reader:
+            self.meter_reader.reset()
+            self.meter_timer.start()
         self.volume_meter.show()
         self.stop_button.show()
+        self.cancel_button.hide()
         self.status_label.setText("Recording...")
+        self.partial_label.clear()
+        self.partial_label.hide()
         self.setFixedHeight(150) 
\ No newline at end of file
@@ -0,0 +1,211 @@
+import base64
+import json
+import logging
+import queue
+import threading
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+from websockets.sync.client import connect
+from settings import Settings
+from resampler import StreamingResampler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REALTIME_URL = "wss://api.openai.com/v1/realtime"
+
+# Sample rate the realtime API expects for pcm16 input
+REALTIME_RATE = 24000
+
+def realtime_url(settings):
+    """Return the WebSocket endpoint, derived from the API base URL when one is set"""
+    url = settings.get('realtime_url', '')
+    if url:
+        return url
+    base_url = settings.get('api_base_url', '')
+    if not base_url:
+        return DEFAULT_REALTIME_URL
+    if base_url.startswith('https://'):
+        base_url = 'wss://' + base_url[len('https://'):]
+    elif base_url.startswith('http://'):
+        base_url = 'ws://' + base_url[len('http://'):]
+    return base_url.rstrip('/') + '/realtime'
+
+class RealtimeSession(QObject):
+    """Streams a recording to the realtime transcription API while it is captured.
+
+    `feed` is called from the audio callback and only queues the samples;
+    a sender thread resamples them to 24kHz and sends them in ~100ms
+    messages, while a receiver thread collects transcript deltas per
+    committed item (the server cuts items at pauses) and reports the text
+    so far. `end_of_audio` commits what is left; once every item is
+    complete the joined text is reported with `finished`.
+
+    The server handles events in order, so the commit is followed by a
+    repeated session update: once that is acknowledged, every item of the
+    recording has been committed, whether by the server's cuts or by us.
+    """
+    partial = pyqtSignal(int, str)  # job id, text so far
+    finished = pyqtSignal(int, str)  # job id, final text
+    failed = pyqtSignal(int, str)  # job id, message
+
+    def __init__(self, job_id, api_key):
+        super().__init__()
+        self.job_id = job_id
+        self.api_key = api_key
+        settings = Settings()
+        self.url = realtime_url(settings)
+        self.model = settings.get('model', 'whisper-1')
+        self.language = settings.get('language', '')
+        try:
+            self.timeout = float(settings.get('realtime_timeout', 10))
+        except (ValueError, TypeError):
+            self.timeout = 10.0
+        # Recording to fall back on if the session fails
+        self.audio = None
+        self.error = None
+        self.trace = None  # Trace of the recording being streamed
+        self._samples = queue.Queue()
+        self._resampler = StreamingResampler(16000, REALTIME_RATE)
+        self._ws = None
+        self._lock = threading.Lock()
+        self._order = []  # Item ids in the order the server committed them
+        self._texts = {}
+        self._completed = set()
+        self._commit_sent = False
+        self._updates_acknowledged = 0  # The session update at the start, then the one after the commit
+        self._done = threading.Event()
+        self._closed = False
+
+    def start(self):
+        threading.Thread(target=self._send_loop, daemon=True).start()
+
+    def feed(self, samples):
+        """Queue a block of 16kHz int16 samples; cheap enough for the audio callback"""
+        self._samples.put(samples)
+
+    def end_of_audio(self):
+        self._samples.put(None)
+
+    def close(self):
+        self._closed = True
+        self._done.set()
+        self._samples.put(None)
+        if self._ws is not None:
+            self._ws.close()
+
+    def _send(self, event):
+        self._ws.send(json.dumps(event))
+
+    def _send_loop(self):
+        try:
+            self._ws = connect(self.url + '?intent=transcription', open_timeout=self.timeout,
+                               additional_headers={'Authorization': f'Bearer {self.api_key}',
+                                                   'OpenAI-Beta': 'realtime=v1'})
+            transcription = {'model': self.model}
+            if self.language and self.language != 'auto':
+                transcription['language'] = self.language
+            update = {'type': 'transcription_session.update',
+                      'session': {'input_audio_format': 'pcm16',
+                                  'input_audio_transcription': transcription,
+                                  'turn_detection': {'type': 'server_vad', 'silence_duration_ms': 500}}}
+            self._send(update)
+            threading.Thread(target=self._receive_loop, daemon=True).start()
+            logger.info(f"Realtime session {self.job_id} connected to {self.url}")
+
+            pending = []
+            ended = False
+            while not ended:
+                # Send whatever piled up while the last message went out
+                blocks = [self._samples.get()]
+                while True:
+                    try:
+                        blocks.append(self._samples.get_nowait())
+                    except queue.Empty:
+                        break
+                for block in blocks:
+                    if block is None:
+                        ended = True
+                        pending.append(self._resampler.flush())
+                        break
+                    pending.append(self._resampler.process(block))
+                pending_size = sum(len(p) for p in pending)
+                if self._closed:
+                    return
+                if pending_size >= REALTIME_RATE // 10 or ended:
+                    data = np.concatenate(pending).astype('<i2').tobytes() if pending else b''
+                    pending = []
+                    if data:
+                        self._send({'type': 'input_audio_buffer.append',
+                                    'audio': base64.b64encode(data).decode('ascii')})
+
+            with self._lock:
+                self._commit_sent = True
+            self._send({'type': 'input_audio_buffer.commit'})
+            # Answered only after everything before it, see the class docstring
+            self._send(update)
+            if not self._done.wait(self.timeout):
+                self._fail("Realtime transcription timed out")
+        except Exception as e:
+            if not self._closed:
+                self._fail(f"Realtime transcription failed: {e}")
+
+    def _receive_loop(self):
+        try:
+            for message in self._ws:
+                self._handle(json.loads(message))
+                if self._done.is_set():
+                    return
+            error = "closed by the server"
+        except Exception as e:
+            error = str(e)
+        if not self._closed:
+            self._fail(f"Realtime connection lost: {error}")
+
+    def _handle(self, event):
+        kind = event.get('type', '')
+        item_id = event.get('item_id')
+        with self._lock:
+            if kind == 'input_audio_buffer.committed':
+                if item_id not in self._texts:
+                    self._order.append(item_id)
+                    self._texts[item_id] = ""
+            elif kind == 'transcription_session.updated':
+                self._updates_acknowledged += 1
+            elif kind == 'conversation.item.input_audio_transcription.delta':
+                if item_id not in self._texts:
+                    self._order.append(item_id)
+                    self._texts[item_id] = ""
+                self._texts[item_id] += event.get('delta', '')
+            elif kind == 'conversation.item.input_audio_transcription.completed':
+                if item_id not in self._texts:
+                    self._order.append(item_id)
+                self._texts[item_id] = event.get('transcript', '')
+                self._completed.add(item_id)
+            elif kind == 'error':
+                error = event.get('error', {})
+                if self._commit_sent and 'commit_empty' in (error.get('code') or ''):
+                    # Nothing was left after the server's last cut
+                    pass
+                else:
+                    self._fail(f"Realtime transcription error: {error.get('message', error)}")
+                    return
+            else:
+                return
+            text = self._text()
+            done = self._updates_acknowledged >= 2 and all(i in self._completed for i in self._order)
+
+        if done:
+            self._done.set()
+            self.finished.emit(self.job_id, text)
+        elif text:
+            self.partial.emit(self.job_id, text)
+
+    def _text(self):
+        return " ".join(self._texts[i].strip() for i in self._order if self._texts[i].strip())
+
+    def _fail(self, message):
+        if self._done.is_set():
+            return
+        self._done.set()
+        logger.error(f"Realtime session {self.job_id}: {message}")
+        self.failed.emit(self.job_id, message)
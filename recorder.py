@@ -1,202 +1,592 @@
-import pyaudio
-import wave
-from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
 import tempfile
 import os
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from settings import Settings
-from scipy import signal
+from audio_buffer import AudioBuffer, RingBuffer
+from journal import JournalBuffer
+from meter import LevelMeter
+from resampler import StreamingResampler
+from segmenter import PauseSegmenter
+from vad import VoiceActivityDetector
+from encoder import EncodedAudio, ChunkedAudio, select_encoder, encoder_for_file
+from transcript_cache import pcm_digest
+from capture import capture_hub
+from devices import DeviceInfo
+from tracing import Trace
+import io
 from typing import List
 
 logger = logging.getLogger(__name__)
 
-# Define a type for device info dictionaries
-from typing import TypedDict
+# Whisper expects 16kHz mono audio
+TARGET_RATE = 16000
 
-class DeviceInfo(TypedDict, total=False):
-    index: int
-    name: str
-    maxInputChannels: int
-    defaultSampleRate: float
-    hostApi: int
-    maxOutputChannels: int
+class SegmentCursor:
+    """Where the next segment of a pipeline recording starts.
+    
+    Shared by all finalize tasks of one recording and only moved by the
+    finalize worker, which runs them in order.
+    """
+    
+    def __init__(self):
+        self.start = 0
+        self.index = 0
+        
+class FinalizeTask:
+    """Audio waiting to be encoded: a stopped recording, or segments cut from one still going"""
+    
+    def __init__(self, buffer, segments=None, trace=None, cuts=(), last=True):
+        self.buffer = buffer
+        # In pipeline mode: the recording's SegmentCursor, and the ends of
+        # the segments to emit before (if last) the rest of the buffer
+        self.segments = segments
+        self.cuts = cuts
+        self.last = last
+        # Also tells the recording's segments apart from other recordings'
+        self.trace = trace or Trace()
+        self.cancelled = False
+        self.error = None
+        # A finished JournalBuffer, kept until the transcript has been delivered
+        self.journal = None
+        
+class FinalizeWorker(QThread):
+    """Long-lived worker that encodes stopped recordings, in order, off the GUI thread"""
+    
+    def __init__(self, recorder, tasks):
+        super().__init__()
+        self.recorder = recorder
+        self.tasks = tasks
+        
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:  # Shutdown sentinel
+                break
+            self.recorder._finalize(task)
 
 class AudioRecorder(QObject):
-    recording_finished = pyqtSignal(str)  # Emits path to recorded file
+    audio_ready = pyqtSignal(object)  # Emits the encoded recording as EncodedAudio
+    recording_finished = pyqtSignal(str)  # Emits path when recordings are kept on disk
     recording_error = pyqtSignal(str)
-    volume_updated = pyqtSignal(float)
+    recording_started = pyqtSignal()  # Emitted as soon as a recording is requested
+    segment_ready = pyqtSignal(object, int, object, bool)  # recording's Trace, index, EncodedAudio, is last
+    _segments_cut = pyqtSignal()  # Hands cut positions from the audio thread to the GUI thread
+    finalize_progress = pyqtSignal(int, int)  # chunks encoded, total
+    finalized = pyqtSignal(object)  # FinalizeTask, after its audio_ready or last segment_ready
     
     def __init__(self):
         super().__init__()
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
-        self.frames = []
+        # Device streams are shared with everything else that listens
+        self.hub = capture_hub()
+        self.stream = None  # Our subscription to the device's capture stream
+        self.buffer = AudioBuffer()
+        # Widgets poll levels from here at their own frame rate
+        self.meter = LevelMeter()
+        self.resampler = None
+        # Pipeline mode: cut the stream at pauses and emit finished segments
+        self.segmenter = None
+        self._pending_cuts = []
+        self._segments = None
+        self._segments_cut.connect(self._queue_segments)
+        # Realtime mode: session that every captured block is streamed to
+        self.realtime_session = None
+        # Standby mode: the stream stays open and keeps the last moments of
+        # audio, which are spliced in front of the next recording
+        self.preroll = None
+        self._standby_key = None
+        self._splice_preroll = False
+        # Guards the switch between standby and recording against the callback
+        self._lock = threading.Lock()
+        self._start_time = None
+        self.last_start_latency = None
+        # Device overflows and underflows seen before this recording started
+        self._xruns_at_start = 0
+        # Session trace of the current recording
+        self.trace = Trace()
+        # Stopped recordings are encoded by the worker so the GUI never waits on it
+        self._finalize_tasks = queue.Queue()
+        self._finalizing = []
+        self.finalizer = FinalizeWorker(self, self._finalize_tasks)
+        self.finalizer.start()
         self.is_recording = False
         self.is_testing = False
         self.test_stream = None
+        self.test_meter = None
+        self.test_reader = None
         self.current_device_info = None
         # Keep a reference to self to prevent premature deletion
         self._instance = self
         self.get_device()
 
     def get_device(self):
-            # Get selected mic index from settings
+            # The selected mic is stored by name; the index is only a fallback
+            # for settings saved before names were
             settings = Settings()
-            mic_index = settings.get('mic_index')
-            
-            try:
-                mic_index = int(mic_index) if mic_index is not None else None
-            except (ValueError, TypeError):
-                mic_index = None
+            device_info = self.hub.resolve_device(settings.get('mic_name', ''), settings.get('mic_index'))
             
-            if mic_index is not None:
-                device_info = self.audio.get_device_info_by_index(mic_index)
+            if device_info is not None:
                 logger.info(f"Using selected input device: {device_info['name']}")
             else:
-                device_info = self.audio.get_default_input_device_info()
+                device_info = self.hub.device_info()
                 logger.info(f"Using default input device: {device_info['name']}")
-                mic_index = device_info['index']
             
             # Store device info for later use
             self.current_device_info = device_info
-            
-            # Get supported sample rate from device
-            sample_rate = int(device_info['defaultSampleRate'])
-            logger.info(f"Using sample rate: {sample_rate}")
     
     def get_device_list(self) -> List[DeviceInfo]:
-        device_list = []
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
-            if device_info.get('maxInputChannels') > 0:
-                device_list.append(DeviceInfo(device_info))  # device_info is already a dictionary
-        return device_list
-        
-    def start_recording(self):
+        return self.hub.input_devices()
+        
+    def start_recording(self, trace=None, realtime_session=None):
+        """Start capturing; blocks also go to `realtime_session` once the stream is running"""
         if self.is_recording:
             return
             
+        self._start_time = time.monotonic()
+        self.trace = trace or Trace()
+        # Lets listeners (e.g. connection pre-warming) overlap with stream setup
+        self.recording_started.emit()
+        
         try:
-            self.frames = []
-            self.is_recording = True
+            self.buffer = self._create_buffer()
+            # A standby stream is already open on the right device
+            standby = self.stream is not None and self.preroll is not None
+            if not standby:
+                self.get_device()
+                # Blocks are ignored until is_recording is set below
+                self._open_stream()
+            self.trace.mark('stream_open')
+            self._xruns_at_start = self.stream.health.xruns()
             
-            self.get_device()
+            # Captured blocks are converted to 16kHz as they arrive; devices
+            # that capture at 16kHz themselves pass straight through
+            resampler = StreamingResampler(self.stream.rate, TARGET_RATE)
             
-            self.stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=int(self.current_device_info['defaultSampleRate']),
-                input=True,
-                input_device_index=self.current_device_info['index'],
-                frames_per_buffer=1024,
-                stream_callback=self._callback
-            )
+            # Streaming already transcribes while recording, segments would be redundant
+            if Settings().get('pipeline_mode', False) and realtime_session is None:
+                self.segmenter = PauseSegmenter(TARGET_RATE)
+                self._pending_cuts = []
+                self._segments = SegmentCursor()
+            else:
+                self.segmenter = None
             
-            self.stream.start_stream()
-            logger.info("Recording started")
+            with self._lock:
+                self.resampler = resampler
+                # The callback puts the pre-roll in front of its next block
+                self._splice_preroll = standby
+                # Only attached once nothing can fail, a failed start leaves no session behind
+                self.realtime_session = realtime_session
+                self.is_recording = True
+            logger.info(f"Recording started{' from standby' if standby else ''} at {self.stream.rate} Hz")
             
         except Exception as e:
             logger.error(f"Failed to start recording: {e}")
             self.recording_error.emit(f"Failed to start recording: {e}")
             self.is_recording = False
+            if self.preroll is None:
+                self._close_stream()
+            
+    def _create_buffer(self):
+        """Return an empty buffer for the next recording, on disk in journal mode"""
+        if Settings().get('journal_mode', False):
+            try:
+                return JournalBuffer()
+            except OSError as e:
+                logger.error(f"Could not create the recording journal, recording to memory: {e}")
+        return AudioBuffer()
+        
+    def _open_stream(self):
+        # Instant if another subscriber (e.g. a mic test) already has the device open
+        self.stream = self.hub.subscribe(self.current_device_info['index'], self._callback)
         
-    def _callback(self, in_data, frame_count, time_info, status):
-        if status:
-            logger.warning(f"Recording status: {status}")
+    def _close_stream(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        
+    def start_standby(self):
+        """Open (or reopen) the standby stream if pre-roll mode is enabled, or close it.
+        
+        In standby the input stream stays open between recordings and keeps
+        the last `preroll_ms` milliseconds in a ring, so a recording starts
+        without waiting for the device and includes the moment before the
+        hotkey was pressed.
+        """
+        if self.is_recording:
+            return
+        settings = Settings()
+        if not settings.get('preroll_mode', False):
+            self.stop_standby()
+            return
         try:
+            preroll_ms = float(settings.get('preroll_ms', 300))
+        except (ValueError, TypeError):
+            preroll_ms = 300.0
+        key = (settings.get('mic_name', ''), settings.get('mic_index'), preroll_ms)
+        if self.hub.refresh_pending:
+            # Devices changed while the stream was open; closing it lets the engine restart
+            self.stop_standby()
+        if self.preroll is not None and self.stream is not None and key == self._standby_key:
+            return
+        
+        self.stop_standby()
+        try:
+            self.get_device()
+            self._open_stream()
+            self._standby_key = key
+            # Blocks only go to the ring once it exists
+            self.preroll = RingBuffer(max(1, int(self.stream.rate * preroll_ms / 1000)))
+            logger.info(f"Standby stream open with {preroll_ms:.0f} ms pre-roll")
+        except Exception as e:
+            logger.error(f"Failed to open standby stream: {e}")
+            self.preroll = None
+            self._close_stream()
+            
+    def stop_standby(self):
+        if self.preroll is None:
+            return
+        if not self.is_recording:
+            self._close_stream()
+        self.preroll = None
+        logger.info("Standby stream closed")
+        
+    def _log_first_sample(self, now, count):
+        # The oldest sample of the block was captured `count` samples ago
+        latency = now - count / self.stream.rate - self._start_time
+        self._start_time = None
+        # The block's arrival, and the capture time of its oldest sample
+        self.trace.mark('first_block', now)
+        self.trace.mark('first_sample', now - count / self.stream.rate)
+        self.last_start_latency = latency
+        logger.info(f"Hotkey to first sample: {latency * 1000:.0f} ms"
+                    f"{' (pre-roll)' if self.preroll is not None else ''}")
+        
+    def _callback(self, samples, now):
+        # Runs on the audio thread for every captured block
+        with self._lock:
             if self.is_recording:
-                self.frames.append(in_data)
-                # Calculate and emit volume level
-                try:
-                    audio_data = np.frombuffer(in_data, dtype=np.int16)
-                    if len(audio_data) > 0:
-                        # Calculate RMS with protection against zero/negative values
-                        squared = np.abs(audio_data)**2
-                        mean_squared = np.mean(squared) if np.any(squared) else 0
-                        rms = np.sqrt(mean_squared) if mean_squared > 0 else 0
-                        # Normalize to 0-1 range
-                        volume = min(1.0, max(0.0, rms / 32768.0))
-                    else:
-                        volume = 0.0
-                    self.volume_updated.emit(volume)
-                except Exception as e:
-                    logger.warning(f"Error calculating volume: {e}")
-                    self.volume_updated.emit(0.0)
-                return (in_data, pyaudio.paContinue)
-        except RuntimeError:
-            # Handle case where object is being deleted
-            logger.warning("AudioRecorder object is being cleaned up")
-            return (in_data, pyaudio.paComplete)
-        return (in_data, pyaudio.paComplete)
+                self._record_block(samples, now)
+            elif self.preroll is not None:
+                self.preroll.write(samples)
+        
+    def _record_block(self, audio_data, now):
+        if self._splice_preroll:
+            self._splice_preroll = False
+            audio_data = np.concatenate((self.preroll.read(), audio_data))
+        if self._start_time is not None:
+            self._log_first_sample(now, len(audio_data))
+        resampled = self.resampler.process(audio_data)
+        self.buffer.append(resampled)
+        if self.realtime_session is not None:
+            self.realtime_session.feed(resampled)
+        if self.segmenter:
+            cuts = self.segmenter.feed(resampled)
+            if cuts:
+                self._pending_cuts.extend(cuts)
+                self._segments_cut.emit()
+        # Levels are computed by whoever displays them
+        self.meter.publish(resampled)
         
     def stop_recording(self):
+        """Stop capturing and queue the recording for encoding; returns whether it was queued"""
         if not self.is_recording:
-            return
+            return False
             
         logger.info("Stopping recording")
-        self.is_recording = False
+        with self._lock:
+            self.is_recording = False
         
         try:
-            # Stop and close the stream first
-            if self.stream:
-                self.stream.stop_stream()
-                self.stream.close()
-                self.stream = None
+            xruns = self.stream.health.xruns() - self._xruns_at_start
+            if xruns:
+                logger.warning(f"{xruns} capture overflows or underflows during this recording, "
+                               f"audio may have dropped out")
+            
+            # Release the stream first, unless it goes back to standby
+            if self.preroll is None:
+                self._close_stream()
+            
+            # Drain the samples still held in the resampler's filter
+            if self.resampler:
+                with self.trace.span('resample'):
+                    tail = self.resampler.flush()
+                self.buffer.append(tail)
+                self.resampler = None
+                if self.realtime_session is not None:
+                    self.realtime_session.feed(tail)
             
-            # Check if we have any recorded frames
-            if not self.frames:
+            # Let the stream commit right away, before the recording is encoded
+            if self.realtime_session is not None:
+                self.trace.mark('request_sent')
+                self.realtime_session.end_of_audio()
+                self.realtime_session = None
+            
+            # Check if we have any recorded samples
+            if not len(self.buffer):
                 logger.error("No audio data recorded")
                 self.recording_error.emit("No audio was recorded")
-                return
+                self.buffer.clear()
+                return False
             
-            # Process the recording
-            self._process_recording()
+            # Encoding happens on the worker, the next recording may start meanwhile
+            self._queue_finalize()
+            return True
             
         except Exception as e:
             logger.error(f"Error stopping recording: {e}")
             self.recording_error.emit(f"Error stopping recording: {e}")
+            return False
+        finally:
+            # Picks up changes to the pre-roll setting or device, off the hot path
+            self.start_standby()
 
-    def _process_recording(self):
-        """Process and save the recording"""
+    def _queue_finalize(self):
+        segments = None
+        cuts = ()
+        if self.segmenter:
+            # Earlier segments are already queued, only what is left goes with this task
+            segments = self._segments
+            with self._lock:
+                cuts, self._pending_cuts = self._pending_cuts, []
+            self.segmenter = None
+        task = FinalizeTask(self.buffer, segments, self.trace, cuts)
+        self._finalizing.append(task)
+        self._finalize_tasks.put(task)
+        
+    def cancel_finalize(self):
+        """Drop the recordings still being encoded; their finalized task comes back cancelled.
+        
+        Only whole recordings can be cancelled, the last segment of a
+        pipeline recording is always finished.
+        """
+        for task in list(self._finalizing):
+            task.cancelled = True
+        
+    def _finalize(self, task):
+        """Encode a stopped recording and emit it; runs on the finalize worker"""
+        if not task.last:
+            # Segments cut while the recording goes on
+            self._emit_cuts(task)
+            return
+        buffer = task.buffer
+        trace = task.trace
+        started = time.monotonic()
+        trace.mark('finalize_started', started)
         try:
-            temp_file = tempfile.mktemp(suffix='.wav')
-            logger.info("Processing recording...")
-            self.save_audio(temp_file)
-            logger.info(f"Recording processed and saved to: {os.path.abspath(temp_file)}")
-            self.recording_finished.emit(temp_file)
+            if task.segments is not None:
+                self._emit_cuts(task)
+                cursor = task.segments
+                self._emit_segment(buffer, cursor.start, len(buffer), cursor.index, trace, is_last=True)
+            else:
+                logger.info("Processing recording...")
+                audio = self._write_recording(buffer, 0, len(buffer), trace, task)
+                trace.mark('finalized')
+                if not task.cancelled:
+                    self.audio_ready.emit(audio)
+            if task.cancelled:
+                logger.info("Recording discarded while encoding")
+            else:
+                logger.info(f"Recording finalized in {time.monotonic() - started:.2f}s")
         except Exception as e:
             logger.error(f"Failed to process recording: {e}")
-            self.recording_error.emit(f"Failed to process recording: {e}")
+            task.error = f"Failed to process recording: {e}"
+            if isinstance(buffer, JournalBuffer):
+                # Left for recovery on the next start
+                buffer.close(delete=False)
+        finally:
+            if isinstance(buffer, JournalBuffer) and not task.cancelled and task.error is None:
+                # The journal goes once the transcript is delivered, so that
+                # a crash or a failed request until then doesn't lose the recording
+                buffer.finish()
+                task.journal = buffer
+            else:
+                # The encoded audio is the only copy we need from here on
+                buffer.clear()
+            task.buffer = None
+            self._finalizing.remove(task)
+            self.finalized.emit(task)
+            
+    def recover_journal(self, path, trace=None):
+        """Encode and emit a recording that a crash left in its journal"""
+        if self.is_recording:
+            return False
+        logger.info(f"Recovering recording from {path}")
+        self.buffer = JournalBuffer.open(path)
+        self.segmenter = None
+        self.trace = trace or Trace()
+        self._queue_finalize()
+        return True
         
-    def save_audio(self, filename):
-        """Save recorded audio to a WAV file"""
+    def _queue_segments(self):
+        """Hand every segment cut since the last call to the finalize worker"""
+        with self._lock:
+            cuts, self._pending_cuts = self._pending_cuts, []
+        if cuts and self.segmenter:
+            self._finalize_tasks.put(FinalizeTask(self.buffer, self._segments, self.trace,
+                                                  cuts, last=False))
+            
+    def _emit_cuts(self, task):
+        """Encode and emit the segments ending at a task's cuts; runs on the finalize worker"""
+        cursor = task.segments
+        for end in task.cuts:
+            try:
+                self._emit_segment(task.buffer, cursor.start, end, cursor.index, task.trace)
+            except Exception as e:
+                # Its samples go out with the next segment instead
+                logger.error(f"Failed to process segment: {e}")
+                continue
+            cursor.start, cursor.index = end, cursor.index + 1
+            
+    def _emit_segment(self, buffer, start, end, index, trace, is_last=False):
+        """Encode and emit samples [start, end) as segment `index`"""
+        audio = self._write_recording(buffer, start, end, trace)
+        if is_last:
+            trace.mark('finalized')
+        logger.info(f"Segment {index} ready: {(end - start) / TARGET_RATE:.1f}s")
+        self.segment_ready.emit(trace, index, audio, is_last)
+        
+    def _speech_ranges(self, buffer, start, end):
+        """Return the parts of samples [start, end) to upload, without long silences"""
+        settings = Settings()
+        if not settings.get('trim_silence', False):
+            return [(start, end)]
+            
         try:
-            # Convert frames to numpy array
-            audio_data = np.frombuffer(b''.join(self.frames), dtype=np.int16)
+            max_pause = float(settings.get('max_pause', 1.0))
+        except (ValueError, TypeError):
+            max_pause = 1.0
             
-            if self.current_device_info is None:
-                raise ValueError("No device info available")
-                
-            # Get original sample rate from stored device info
-            original_rate = int(self.current_device_info['defaultSampleRate'])
+        vad = VoiceActivityDetector(TARGET_RATE)
+        flags = vad.classify_views(buffer.views(start, end))
+        ranges = vad.speech_ranges(flags, max_pause=max_pause)
+        if not ranges:
+            logger.info("No speech detected, keeping recording untrimmed")
+            return [(start, end)]
             
-            # Resample to 16000Hz if needed
-            if original_rate != 16000:
-                # Calculate resampling ratio
-                ratio = 16000 / original_rate
-                output_length = int(len(audio_data) * ratio)
-                
-                # Resample audio
-                audio_data = signal.resample(audio_data, output_length)
+        # Whatever the last incomplete frame held is dropped as trailing silence
+        ranges = [(start + lo, start + hi) for lo, hi in ranges]
+        kept = sum(hi - lo for lo, hi in ranges)
+        saved = (end - start) - kept
+        logger.info(f"Silence trimming saved {saved / TARGET_RATE:.1f}s "
+                    f"({saved * 2} bytes) of {(end - start) / TARGET_RATE:.1f}s")
+        return ranges
+        
+    def _chunk_bounds(self, buffer, start, end, limit, overlap):
+        """Split samples [start, end) into pieces of at most `limit` samples.
+        
+        Each split goes into the longest pause found in the last quarter of
+        the allowed length. Without any pause there, the split is forced at
+        the limit and the next chunk repeats `overlap` samples so no word is
+        lost at the seam.
+        """
+        vad = VoiceActivityDetector(TARGET_RATE)
+        flags = vad.classify_views(buffer.views(start, end))
+        frame = vad.frame_size
+        
+        bounds = []
+        overlaps = []
+        chunk_start = start
+        chunk_overlap = 0
+        while end - chunk_start > limit:
+            lo = (chunk_start - start + limit * 3 // 4) // frame
+            hi = (chunk_start - start + limit) // frame
+            pause = vad.longest_pause(flags[lo:hi])
+            if pause is not None and pause[1] - pause[0] >= 2:
+                cut = start + (lo + (pause[0] + pause[1]) // 2) * frame
+                next_start = cut
+            else:
+                cut = chunk_start + limit
+                next_start = cut - overlap
+            bounds.append((chunk_start, cut))
+            overlaps.append(chunk_overlap)
+            chunk_overlap = cut - next_start
+            chunk_start = next_start
+        bounds.append((chunk_start, end))
+        overlaps.append(chunk_overlap)
+        return bounds, overlaps
+        
+    def _write_recording(self, buffer, start, end, trace, task=None):
+        """Encode samples [start, end) for upload.
+        
+        Recordings longer than the chunk limit come back as ChunkedAudio so
+        they stay under the API's upload size limit and can be transcribed
+        in parallel; everything else is a single EncodedAudio. The chunks
+        are encoded in parallel, and none is started once `task` has been
+        cancelled (the result is then None).
+        """
+        try:
+            chunk_duration = float(Settings().get('chunk_duration', 300))
+        except (ValueError, TypeError):
+            chunk_duration = 300
+        limit = int(chunk_duration * TARGET_RATE)
+        if end - start <= limit:
+            return self._encode_range(buffer, start, end, trace)
             
-            # Save to WAV file
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(1)
-            wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
-            wf.setframerate(16000)  # Always save at 16000Hz for Whisper
-            wf.writeframes(audio_data.astype(np.int16).tobytes())
-            wf.close()
+        bounds, overlaps = self._chunk_bounds(buffer, start, end, limit, TARGET_RATE)
+        logger.info(f"Splitting {(end - start) / TARGET_RATE:.1f}s recording into {len(bounds)} chunks")
+        done = []
+        
+        def encode(lo, hi):
+            if task is not None and task.cancelled:
+                return None
+            chunk = self._encode_range(buffer, lo, hi, trace)
+            done.append(chunk)
+            self.finalize_progress.emit(len(done), len(bounds))
+            return chunk
+        
+        # ffmpeg runs in its own process, so the chunks really use all cores
+        with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, len(bounds))) as pool:
+            chunks = list(pool.map(encode, *zip(*bounds)))
+        if task is not None and task.cancelled:
+            return None
+        return ChunkedAudio(chunks, [overlap / TARGET_RATE for overlap in overlaps])
+        
+    def _encode_range(self, buffer, start, end, trace):
+        """Encode samples [start, end) for upload and return them as EncodedAudio"""
+        with trace.span('trim'):
+            ranges = self._speech_ranges(buffer, start, end)
+        duration = sum(hi - lo for lo, hi in ranges) / TARGET_RATE
+        encoder = select_encoder(duration)
+        output = io.BytesIO()
+        with trace.span('encode'):
+            self._encode(buffer, output, ranges, encoder)
+        settings = Settings()
+        digest = None
+        if settings.get('cache_transcripts', False):
+            digest = pcm_digest(block for lo, hi in ranges for block in buffer.views(lo, hi))
+        audio = EncodedAudio(output.getvalue(), 'recording' + encoder.suffix, duration, digest)
+        logger.info(f"Encoded {duration:.1f}s as {encoder.name}: {len(audio)} bytes "
+                    f"({100 * len(audio) / max(1, duration * TARGET_RATE * 2):.0f}% of WAV)")
+        
+        # Only write to disk when explicitly asked to, e.g. for debugging
+        if settings.get('keep_recordings', False):
+            with trace.span('file_write'):
+                fd, path = tempfile.mkstemp(prefix='telly-spelly-', suffix=encoder.suffix)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(audio.data)
+            logger.info(f"Recording kept at: {path}")
+            self.recording_finished.emit(path)
+        return audio
+        
+    def _encode(self, buffer, output, ranges, encoder):
+        # The buffer already holds 16kHz samples, resampled while recording
+        blocks = (block for lo, hi in ranges for block in buffer.views(lo, hi))
+        encoder.encode(blocks, output, TARGET_RATE)  # Always save at 16000Hz for Whisper
+        
+    def save_audio(self, filename, start=0, end=None):
+        """Save recorded audio (optionally only samples [start, end)) to a file.
+        
+        The format follows the file extension (.wav, .flac or .ogg).
+        """
+        try:
+            end = len(self.buffer) if end is None else end
+            self._encode(self.buffer, filename, self._speech_ranges(self.buffer, start, end),
+                         encoder_for_file(filename))
             
             # Log the saved file location
             logger.info(f"Recording saved to: {os.path.abspath(filename)}")
@@ -205,25 +595,22 @@ class AudioRecorder(QObject):
             logger.error(f"Failed to save audio file: {e}")
             raise
         
-    def start_mic_test(self, device_index):
+    def start_mic_test(self, device_name):
         """Start microphone test"""
         if self.is_testing or self.is_recording:
             return
             
         try:
-            self.test_stream = self.audio.open(
-                format=pyaudio.paFloat32,
-                channels=1,
-                rate=44100,
-                input=True,
-                input_device_index=device_index,
-                frames_per_buffer=1024,
-                stream_callback=self._test_callback
-            )
-            
-            self.test_stream.start_stream()
+            device_info = self.hub.resolve_device(device_name)
+            if device_info is None:
+                raise ValueError(f"Input device '{device_name}' is not connected")
+            # The level is polled from the meter, nothing reads the stream itself
+            self.test_meter = LevelMeter()
+            self.test_reader = self.test_meter.reader()
+            self.test_stream = self.hub.subscribe(device_info['index'],
+                                                  lambda samples, now: self.test_meter.publish(samples))
             self.is_testing = True
-            logger.info(f"Started mic test on device {device_index}")
+            logger.info(f"Started mic test on {device_name}")
             
         except Exception as e:
             logger.error(f"Failed to start mic test: {e}")
@@ -232,41 +619,23 @@ class AudioRecorder(QObject):
     def stop_mic_test(self):
         """Stop microphone test"""
         if self.test_stream:
-            self.test_stream.stop_stream()
             self.test_stream.close()
             self.test_stream = None
         self.is_testing = False
         
-    def _test_callback(self, in_data, frame_count, time_info, status):
-        """Callback for mic test"""
-        if status:
-            logger.warning(f"Test callback status: {status}")
-        return (in_data, pyaudio.paContinue)
-        
     def get_current_audio_level(self):
         """Get current audio level for meter"""
         if not self.test_stream or not self.is_testing:
             return 0
-            
-        try:
-            data = self.test_stream.read(1024, exception_on_overflow=False)
-            audio_data = np.frombuffer(data, dtype=np.float32)
-            return np.sqrt(np.mean(np.square(audio_data)))
-        except Exception as e:
-            logger.error(f"Error getting audio level: {e}")
-            return 0
+        rms, _ = self.test_reader.level()
+        return rms
 
     def cleanup(self):
         """Cleanup resources"""
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
-        if self.test_stream:
-            self.test_stream.stop_stream()
-            self.test_stream.close()
-            self.test_stream = None
-        if self.audio:
-            self.audio.terminate()
-            self.audio = None
-        self._instance = None 
\ No newline at end of file
+        self.cancel_finalize()
+        self._finalize_tasks.put(None)
+        self.finalizer.wait()
+        self.preroll = None
+        self._close_stream()
+        self.stop_mic_test()
+        self._instance = None
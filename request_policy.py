@@ -0,0 +1,201 @@
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(Exception):
+    """An attempt got no complete answer within its deadline"""
+
+def retryable_errors():
+    """Errors worth another attempt: throttling, server faults, timeouts and network trouble"""
+    # openai is only imported once a request is actually made
+    import openai
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError,
+            DeadlineExceeded)
+
+def offline_errors():
+    """Errors that mean the server could not be reached, or not answer, in time"""
+    import openai
+    # Timeouts are connection errors to openai
+    return (openai.APIConnectionError, DeadlineExceeded)
+
+# Latency samples needed before the hedge delay is taken from the percentile
+MIN_SAMPLES = 20
+
+def _float_setting(settings, key, default):
+    try:
+        return float(settings.get(key, default))
+    except (ValueError, TypeError):
+        return default
+
+class RequestStats:
+    """Counters and recent latencies of transcription requests, shared by all workers"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Seconds of latency per second of audio (at least one) of recent successes
+        self._rates = deque(maxlen=window)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_latency(self, latency, duration):
+        with self._lock:
+            self._rates.append(latency / max(duration, 1.0))
+
+    def percentile(self, fraction):
+        """Return the given percentile of the latency rate, or None without enough samples"""
+        with self._lock:
+            if len(self._rates) < MIN_SAMPLES:
+                return None
+            rates = sorted(self._rates)
+        return rates[min(len(rates) - 1, int(fraction * len(rates)))]
+
+    def summary(self):
+        with self._lock:
+            requests, retries, timeouts = self.requests, self.retries, self.timeouts
+            failures, hedges, hedge_wins = self.failures, self.hedges, self.hedge_wins
+        hedge_rate = f"{100 * hedge_wins / hedges:.0f}%" if hedges else "n/a"
+        return (f"{requests} requests, {retries} retries, {timeouts} timeouts, "
+                f"{failures} failures, {hedges} hedges ({hedge_wins} won, {hedge_rate})")
+
+class RequestPolicy:
+    """Deadlines, retries and optional hedging around one transcription request.
+
+    Every attempt gets a deadline of `request_deadline` seconds plus
+    `request_deadline_factor` seconds per second of audio, counted from
+    the start of the upload to the end of the response; an attempt still
+    running then is cancelled. `send` is told the time left, to cap its
+    own timeouts with, and gets an event that is set once its attempt is
+    no longer wanted, to stop uploading with. Throttling, 5xx
+    responses, timeouts and connection errors are retried up to
+    `request_retries` times with jittered exponential backoff, or after the
+    server's Retry-After. With `hedge_requests` on, a duplicate is sent once
+    an attempt has been outstanding for the 95th percentile of recent
+    latencies; the first answer wins and the other one is cancelled.
+    Errors in `no_retry` fail at once, for callers that have somewhere
+    else to turn.
+    """
+
+    def __init__(self, stats, no_retry=()):
+        settings = Settings()
+        self.stats = stats
+        self.no_retry = no_retry
+        self.base_deadline = _float_setting(settings, 'request_deadline', 15.0)
+        self.deadline_factor = _float_setting(settings, 'request_deadline_factor', 0.5)
+        self.retries = max(0, int(_float_setting(settings, 'request_retries', 3)))
+        self.hedge = settings.get('hedge_requests', False)
+        self.backoff = 0.5
+        self.max_backoff = 8.0
+
+    def deadline(self, duration):
+        return self.base_deadline + self.deadline_factor * duration
+
+    def hedge_delay(self, duration):
+        rate = self.stats.percentile(0.95)
+        if rate is None:
+            # No latency history yet, only hedge requests that are clearly stuck
+            return self.deadline(duration) / 2
+        return rate * max(duration, 1.0)
+
+    def call(self, send, duration):
+        """Return send(time left, cancelled) for audio of `duration` seconds, applying the policy"""
+        import openai
+        retryable = retryable_errors()
+        self.stats.count('requests')
+        deadline = self.deadline(duration)
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(send, duration, deadline)
+            except retryable as e:
+                if isinstance(e, (openai.APITimeoutError, DeadlineExceeded)):
+                    self.stats.count('timeouts')
+                if attempt >= self.retries or isinstance(e, self.no_retry):
+                    self.stats.count('failures')
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                self.stats.count('retries')
+                logger.warning(f"Request failed ({e}), retry {attempt}/{self.retries} in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception:
+                self.stats.count('failures')
+                raise
+
+    def _retry_delay(self, attempt, error):
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                return min(float(response.headers.get('retry-after')), 60.0)
+            except (ValueError, TypeError):
+                pass
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _attempt(self, send, duration, deadline):
+        # httpx only times single reads and writes, so a slow upload or a
+        # trickling response is bounded here, by waiting on the request
+        # thread; attempts that are given up on are cancelled, and stop at
+        # their next chunk of upload or response
+        results = queue.Queue()
+        expires = time.monotonic() + deadline
+        cancels = []
+
+        def start(hedged):
+            cancelled = threading.Event()
+            cancels.append(cancelled)
+            threading.Thread(target=run, args=(hedged, cancelled), daemon=True).start()
+
+        def run(hedged, cancelled):
+            started = time.monotonic()
+            try:
+                result = send(max(0.0, expires - started), cancelled)
+                self.stats.record_latency(time.monotonic() - started, duration)
+                results.put((hedged, result, None))
+            except Exception as e:
+                results.put((hedged, None, e))
+
+        try:
+            start(False)
+            hedge_at = time.monotonic() + self.hedge_delay(duration) if self.hedge else expires
+            pending = 1
+            hedged_sent = False
+            error = None
+            while pending:
+                hedge_due = not hedged_sent and hedge_at < expires
+                try:
+                    timeout = max(0.0, (hedge_at if hedge_due else expires) - time.monotonic())
+                    hedged, result, e = results.get(timeout=timeout)
+                except queue.Empty:
+                    if not hedge_due:
+                        raise DeadlineExceeded(f"No answer within the {deadline:.1f}s deadline")
+                    self.stats.count('hedges')
+                    logger.info(f"No answer after {self.hedge_delay(duration):.1f}s, sending a hedged request")
+                    start(True)
+                    hedged_sent = True
+                    pending += 1
+                    continue
+                pending -= 1
+                if e is None:
+                    if hedged:
+                        self.stats.count('hedge_wins')
+                    return result
+                error = e
+            raise error
+        finally:
+            # Whatever is still running lost, or ran out of time
+            for cancelled in cancels:
+                cancelled.set()
@@ -0,0 +1,100 @@
+import logging
+from math import gcd
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class StreamingResampler:
+    """Incremental rational-ratio polyphase FIR resampler.
+
+    Blocks are converted as they arrive, with the filter history carried
+    over between calls, so the output matches a one-shot polyphase
+    resample of the whole signal without ever holding it in memory.
+    """
+
+    def __init__(self, input_rate, output_rate=16000, window=('kaiser', 5.0)):
+        divisor = gcd(int(input_rate), int(output_rate))
+        self.up = int(output_rate) // divisor
+        self.down = int(input_rate) // divisor
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            self.reset()
+            return
+
+        # Same anti-aliasing filter design as scipy.signal.resample_poly.
+        # Imported here, scipy.signal alone takes about a second to load
+        from scipy import signal
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        taps = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=window) * self.up
+        # Output sample n sits at n*down + delay in the upsampled domain,
+        # which cancels the filter's group delay
+        self._delay = half_len
+
+        # Polyphase bank: row p holds taps p, p+up, p+2*up, ...
+        phase_len = -(-len(taps) // self.up)
+        padded = np.zeros(phase_len * self.up)
+        padded[:len(taps)] = taps
+        self._bank = padded.reshape(phase_len, self.up).T.copy()
+        self._phase_len = phase_len
+        self._offsets = np.arange(phase_len)
+        self.reset()
+
+    def reset(self):
+        """Forget all history and start a new stream"""
+        self._total_in = 0
+        self._next_out = 0
+        if self.passthrough:
+            return
+        # History holds input samples from index _history_start onwards;
+        # negative indices are the implicit zeros before the stream starts
+        self._history = np.zeros(self._phase_len - 1)
+        self._history_start = -(self._phase_len - 1)
+
+    def process(self, block):
+        """Resample one block of int16 samples, returning the ready output"""
+        block = np.asarray(block)
+        self._total_in += len(block)
+        if self.passthrough:
+            self._next_out += len(block)
+            return block.astype(np.int16, copy=False)
+        self._history = np.concatenate((self._history, block))
+        return self._convert(self._total_in - 1)
+
+    def flush(self):
+        """Return the remaining output once the stream has ended"""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.int16)
+        total_out = -(-self._total_in * self.up // self.down)
+        if self._next_out >= total_out:
+            return np.zeros(0, dtype=np.int16)
+        # Pad with the zeros that follow the end of the signal
+        last_needed = ((total_out - 1) * self.down + self._delay) // self.up
+        padding = last_needed - (self._history_start + len(self._history) - 1)
+        if padding > 0:
+            self._history = np.concatenate((self._history, np.zeros(padding)))
+        return self._convert(last_needed, total_out)
+
+    def _convert(self, last_input, limit=None):
+        # Outputs whose newest input sample has already arrived
+        count = ((last_input + 1) * self.up - 1 - self._delay) // self.down + 1 - self._next_out
+        if limit is not None:
+            count = min(count, limit - self._next_out)
+        if count <= 0:
+            return np.zeros(0, dtype=np.int16)
+
+        positions = np.arange(self._next_out, self._next_out + count) * self.down + self._delay
+        newest = positions // self.up - self._history_start
+        phases = positions % self.up
+        window = self._history[newest[:, None] - self._offsets[None, :]]
+        output = np.einsum('ij,ij->i', window, self._bank[phases])
+        self._next_out += count
+
+        # Drop history no later output can reach
+        keep_from = (self._next_out * self.down + self._delay) // self.up - (self._phase_len - 1)
+        drop = keep_from - self._history_start
+        if drop > 0:
+            self._history = self._history[drop:]
+            self._history_start = keep_from
+
+        return np.clip(np.rint(output), -32768, 32767).astype(np.int16)
@@ -0,0 +1,53 @@
+import logging
+from vad import VoiceActivityDetector
+
+logger = logging.getLogger(__name__)
+
+class PauseSegmenter:
+    """Finds natural pauses in a live 16kHz stream to cut it into segments.
+
+    Samples are fed in as they are captured. Once a segment is long enough,
+    the first pause that lasts `min_pause` seconds produces a cut in the
+    middle of that pause, so neither side loses the edge of a word.
+    """
+
+    def __init__(self, rate=16000, min_segment=10.0, max_segment=120.0,
+                 min_pause=0.6, silence_threshold=0.01, frame_duration=0.02):
+        self.vad = VoiceActivityDetector(rate, frame_duration, silence_threshold)
+        self.frame_size = self.vad.frame_size
+        self.min_segment = int(rate * min_segment)
+        self.max_segment = int(rate * max_segment)
+        self.min_pause = int(rate * min_pause)
+        self.reset()
+
+    def reset(self):
+        self.vad.reset()
+        self._position = 0        # Samples analysed so far
+        self._segment_start = 0
+        self._silence_start = None
+
+    def feed(self, samples):
+        """Analyse new samples and return the cut positions they produced"""
+        cuts = []
+        for is_speech in self.vad.classify(samples):
+            if not is_speech:
+                if self._silence_start is None:
+                    self._silence_start = self._position
+            else:
+                self._silence_start = None
+            self._position += self.frame_size
+
+            length = self._position - self._segment_start
+            if (self._silence_start is not None
+                    and self._position - self._silence_start >= self.min_pause
+                    and length >= self.min_segment):
+                cut = (self._silence_start + self._position) // 2
+            elif length >= self.max_segment:
+                # No pause in sight, cut anyway to bound the tail
+                cut = self._position
+            else:
+                continue
+            cuts.append(cut)
+            self._segment_start = cut
+            self._silence_start = None
+        return cuts
@@ -19,6 +19,17 @@ class Settings:
         'ru': 'Russian',
         # Add more languages as needed
     }
+    # Model sizes for the local (offline) engine
+    VALID_LOCAL_MODELS = ['tiny', 'base', 'small', 'medium', 'large-v3', 'turbo']
+    # 'api' sends audio to OpenAI, 'local' transcribes on this machine,
+    # 'auto' picks one of the two for every recording
+    VALID_BACKENDS = ['api', 'local', 'auto']
+    # Upload encodings; 'auto' picks one per recording
+    VALID_AUDIO_FORMATS = ['auto', 'wav', 'flac', 'opus']
+    # Flags that QSettings may hand back as 'true'/'false' strings
+    BOOL_SETTINGS = ['pipeline_mode', 'trim_silence', 'keep_recordings', 'hedge_requests',
+                     'cache_transcripts', 'realtime_mode', 'preroll_mode',
+                     'journal_mode']
     
     def __init__(self):
         self.settings = QSettings('TellySpelly', 'TellySpelly')
@@ -36,6 +47,14 @@ class Settings:
                 return default
         elif key == 'language' and value not in self.VALID_LANGUAGES:
             return 'auto'  # Default to auto-detect
+        elif key == 'audio_format' and value not in self.VALID_AUDIO_FORMATS:
+            return default
+        elif key == 'local_model' and value not in self.VALID_LOCAL_MODELS:
+            return default
+        elif key == 'transcription_backend' and value not in self.VALID_BACKENDS:
+            return default
+        elif key in self.BOOL_SETTINGS:
+            return value in (True, 'true', '1', 1)
                 
         return value
         
@@ -50,6 +69,14 @@ class Settings:
                 raise ValueError(f"Invalid mic_index: {value}")
         elif key == 'language' and value not in self.VALID_LANGUAGES:
             raise ValueError(f"Invalid language: {value}")
+        elif key == 'audio_format' and value not in self.VALID_AUDIO_FORMATS:
+            raise ValueError(f"Invalid audio format: {value}")
+        elif key == 'local_model' and value not in self.VALID_LOCAL_MODELS:
+            raise ValueError(f"Invalid local model: {value}")
+        elif key == 'transcription_backend' and value not in self.VALID_BACKENDS:
+            raise ValueError(f"Invalid transcription engine: {value}")
+        elif key in self.BOOL_SETTINGS:
+            value = bool(value)
                 
         self.settings.setValue(key, value)
         self.settings.sync()
\ No newline at end of file
@@ -1,12 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QComboBox, 
                             QGroupBox, QFormLayout, QProgressBar, QPushButton,
-                            QLineEdit, QMessageBox)
+                            QLineEdit, QMessageBox, QCheckBox, QDoubleSpinBox,
+                            QSpinBox)
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 import logging
-import keyboard
+import os
 from PyQt6.QtGui import QKeySequence
 from settings import Settings
-from recorder import AudioRecorder
+from capture import capture_hub
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +49,7 @@ class ShortcutEdit(QLineEdit):
 class SettingsWindow(QWidget):
     initialization_complete = pyqtSignal()
     shortcuts_changed = pyqtSignal(str, str)  # start_key, stop_key
+    standby_changed = pyqtSignal()  # Pre-roll setting or input device changed
 
     def __init__(self):
         super().__init__()
@@ -73,6 +75,13 @@ class SettingsWindow(QWidget):
         self.api_key_field.editingFinished.connect(self.on_api_key_changed)
         model_layout.addRow("OpenAI API Key:", self.api_key_field)
         
+        # Optional alternative endpoint (self-hosted or local stand-in server)
+        self.api_base_url_field = QLineEdit()
+        self.api_base_url_field.setPlaceholderText("Default OpenAI endpoint")
+        self.api_base_url_field.setText(self.settings.get('api_base_url', ''))
+        self.api_base_url_field.editingFinished.connect(self.on_api_base_url_changed)
+        model_layout.addRow("API Base URL:", self.api_base_url_field)
+        
         self.model_combo = QComboBox()
         self.model_combo.addItems(Settings.VALID_MODELS)
         current_model = self.settings.get('model', 'whisper-1')
@@ -80,6 +89,38 @@ class SettingsWindow(QWidget):
         self.model_combo.currentTextChanged.connect(self.on_model_changed)
         model_layout.addRow("Whisper Model:", self.model_combo)
         
+        # Offline engine (applies after restart)
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("OpenAI API", 'api')
+        self.backend_combo.addItem("Local (CPU)", 'local')
+        self.backend_combo.addItem("Automatic (local for short clips)", 'auto')
+        index = self.backend_combo.findData(self.settings.get('transcription_backend', 'api'))
+        self.backend_combo.setCurrentIndex(max(index, 0))
+        self.backend_combo.currentIndexChanged.connect(self.on_backend_changed)
+        model_layout.addRow("Transcription Engine:", self.backend_combo)
+        
+        self.local_model_combo = QComboBox()
+        self.local_model_combo.addItems(Settings.VALID_LOCAL_MODELS)
+        self.local_model_combo.setCurrentText(self.settings.get('local_model', 'base'))
+        self.local_model_combo.currentTextChanged.connect(self.on_local_model_changed)
+        model_layout.addRow("Local Model:", self.local_model_combo)
+        
+        self.threads_spin = QSpinBox()
+        self.threads_spin.setRange(0, os.cpu_count() or 1)
+        self.threads_spin.setSpecialValueText("Automatic")
+        self.threads_spin.setValue(int(self.settings.get('local_threads', 0)))
+        self.threads_spin.valueChanged.connect(self.on_local_threads_changed)
+        model_layout.addRow("Local Threads:", self.threads_spin)
+        
+        # Clips up to this length go to the local model in automatic mode
+        self.route_spin = QDoubleSpinBox()
+        self.route_spin.setRange(1.0, 120.0)
+        self.route_spin.setSuffix(" s")
+        self.route_spin.setValue(float(self.settings.get('route_local_seconds', 10)))
+        self.route_spin.valueChanged.connect(lambda value: self.settings.set('route_local_seconds', value))
+        model_layout.addRow("Local Up To:", self.route_spin)
+        self.update_local_widgets()
+        
         self.lang_combo = QComboBox()
         # Add all supported languages
         for code, name in Settings.VALID_LANGUAGES.items():
@@ -92,6 +133,19 @@ class SettingsWindow(QWidget):
         self.lang_combo.currentIndexChanged.connect(self.on_language_changed)
         model_layout.addRow("Language:", self.lang_combo)
         
+        # Size of the transcription worker pool (applies after restart)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 8)
+        self.workers_spin.setValue(int(self.settings.get('transcription_workers', 2)))
+        self.workers_spin.valueChanged.connect(self.on_workers_changed)
+        model_layout.addRow("Parallel Transcriptions:", self.workers_spin)
+        
+        # Reuse earlier results for identical audio instead of uploading it again
+        self.cache_check = QCheckBox("Cache transcriptions")
+        self.cache_check.setChecked(self.settings.get('cache_transcripts', False))
+        self.cache_check.toggled.connect(lambda checked: self.settings.set('cache_transcripts', checked))
+        model_layout.addRow(self.cache_check)
+        
         model_group.setLayout(model_layout)
         layout.addWidget(model_group)
         
@@ -99,38 +153,126 @@ class SettingsWindow(QWidget):
         recording_group = QGroupBox("Recording Settings")
         recording_layout = QFormLayout()
         
-        # Get a reference to the global recorder instance if available
-        try:
-            from main import recorder as global_recorder
-            device_list = global_recorder.get_device_list()
-        except (ImportError, AttributeError):
-            # Fall back to creating a temporary recorder if needed
-            logger.warning("Could not access global recorder, creating temporary instance")
-            temp_recorder = AudioRecorder()
-            device_list = temp_recorder.get_device_list()
-        
         self.device_combo = QComboBox()
-        # Add all available input devices
-        self.device_combo.addItem("Default Microphone", -1)  # Default option with value -1
-        for device in device_list:
-            self.device_combo.addItem(device['name'], device['index'])
-        
-        # Get current mic index from settings
-        current_mic = self.settings.get('mic_index', -1)
-        
-        # Find and set the current device
-        index = self.device_combo.findData(current_mic)
-        if index >= 0:
-            self.device_combo.setCurrentIndex(index)
-        else:
-            self.device_combo.setCurrentIndex(0)  # Default to first item
-            
+        self.populate_devices()
         self.device_combo.currentIndexChanged.connect(self.on_device_changed)
         recording_layout.addRow("Input Device:", self.device_combo)
         
+        # Transcribe finished segments while still recording
+        self.pipeline_check = QCheckBox("Transcribe while recording")
+        self.pipeline_check.setChecked(self.settings.get('pipeline_mode', False))
+        self.pipeline_check.toggled.connect(self.on_pipeline_mode_changed)
+        recording_layout.addRow(self.pipeline_check)
+        
+        # Keep the microphone open so recordings start instantly, including
+        # the moment just before the shortcut was pressed
+        self.preroll_check = QCheckBox("Keep microphone ready (pre-roll)")
+        self.preroll_check.setChecked(self.settings.get('preroll_mode', False))
+        self.preroll_check.toggled.connect(self.on_preroll_mode_changed)
+        recording_layout.addRow(self.preroll_check)
+        
+        self.preroll_spin = QSpinBox()
+        self.preroll_spin.setRange(100, 2000)
+        self.preroll_spin.setSingleStep(100)
+        self.preroll_spin.setSuffix(" ms")
+        self.preroll_spin.setValue(int(float(self.settings.get('preroll_ms', 300))))
+        self.preroll_spin.setEnabled(self.preroll_check.isChecked())
+        self.preroll_spin.valueChanged.connect(self.on_preroll_ms_changed)
+        recording_layout.addRow("Pre-roll:", self.preroll_spin)
+        
+        # Stream audio to the realtime API and show the text as it is spoken
+        self.realtime_check = QCheckBox("Live transcription while recording")
+        self.realtime_check.setChecked(self.settings.get('realtime_mode', False))
+        self.realtime_check.toggled.connect(self.on_realtime_mode_changed)
+        recording_layout.addRow(self.realtime_check)
+        
+        # Drop leading/trailing silence and shorten long pauses before upload
+        self.trim_check = QCheckBox("Trim silence before upload")
+        self.trim_check.setChecked(self.settings.get('trim_silence', False))
+        self.trim_check.toggled.connect(self.on_trim_silence_changed)
+        recording_layout.addRow(self.trim_check)
+        
+        self.max_pause_spin = QDoubleSpinBox()
+        self.max_pause_spin.setRange(0.2, 10.0)
+        self.max_pause_spin.setSingleStep(0.1)
+        self.max_pause_spin.setSuffix(" s")
+        self.max_pause_spin.setValue(float(self.settings.get('max_pause', 1.0)))
+        self.max_pause_spin.setEnabled(self.trim_check.isChecked())
+        self.max_pause_spin.valueChanged.connect(self.on_max_pause_changed)
+        recording_layout.addRow("Longest Pause:", self.max_pause_spin)
+        
+        # Encoding used for the upload
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("Automatic", 'auto')
+        self.format_combo.addItem("WAV (uncompressed)", 'wav')
+        self.format_combo.addItem("FLAC (lossless)", 'flac')
+        self.format_combo.addItem("Opus", 'opus')
+        index = self.format_combo.findData(self.settings.get('audio_format', 'auto'))
+        self.format_combo.setCurrentIndex(max(index, 0))
+        self.format_combo.currentIndexChanged.connect(self.on_audio_format_changed)
+        recording_layout.addRow("Upload Format:", self.format_combo)
+        
+        self.bitrate_spin = QSpinBox()
+        self.bitrate_spin.setRange(8, 128)
+        self.bitrate_spin.setSuffix(" kbps")
+        self.bitrate_spin.setValue(int(self.settings.get('opus_bitrate', 24)))
+        self.bitrate_spin.valueChanged.connect(self.on_opus_bitrate_changed)
+        recording_layout.addRow("Opus Bitrate:", self.bitrate_spin)
+        
+        # Recordings are handed over in memory; a disk copy is for debugging only
+        self.keep_check = QCheckBox("Keep a copy of recordings on disk")
+        self.keep_check.setChecked(self.settings.get('keep_recordings', False))
+        self.keep_check.toggled.connect(self.on_keep_recordings_changed)
+        recording_layout.addRow(self.keep_check)
+        
+        # Long recordings survive a crash and don't grow memory
+        self.journal_check = QCheckBox("Write recordings to disk while recording")
+        self.journal_check.setChecked(self.settings.get('journal_mode', False))
+        self.journal_check.toggled.connect(lambda checked: self.settings.set('journal_mode', checked))
+        recording_layout.addRow(self.journal_check)
+        
         recording_group.setLayout(recording_layout)
         layout.addWidget(recording_group)
         
+        # Connection pool used for API requests (applies after restart)
+        network_group = QGroupBox("Network")
+        network_layout = QFormLayout()
+        
+        self.pool_spin = QSpinBox()
+        self.pool_spin.setRange(1, 32)
+        self.pool_spin.setValue(int(float(self.settings.get('http_pool_size', 8))))
+        self.pool_spin.valueChanged.connect(lambda value: self.settings.set('http_pool_size', value))
+        network_layout.addRow("Connection Pool Size:", self.pool_spin)
+        
+        self.keepalive_spin = QSpinBox()
+        self.keepalive_spin.setRange(5, 600)
+        self.keepalive_spin.setSuffix(" s")
+        self.keepalive_spin.setValue(int(float(self.settings.get('http_keepalive', 60))))
+        self.keepalive_spin.valueChanged.connect(lambda value: self.settings.set('http_keepalive', value))
+        network_layout.addRow("Keep-Alive:", self.keepalive_spin)
+        
+        self.timeout_spin = QSpinBox()
+        self.timeout_spin.setRange(5, 600)
+        self.timeout_spin.setSuffix(" s")
+        self.timeout_spin.setValue(int(float(self.settings.get('http_timeout', 60))))
+        self.timeout_spin.valueChanged.connect(lambda value: self.settings.set('http_timeout', value))
+        network_layout.addRow("Request Timeout:", self.timeout_spin)
+        
+        self.retries_spin = QSpinBox()
+        self.retries_spin.setRange(0, 10)
+        self.retries_spin.setValue(int(float(self.settings.get('request_retries', 3))))
+        self.retries_spin.valueChanged.connect(lambda value: self.settings.set('request_retries', value))
+        network_layout.addRow("Retries:", self.retries_spin)
+        
+        # Duplicate requests that are slower than usual, first answer wins
+        self.hedge_check = QCheckBox("Hedge slow requests")
+        self.hedge_check.setChecked(self.settings.get('hedge_requests', False))
+        self.hedge_check.toggled.connect(lambda checked: self.settings.set('hedge_requests', checked))
+        network_layout.addRow(self.hedge_check)
+        
+        network_group.setLayout(network_layout)
+        layout.addWidget(network_group)
+        
         # Loading progress
         self.progress_group = QGroupBox("Model Loading")
         progress_layout = QVBoxLayout()
@@ -171,6 +313,74 @@ class SettingsWindow(QWidget):
             logger.error(f"Failed to set API key: {e}")
             QMessageBox.warning(self, "Error", str(e))
             
+    def on_api_base_url_changed(self):
+        base_url = self.api_base_url_field.text().strip()
+        self.settings.set('api_base_url', base_url)
+        
+    def on_pipeline_mode_changed(self, enabled):
+        self.settings.set('pipeline_mode', enabled)
+        logger.info(f"Pipeline mode {'enabled' if enabled else 'disabled'}")
+        
+    def on_preroll_mode_changed(self, enabled):
+        self.settings.set('preroll_mode', enabled)
+        self.preroll_spin.setEnabled(enabled)
+        self.standby_changed.emit()
+        
+    def on_preroll_ms_changed(self, value):
+        self.settings.set('preroll_ms', value)
+        self.standby_changed.emit()
+        
+    def on_realtime_mode_changed(self, enabled):
+        self.settings.set('realtime_mode', enabled)
+        logger.info(f"Realtime mode {'enabled' if enabled else 'disabled'}")
+        
+    def on_trim_silence_changed(self, enabled):
+        self.settings.set('trim_silence', enabled)
+        self.max_pause_spin.setEnabled(enabled)
+        
+    def on_max_pause_changed(self, value):
+        self.settings.set('max_pause', value)
+        
+    def on_audio_format_changed(self, index):
+        try:
+            self.settings.set('audio_format', self.format_combo.currentData())
+        except ValueError as e:
+            logger.error(f"Failed to set audio format: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+            
+    def on_opus_bitrate_changed(self, value):
+        self.settings.set('opus_bitrate', value)
+        
+    def on_keep_recordings_changed(self, enabled):
+        self.settings.set('keep_recordings', enabled)
+            
+    def on_backend_changed(self, index):
+        try:
+            self.settings.set('transcription_backend', self.backend_combo.currentData())
+        except ValueError as e:
+            logger.error(f"Failed to set transcription engine: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+        self.update_local_widgets()
+        
+    def on_local_model_changed(self, model_name):
+        try:
+            self.settings.set('local_model', model_name)
+        except ValueError as e:
+            logger.error(f"Failed to set local model: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+            
+    def on_local_threads_changed(self, value):
+        self.settings.set('local_threads', value)
+        
+    def update_local_widgets(self):
+        engine = self.backend_combo.currentData()
+        self.local_model_combo.setEnabled(engine != 'api')
+        self.threads_spin.setEnabled(engine != 'api')
+        self.route_spin.setEnabled(engine == 'auto')
+        
+    def on_workers_changed(self, value):
+        self.settings.set('transcription_workers', value)
+            
     def on_language_changed(self, index):
         language_code = self.lang_combo.currentData()
         try:
@@ -179,12 +389,33 @@ class SettingsWindow(QWidget):
             logger.error(f"Failed to set language: {e}")
             QMessageBox.warning(self, "Error", str(e))
 
+    def populate_devices(self):
+        """Fill the device list from the shared device registry, e.g. again after a hotplug"""
+        self.device_combo.blockSignals(True)
+        self.device_combo.clear()
+        # Add all available input devices
+        self.device_combo.addItem("Default Microphone", -1)  # Default option with value -1
+        for device in capture_hub().input_devices():
+            self.device_combo.addItem(device['name'], device['index'])
+        
+        # Find and set the current device, by name unless only an index was saved
+        mic_name = self.settings.get('mic_name', '')
+        if mic_name:
+            index = self.device_combo.findText(mic_name)
+        else:
+            index = self.device_combo.findData(self.settings.get('mic_index', -1))
+        self.device_combo.setCurrentIndex(max(index, 0))  # Default to first item
+        self.device_combo.blockSignals(False)
+        
     def on_device_changed(self, index):
         try:
-            # Get the device index from the combo box data
+            # The name identifies the device across replugs, the index may not
             device_index = self.device_combo.currentData()
+            mic_name = self.device_combo.currentText() if device_index >= 0 else ''
             self.settings.set('mic_index', device_index)
-            logger.info(f"Microphone set to device index: {device_index}")
+            self.settings.set('mic_name', mic_name)
+            logger.info(f"Microphone set to: {mic_name or 'default'}")
+            self.standby_changed.emit()
         except ValueError as e:
             logger.error(f"Failed to set microphone: {e}")
             QMessageBox.warning(self, "Error", str(e))
@@ -208,10 +439,13 @@ class SettingsWindow(QWidget):
 
     def load_model(self, model_name):
         try:
-            # For OpenAI API, we don't need to load a model locally
-            # Just update the UI to show it's ready
+            # The API needs nothing loaded here; a local model is loaded by
+            # the transcriber in the background at startup
             self.current_model = model_name
-            self.progress_label.setText(f"Using OpenAI Whisper API with model {model_name}")
+            if self.settings.get('transcription_backend', 'api') == 'local':
+                self.progress_label.setText(f"Using local {self.settings.get('local_model', 'base')} model")
+            else:
+                self.progress_label.setText(f"Using OpenAI Whisper API with model {model_name}")
             self.progress_bar.setRange(0, 100)
             self.progress_bar.setValue(100)
             self.initialization_complete.emit()
@@ -1,21 +1,20 @@
 from PyQt6.QtCore import QObject, pyqtSignal, Qt, pyqtSlot
-from PyQt6.QtDBus import QDBusConnection, QDBusInterface, QDBusMessage
+from PyQt6.QtDBus import QDBusConnection
 from PyQt6.QtWidgets import QApplication
 import logging
 import os
 import uuid
+from control import DBUS_SERVICE_NAME, DBUS_OBJECT_PATH
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
-# D-Bus constants for single instance application
-DBUS_SERVICE_NAME = "org.kde.telly_spelly" 
-DBUS_OBJECT_PATH = "/org/kde/telly_spelly/Instance"
-
 # session_bus will be passed in __init__
 
 class GlobalShortcuts(QObject):
     start_recording_triggered = pyqtSignal()
     stop_recording_triggered = pyqtSignal()
+    toggle_recording_triggered = pyqtSignal()
 
     @pyqtSlot(result=bool, name='activateStartRecording')
     def _activateStartRecording(self):
@@ -29,6 +28,16 @@ class GlobalShortcuts(QObject):
         self.stop_recording_triggered.emit()
         return True
 
+    @pyqtSlot(result=bool, name='activateToggleRecording')
+    def _activateToggleRecording(self):
+        logger.info("D-Bus: activateToggleRecording called from remote instance.")
+        self.toggle_recording_triggered.emit()
+        return True
+
+    @pyqtSlot(result=str, name='latencySummary')
+    def _latencySummary(self):
+        return tracer().summary()
+
     def __init__(self, session_bus):
         super().__init__()
         self.session_bus = session_bus
@@ -59,35 +68,3 @@ class GlobalShortcuts(QObject):
         """Called when stop recording shortcut is pressed"""
         logger.info(f"Stop recording shortcut triggered ({self.stop_action_id})")
         self.stop_recording_triggered.emit()
-    
-
-    def callExistingInstance(self, action):
-        if not self.session_bus.isConnected():
-            logger.error("D-Bus session bus not connected. Cannot send command to existing instance.")
-        else:
-            actual_interface_name = "local.GlobalShortcuts" # Updated based on qdbus output
-            interface = QDBusInterface(DBUS_SERVICE_NAME, DBUS_OBJECT_PATH, actual_interface_name, self.session_bus)
-            if interface.isValid() and interface.service():
-                logger.info("Found existing instance. Sending command via D-Bus.")
-                reply = None
-                if action == "start_recording":
-                    reply = interface.call("activateStartRecording")
-                elif action == "stop_recording":
-                    reply = interface.call("activateStopRecording")
-                
-                if reply is not None:
-                    if reply.type() == QDBusMessage.MessageType.ErrorMessage:
-                        logger.error(f"D-Bus call failed: {reply.errorMessage()}")
-                        QApplication.exit(1)
-                        return 1
-                    else:
-                        logger.info("D-Bus command sent successfully to existing instance.")
-                        QApplication.exit(0)
-                        return 0
-                else:
-                    logger.warning("D-Bus call to existing instance did not return a reply or timed out. The new instance will exit.")
-                    QApplication.exit(1)
-                    return 1
-            else:
-                logger.info("No running instance found to send command. This instance will start and attempt the action.")
-        
\ No newline at end of file
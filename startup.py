@@ -0,0 +1,92 @@
+import builtins
+import importlib.util
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class StartupProfiler:
+    """Times the startup stages and, when enabled, every module import.
+
+    Stages may run on several threads at once. Imports are timed by
+    wrapping `__import__`, so each module's own time can be told apart
+    from the modules it pulls in. `report` prints both breakdowns.
+    """
+
+    def __init__(self, started=None, enabled=False):
+        self.started = time.perf_counter() if started is None else started
+        self.enabled = enabled
+        self.stages = []  # (name, thread, start offset, seconds)
+        # Module -> [cumulative seconds, own seconds, thread]
+        self.imports = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._import = None
+        if enabled:
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.stages.append((name, threading.current_thread().name,
+                                    start - self.started, end - start))
+
+    def run(self, name, func, *args):
+        """Run func(*args) as a stage, e.g. on a worker thread"""
+        with self.stage(name):
+            return func(*args)
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        absolute = name
+        if level:
+            try:
+                absolute = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                return self._import(name, globals, locals, fromlist, level)
+        # Only first-time loads are interesting
+        if absolute in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            with self._lock:
+                self.imports.setdefault(absolute, [total, total - children,
+                                               threading.current_thread().name])
+
+    def finish(self):
+        """Stop timing imports and return seconds since process start"""
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+        return time.perf_counter() - self.started
+
+    def report(self, file=None, top=20):
+        file = file or sys.stderr
+        total = self.finish()
+        print(f"Startup took {total * 1000:.0f} ms", file=file)
+        print(f"{'stage':<28} {'thread':<14} {'start ms':>9} {'ms':>8}", file=file)
+        for name, thread, start, seconds in sorted(self.stages, key=lambda s: s[2]):
+            print(f"{name:<28} {thread:<14} {start * 1000:>9.0f} {seconds * 1000:>8.1f}", file=file)
+        if not self.imports:
+            return
+        print(f"\nSlowest imports ({len(self.imports)} modules loaded)", file=file)
+        print(f"{'module':<40} {'thread':<14} {'cumul ms':>9} {'self ms':>8}", file=file)
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (cumulative, own, thread) in slowest[:top]:
+            print(f"{name:<40} {thread:<14} {cumulative * 1000:>9.1f} {own * 1000:>8.1f}", file=file)
@@ -0,0 +1,87 @@
+"""Stop-to-file latency of the streaming resampler versus resampling after stop.
+
+Run from the repository root:
+
+    python tests/bench_resampler.py              # 1, 10 and 60 minutes at 44.1 and 48 kHz
+    python tests/bench_resampler.py --baseline   # also the old one-shot FFT resample
+
+The old path needs several GB of memory for an hour of audio and takes
+minutes, so it is only run when asked for.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_buffer import AudioBuffer
+from resampler import StreamingResampler
+
+TARGET_RATE = 16000
+BLOCK = 1024
+
+def write_wav(views):
+    output = io.BytesIO()
+    wf = wave.open(output, 'wb')
+    wf.setnchannels(1)
+    wf.setsampwidth(2)
+    wf.setframerate(TARGET_RATE)
+    for view in views:
+        wf.writeframes(view)
+    wf.close()
+    return len(output.getvalue())
+
+def blocks(minutes, rate):
+    block = (np.random.default_rng(0).standard_normal(BLOCK) * 3000).astype(np.int16)
+    for _ in range(int(minutes * 60 * rate) // BLOCK):
+        yield block
+
+def streaming(minutes, rate):
+    """Resample every block as it is captured, then flush and write at stop"""
+    resampler = StreamingResampler(rate, TARGET_RATE)
+    buffer = AudioBuffer()
+    count = 0
+    started = time.perf_counter()
+    for block in blocks(minutes, rate):
+        buffer.append(resampler.process(block))
+        count += 1
+    per_block = (time.perf_counter() - started) / count
+    stopped = time.perf_counter()
+    buffer.append(resampler.flush())
+    write_wav(buffer.views())
+    return time.perf_counter() - stopped, per_block
+
+def baseline(minutes, rate):
+    """Keep the device rate while recording and resample everything at stop"""
+    from scipy import signal
+    buffer = AudioBuffer()
+    for block in blocks(minutes, rate):
+        buffer.append(block)
+    stopped = time.perf_counter()
+    samples = buffer.to_array()
+    resampled = signal.resample(samples, int(len(samples) * TARGET_RATE / rate))
+    write_wav([np.clip(resampled, -32768, 32767).astype(np.int16)])
+    return time.perf_counter() - stopped, None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 10, 60])
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000])
+    parser.add_argument('--baseline', action='store_true', help="also time the old resample-at-stop path")
+    args = parser.parse_args()
+
+    for rate in args.rates:
+        for minutes in args.minutes:
+            latency, per_block = streaming(minutes, rate)
+            line = (f"{rate / 1000:g} kHz {minutes:g} min: streaming stop-to-file {latency:.3f}s "
+                    f"({per_block * 1000:.3f} ms per {BLOCK}-frame block)")
+            if args.baseline:
+                latency, _ = baseline(minutes, rate)
+                line += f", resample at stop {latency:.3f}s"
+            print(line, flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# The application modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def fake_settings(monkeypatch):
+    """Swap Settings for a dict in the given modules, so tests never touch the user's configuration.
+
+    Call it with the modules to patch; it returns the dict to fill in.
+    """
+    values = {}
+
+    class FakeSettings:
+        def get(self, key, default=None):
+            return values.get(key, default)
+
+        def set(self, key, value):
+            values[key] = value
+
+    def install(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, 'Settings', FakeSettings)
+        return values
+    return install
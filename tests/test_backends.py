@@ -0,0 +1,77 @@
+import socket
+import threading
+import time
+import openai
+import pytest
+
+import backends
+import request_policy
+from backends import ApiBackend, RoutingBackend
+from request_policy import DeadlineExceeded, RequestStats
+
+class FakeLocal:
+    name = 'local'
+    model_name = 'local-test'
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.ready.set()
+        self.model = object()
+        self.calls = 0
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        self.calls += 1
+        return "local text"
+
+class FailingApi:
+    name = 'api'
+    model_name = 'whisper-1'
+
+    def __init__(self, error):
+        self.error = error
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        raise self.error
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def settings(fake_settings):
+    return fake_settings(backends, request_policy)
+
+def test_unreachable_api_falls_back_on_the_first_failure(settings):
+    settings.update(request_retries=3)
+    client = openai.OpenAI(api_key='test', base_url=f'http://127.0.0.1:{closed_port()}/v1')
+    stats = RequestStats()
+    local = FakeLocal()
+    router = RoutingBackend(local, ApiBackend(client, stats, retry_offline=False), local_seconds=0)
+    started = time.monotonic()
+    assert router.transcribe(('a.wav', b'RIFF'), 4, 5.0) == "local text"
+    assert time.monotonic() - started < 2
+    assert stats.requests == 1 and stats.retries == 0 and local.calls == 1
+    # Later requests skip the API while it counts as offline
+    assert router.choose(60.0)[0] is local
+
+def test_missed_deadline_falls_back(settings):
+    local = FakeLocal()
+    router = RoutingBackend(local, FailingApi(DeadlineExceeded("too slow")), local_seconds=0)
+    assert router.transcribe(('a.wav', b'RIFF'), 4, 5.0) == "local text"
+    assert not router.api_available()
+
+def test_other_api_errors_are_not_hidden(settings):
+    local = FakeLocal()
+    router = RoutingBackend(local, FailingApi(ValueError("bad audio")), local_seconds=0)
+    with pytest.raises(ValueError):
+        router.transcribe(('a.wav', b'RIFF'), 4, 5.0)
+    assert local.calls == 0 and router.api_available()
+
+def test_standalone_api_still_retries_connection_failures(settings):
+    settings.update(request_retries=1)
+    client = openai.OpenAI(api_key='test', base_url=f'http://127.0.0.1:{closed_port()}/v1')
+    stats = RequestStats()
+    with pytest.raises(openai.APIConnectionError):
+        ApiBackend(client, stats).transcribe(('a.wav', b'RIFF'), 4, 5.0)
+    assert stats.retries == 1
@@ -0,0 +1,102 @@
+import os
+import stat
+import sys
+import time
+import types
+import pytest
+
+import devices
+from devices import PULSE_EVENT, DeviceRegistry, DeviceWatcher
+
+class FakeAudio:
+    """PortAudio stand-in that lists the devices connected when it was started"""
+    connected = []
+    started = 0
+
+    def __init__(self):
+        FakeAudio.started += 1
+        self.devices = list(FakeAudio.connected)
+
+    def get_device_count(self):
+        return len(self.devices)
+
+    def get_device_info_by_index(self, i):
+        return {'index': i, 'name': self.devices[i], 'maxInputChannels': 1,
+                'defaultSampleRate': 48000.0}
+
+    def terminate(self):
+        pass
+
+@pytest.fixture
+def hub(monkeypatch, tmp_path):
+    import capture
+    monkeypatch.setitem(sys.modules, 'pyaudio', types.SimpleNamespace(PyAudio=FakeAudio))
+    FakeAudio.connected = ['Built-in Microphone']
+    FakeAudio.started = 0
+    return capture.CaptureHub(DeviceRegistry(str(tmp_path / 'devices.json')))
+
+@pytest.fixture
+def app():
+    from PyQt6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+def test_device_plugged_in_unnoticed_is_found_by_enumerating_again(hub):
+    hub.start()
+    FakeAudio.connected = ['Built-in Microphone', 'USB Headset']
+    assert hub.resolve_device('USB Headset')['name'] == 'USB Headset'
+    assert FakeAudio.started == 2
+
+def test_missing_device_is_only_looked_for_again_after_a_device_event(hub):
+    hub.start()
+    assert hub.resolve_device('USB Headset') is None
+    assert hub.resolve_device('USB Headset') is None
+    assert FakeAudio.started == 2
+    hub.refresh_devices()
+    FakeAudio.connected = ['USB Headset']
+    assert hub.resolve_device('USB Headset')['index'] == 0
+
+def test_connected_device_needs_no_restart(hub):
+    hub.start()
+    assert hub.resolve_device('Built-in Microphone')['index'] == 0
+    assert hub.resolve_device('', -1) is None
+    assert FakeAudio.started == 1
+
+def test_only_sources_and_cards_coming_or_going_are_hotplugs():
+    assert PULSE_EVENT.search("Event 'new' on source #57")
+    assert PULSE_EVENT.search("Event 'remove' on card #3")
+    assert not PULSE_EVENT.search("Event 'change' on source #57")
+    assert not PULSE_EVENT.search("Event 'new' on sink-input #12")
+
+def fake_pactl(directory, lines):
+    """A pactl that prints the given events for `pactl subscribe` and stays running"""
+    script = directory / 'pactl'
+    events = ''.join(f'echo "{line}"\n' for line in lines)
+    script.write_text(f"#!/bin/sh\n{events}exec sleep 30\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(directory)
+
+def wait_for(app, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    return condition()
+
+@pytest.mark.parametrize('line, reported', [("Event 'new' on source #57", True),
+                                            ("Event 'change' on source #57", False)])
+def test_sound_server_events_are_reported(app, monkeypatch, tmp_path, line, reported):
+    monkeypatch.setenv('PATH', fake_pactl(tmp_path, [line]) + os.pathsep + os.environ['PATH'])
+    watcher = DeviceWatcher(path=str(tmp_path / 'snd'), settle_ms=10)
+    events = []
+    watcher.changed.connect(lambda: events.append(True))
+    try:
+        assert watcher.live
+        assert bool(wait_for(app, lambda: events, timeout=1)) == reported
+    finally:
+        watcher.close()
+
+def test_without_sound_server_events_the_watcher_is_not_live(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(devices.shutil, 'which', lambda name: None)
+    watcher = DeviceWatcher(path=str(tmp_path))
+    assert watcher.live == (watcher.monitor is not None)
+    watcher.close()
@@ -0,0 +1,35 @@
+import os
+import stat
+import numpy as np
+
+from journal import JournalBuffer, find_orphaned_journals
+
+def test_journal_is_private(tmp_path):
+    journal = JournalBuffer(directory=str(tmp_path / 'journal'))
+    try:
+        assert stat.S_IMODE(os.stat(journal.path).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(tmp_path / 'journal').st_mode) == 0o700
+    finally:
+        journal.clear()
+
+def test_finished_journal_stays_until_cleared(tmp_path):
+    journal = JournalBuffer(directory=str(tmp_path))
+    samples = np.arange(1000, dtype=np.int16)
+    journal.append(samples)
+    journal.finish()
+    path = journal.path
+    # Written out, and still locked against recovery by another instance
+    assert np.array_equal(np.fromfile(path, dtype='<i2'), samples)
+    assert find_orphaned_journals(str(tmp_path)) == []
+    journal.clear()
+    assert not os.path.exists(path)
+
+def test_journal_kept_for_recovery(tmp_path):
+    journal = JournalBuffer(directory=str(tmp_path))
+    journal.append(np.ones(100, dtype=np.int16))
+    path = journal.path
+    journal.close(delete=False)
+    assert find_orphaned_journals(str(tmp_path)) == [path]
+    recovered = JournalBuffer.open(path)
+    assert len(recovered) == 100
+    recovered.clear()
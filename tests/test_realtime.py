@@ -0,0 +1,209 @@
+import base64
+import json
+import threading
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('websockets')
+from websockets.sync.server import serve
+
+import backends
+import realtime
+import transcriber
+from encoder import EncodedAudio
+from realtime import RealtimeSession
+
+class RealtimeServer:
+    """Local stand-in for the realtime transcription endpoint.
+
+    Commits an item for every `item_bytes` of audio, like the server's
+    VAD would, and the rest on input_audio_buffer.commit. With `drop` set
+    it hangs up on the commit instead.
+    """
+
+    def __init__(self, item_bytes=48000, drop=False):
+        self.item_bytes = item_bytes
+        self.drop = drop
+        self.session = None
+        self.received = 0
+        self.path = None
+        self._server = serve(self.handle, '127.0.0.1', 0)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f'ws://127.0.0.1:{self._server.socket.getsockname()[1]}'
+
+    def handle(self, ws):
+        self.path = ws.request.path
+        pending = 0
+        items = 0
+
+        def commit():
+            nonlocal items
+            items += 1
+            item = f'item{items}'
+            ws.send(json.dumps({'type': 'input_audio_buffer.committed', 'item_id': item}))
+            ws.send(json.dumps({'type': 'conversation.item.input_audio_transcription.delta',
+                                'item_id': item, 'delta': 'part'}))
+            ws.send(json.dumps({'type': 'conversation.item.input_audio_transcription.completed',
+                                'item_id': item, 'transcript': f'item {items}'}))
+
+        for message in ws:
+            event = json.loads(message)
+            if event['type'] == 'transcription_session.update':
+                self.session = event['session']
+                ws.send(json.dumps({'type': 'transcription_session.updated', 'session': self.session}))
+            elif event['type'] == 'input_audio_buffer.append':
+                data = len(base64.b64decode(event['audio']))
+                self.received += data
+                pending += data
+                while pending >= self.item_bytes:
+                    commit()
+                    pending -= self.item_bytes
+            elif event['type'] == 'input_audio_buffer.commit':
+                if self.drop:
+                    ws.close()
+                    return
+                if pending:
+                    commit()
+                else:
+                    ws.send(json.dumps({'type': 'error', 'error': {
+                        'code': 'input_audio_buffer_commit_empty', 'message': "buffer is empty"}}))
+
+    def close(self):
+        self._server.shutdown()
+
+@pytest.fixture
+def app():
+    from PyQt6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(RealtimeServer(**kwargs))
+        return servers[-1]
+    yield start
+    for s in servers:
+        s.close()
+
+def wait_for(app, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    app.processEvents()
+    return condition()
+
+def session_for(url, **settings):
+    session = RealtimeSession(1, 'test')
+    session.url = url
+    session.language = settings.get('language', '')
+    session.timeout = 5.0
+    session.results = []
+    for signal, kind in ((session.partial, 'partial'), (session.finished, 'finished'),
+                         (session.failed, 'failed')):
+        signal.connect(lambda job_id, text, kind=kind: session.results.append((kind, text)))
+    return session
+
+def stream(session, seconds, block=1024):
+    samples = (np.random.default_rng(0).standard_normal(int(16000 * seconds)) * 3000).astype(np.int16)
+    for start in range(0, len(samples), block):
+        session.feed(samples[start:start + block])
+    session.end_of_audio()
+
+def test_stream_is_sent_at_24khz_and_items_are_joined(app, server):
+    s = server()
+    session = session_for(s.url, language='de')
+    session.start()
+    stream(session, 2.5)
+    assert wait_for(app, lambda: any(kind == 'finished' for kind, _ in session.results))
+    session.close()
+    # 2.5s of 16kHz input is 2.5s of 24kHz pcm16, nothing lost at the block edges
+    assert s.received == int(2.5 * 24000) * 2
+    assert s.path == '/?intent=transcription'
+    assert s.session['input_audio_format'] == 'pcm16'
+    assert s.session['input_audio_transcription'] == {'model': 'whisper-1', 'language': 'de'}
+    # Two items cut by the server, the rest committed at the end
+    assert session.results[-1] == ('finished', "item 1 item 2 item 3")
+    assert ('partial', "item 1") in session.results
+
+def test_empty_final_commit_still_finishes(app, server):
+    s = server(item_bytes=24000 * 2)
+    session = session_for(s.url)
+    session.start()
+    stream(session, 1.0)
+    assert wait_for(app, lambda: session.results and session.results[-1][0] != 'partial')
+    session.close()
+    assert session.results[-1] == ('finished', "item 1")
+
+def test_dropped_connection_fails_the_session(app, server):
+    s = server(drop=True)
+    session = session_for(s.url)
+    session.start()
+    stream(session, 0.5)
+    assert wait_for(app, lambda: any(kind == 'failed' for kind, _ in session.results))
+    session.close()
+
+class Upload:
+    name = 'api'
+    description = 'api'
+
+    def __init__(self):
+        self.uploads = []
+
+    @property
+    def engines(self):
+        return [self]
+
+    def served_by(self):
+        return self
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        self.uploads.append(upload)
+        return "uploaded text"
+
+@pytest.fixture
+def make_transcriber(app, fake_settings, monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    settings = fake_settings(transcriber, backends, realtime)
+    created = []
+
+    def make(url):
+        settings.update(realtime_url=url, openai_api_key='test', realtime_timeout=5)
+        t = transcriber.WhisperTranscriber()
+        # Uploads go to a stand-in, only the realtime session talks to the server
+        t.backend = Upload()
+        t.finished = []
+        t.transcription_finished.connect(lambda job_id, text: t.finished.append((job_id, text)))
+        created.append(t)
+        return t
+    yield make
+    for t in created:
+        t.shutdown()
+
+@pytest.mark.parametrize('audio_first', [False, True])
+def test_failed_session_falls_back_to_uploading_the_recording(app, server, make_transcriber, audio_first):
+    t = make_transcriber(server(drop=True).url)
+    session = t.start_realtime()
+    stream(session, 0.5)
+    recording = EncodedAudio(b'RIFF', 'recording.wav', 0.5)
+    if audio_first:
+        # The recording is encoded before the session fails
+        t.finish_realtime(session.job_id, recording)
+    else:
+        assert wait_for(app, lambda: session.error)
+        t.finish_realtime(session.job_id, recording)
+    assert wait_for(app, lambda: t.finished)
+    assert t.finished == [(session.job_id, "uploaded text")]
+    assert t.backend.uploads == [('recording.wav', b'RIFF')]
+    assert not t._realtime
+
+def test_working_session_never_uploads(app, server, make_transcriber):
+    t = make_transcriber(server().url)
+    session = t.start_realtime()
+    stream(session, 0.5)
+    t.finish_realtime(session.job_id, EncodedAudio(b'RIFF', 'recording.wav', 0.5))
+    assert wait_for(app, lambda: t.finished)
+    assert t.finished == [(session.job_id, "item 1")] and not t.backend.uploads
@@ -0,0 +1,176 @@
+import time
+import numpy as np
+import pytest
+
+import encoder
+import recorder
+from audio_buffer import AudioBuffer
+
+RATE = recorder.TARGET_RATE
+
+def buffer_of(*parts):
+    buffer = AudioBuffer()
+    for part in parts:
+        buffer.append(part)
+    return buffer
+
+def tone(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (8000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+def speech_ranges(buffer, start=0, end=None):
+    # Only needs Settings, not a device
+    return recorder.AudioRecorder._speech_ranges(None, buffer, start,
+                                                 len(buffer) if end is None else end)
+
+def test_speech_ranges_untouched_without_trim_silence(fake_settings):
+    fake_settings(recorder)
+    buffer = buffer_of(silence(1.0), tone(1.0), silence(1.0))
+    assert speech_ranges(buffer) == [(0, len(buffer))]
+
+def test_speech_ranges_trims_within_the_requested_range(fake_settings):
+    fake_settings(recorder).update(trim_silence=True, max_pause=1.0)
+    buffer = buffer_of(tone(1.0), silence(1.0), tone(1.0), silence(1.0))
+    # Only the second tone and the silence around it
+    assert speech_ranges(buffer, 1 * RATE, 4 * RATE) == [(int(1.8 * RATE), int(3.2 * RATE))]
+
+def test_speech_ranges_falls_back_to_everything_without_speech(fake_settings):
+    fake_settings(recorder).update(trim_silence=True)
+    buffer = buffer_of(silence(2.0))
+    assert speech_ranges(buffer, 0, len(buffer)) == [(0, len(buffer))]
+
+class FakeHub:
+    """Stands in for the capture hub, the recorder never opens a stream here"""
+    
+    def resolve_device(self, name='', index=None):
+        return None
+        
+    def device_info(self, device_index=None):
+        return {'index': 0, 'name': 'test', 'defaultSampleRate': 48000.0, 'maxInputChannels': 1}
+
+@pytest.fixture
+def audio_recorder(monkeypatch, fake_settings):
+    from PyQt6.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication([])
+    monkeypatch.setattr(recorder, 'capture_hub', FakeHub)
+    fake_settings(recorder)
+    rec = recorder.AudioRecorder()
+    yield rec
+    rec.cleanup()
+
+class PacedWavEncoder(encoder.WavEncoder):
+    """WAV written at about ffmpeg's pace, waiting the way a pipe to ffmpeg would"""
+    
+    def encode(self, blocks, output, rate):
+        def paced():
+            for block in blocks:
+                time.sleep(len(block) / rate / 300)
+                yield block
+        super().encode(paced(), output, rate)
+
+def test_finalizing_a_long_recording_keeps_the_event_loop_responsive(audio_recorder, monkeypatch):
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from tracing import Trace
+    monkeypatch.setattr(recorder, 'select_encoder', lambda duration: PacedWavEncoder())
+    
+    # 30 minutes of noise, encoded in 300s chunks
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal(RATE * 60) * 3000).astype(np.int16)
+    audio_recorder.buffer = buffer_of(*[block] * 30)
+    audio_recorder.trace = Trace()
+    results = []
+    finalized = []
+    audio_recorder.audio_ready.connect(results.append)
+    
+    gaps = []
+    last = [time.monotonic()]
+    def tick():
+        now = time.monotonic()
+        gaps.append(now - last[0])
+        last[0] = now
+    timer = QTimer()
+    timer.setInterval(10)
+    timer.timeout.connect(tick)
+    loop = QEventLoop()
+    audio_recorder.finalized.connect(finalized.append)
+    audio_recorder.finalized.connect(loop.quit)
+    QTimer.singleShot(120000, loop.quit)
+    
+    started = time.monotonic()
+    timer.start()
+    audio_recorder._queue_finalize()
+    if not finalized:
+        loop.exec()
+    elapsed = time.monotonic() - started
+    timer.stop()
+    
+    assert finalized and len(results) == 1
+    audio = results[0]
+    # Noise has no pauses, so every cut is forced and overlaps the next chunk
+    assert len(audio.chunks) > 1
+    assert sum(chunk.duration for chunk in audio.chunks) - sum(audio.overlaps) == pytest.approx(1800)
+    # Encoding takes a while, and the GUI thread never waits on it
+    assert elapsed > 0.5
+    assert gaps and max(gaps) < 0.25
+
+class FakeSession:
+    def feed(self, samples):
+        pass
+
+    def end_of_audio(self):
+        pass
+
+def test_failed_start_leaves_no_realtime_session(audio_recorder):
+    errors = []
+    audio_recorder.recording_error.connect(errors.append)
+    # FakeHub cannot open a stream
+    audio_recorder.start_recording(realtime_session=FakeSession())
+    assert errors and not audio_recorder.is_recording
+    assert audio_recorder.realtime_session is None
+    assert not audio_recorder.stop_recording()
+
+def test_segments_cut_while_recording_cover_the_audio_in_order(audio_recorder):
+    from segmenter import PauseSegmenter
+    from tracing import Trace
+    # Three sentences with pauses between them
+    audio = np.concatenate((tone(3.0), silence(1.0), tone(3.0), silence(1.0), tone(2.0)))
+    segmenter = PauseSegmenter(RATE, min_segment=2.0)
+    cuts = [cut for start in range(0, len(audio), 320) for cut in segmenter.feed(audio[start:start + 320])]
+    assert len(cuts) == 2
+    
+    segments = []
+    audio_recorder.segment_ready.connect(lambda trace, index, encoded, is_last:
+                                         segments.append((index, encoded.duration, is_last)))
+    cursor = recorder.SegmentCursor()
+    trace = Trace()
+    buffer = buffer_of(audio)
+    # Cuts arrive in batches while recording, the rest comes with the stop
+    audio_recorder._emit_cuts(recorder.FinalizeTask(buffer, cursor, trace, cuts[:1], last=False))
+    audio_recorder._emit_cuts(recorder.FinalizeTask(buffer, cursor, trace, cuts[1:], last=False))
+    audio_recorder._emit_segment(buffer, cursor.start, len(buffer), cursor.index, trace, is_last=True)
+    
+    assert [index for index, _, _ in segments] == [0, 1, 2]
+    assert [is_last for _, _, is_last in segments] == [False, False, True]
+    assert sum(duration for _, duration, _ in segments) == pytest.approx(len(audio) / RATE)
+    assert cursor.start == cuts[-1] and cursor.index == 2
+
+def test_failed_segment_goes_out_with_the_next_one(audio_recorder, monkeypatch):
+    from tracing import Trace
+    buffer = buffer_of(tone(3.0))
+    write = recorder.AudioRecorder._write_recording
+    failures = [True]
+    def flaky(self, *args, **kwargs):
+        if failures.pop(0) if failures else False:
+            raise OSError("disk full")
+        return write(self, *args, **kwargs)
+    monkeypatch.setattr(recorder.AudioRecorder, '_write_recording', flaky)
+    segments = []
+    audio_recorder.segment_ready.connect(lambda trace, index, encoded, is_last:
+                                         segments.append((index, encoded.duration)))
+    cursor = recorder.SegmentCursor()
+    audio_recorder._emit_cuts(recorder.FinalizeTask(buffer, cursor, Trace(), [RATE, 2 * RATE], last=False))
+    assert segments == [(0, pytest.approx(2.0))]
+    assert cursor.start == 2 * RATE and cursor.index == 1
@@ -0,0 +1,105 @@
+import http.server
+import threading
+import time
+import httpx
+import pytest
+
+import http_client
+import request_policy
+from request_policy import DeadlineExceeded, RequestPolicy, RequestStats
+
+@pytest.fixture
+def policy(fake_settings):
+    def make(**values):
+        fake_settings(request_policy).update(values)
+        return RequestPolicy(RequestStats())
+    return make
+
+def test_losing_hedge_is_cancelled(policy):
+    p = policy(hedge_requests=True, request_deadline=1, request_deadline_factor=0)
+    attempts = []
+
+    def send(time_left, cancelled):
+        attempts.append(cancelled)
+        if len(attempts) == 1:
+            # The first attempt hangs until it is told to stop
+            assert cancelled.wait(5)
+            return 'cancelled'
+        return 'hedge'
+
+    assert p.call(send, 1.0) == 'hedge'
+    assert len(attempts) == 2 and all(cancelled.is_set() for cancelled in attempts)
+    assert p.stats.hedges == 1 and p.stats.hedge_wins == 1
+
+def test_expired_attempt_is_cancelled_and_retried(policy):
+    p = policy(request_deadline=0.2, request_deadline_factor=0, request_retries=1)
+    attempts = []
+
+    def send(time_left, cancelled):
+        attempts.append(cancelled)
+        assert time_left <= 0.2
+        if len(attempts) == 1:
+            cancelled.wait(5)
+            raise httpx.ReadError("closed")
+        return 'retried'
+
+    assert p.call(send, 1.0) == 'retried'
+    assert attempts[0].is_set()
+    assert "1 retries, 1 timeouts" in p.stats.summary()
+
+def test_deadline_exceeded_after_the_last_retry(policy):
+    p = policy(request_deadline=0.1, request_deadline_factor=0, request_retries=0)
+    with pytest.raises(DeadlineExceeded):
+        p.call(lambda time_left, cancelled: cancelled.wait(5), 1.0)
+    assert p.stats.failures == 1
+
+class SlowUpload(http.server.BaseHTTPRequestHandler):
+    """Reads request bodies at about 6 MB/s and counts what arrived"""
+    received = 0
+
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+        while remaining:
+            data = self.rfile.read(min(remaining, 64 * 1024))
+            if not data:
+                return
+            SlowUpload.received += len(data)
+            remaining -= len(data)
+            time.sleep(0.01)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def test_cancelled_upload_stops_sending():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowUpload)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stats = http_client.ConnectionStats()
+    client = httpx.Client(transport=http_client.CountingTransport(stats))
+    body = bytes(32 * 1024 * 1024)
+    cancelled = threading.Event()
+    errors = []
+
+    def upload():
+        try:
+            with http_client.cancel_on(cancelled):
+                client.post(f'http://127.0.0.1:{server.server_port}/', files={'file': ('a.wav', body)})
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        thread = threading.Thread(target=upload)
+        thread.start()
+        time.sleep(0.5)
+        cancelled.set()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert errors and isinstance(errors[0], http_client.RequestCancelled)
+        time.sleep(0.2)
+        # Socket buffers hold a few megabytes at most
+        assert SlowUpload.received < len(body) / 2
+    finally:
+        client.close()
+        server.shutdown()
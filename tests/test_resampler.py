@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+signal = pytest.importorskip('scipy.signal')
+from resampler import StreamingResampler
+
+def resample_in_blocks(samples, rate, sizes):
+    resampler = StreamingResampler(rate, 16000)
+    parts = []
+    start = 0
+    for size in sizes:
+        parts.append(resampler.process(samples[start:start + size]))
+        start += size
+    parts.append(resampler.process(samples[start:]))
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+@pytest.mark.parametrize('rate', [44100, 48000, 22050, 8000])
+def test_blocks_match_resample_poly_on_the_whole_signal(rate):
+    rng = np.random.default_rng(rate)
+    samples = (rng.standard_normal(rate * 2) * 4000).astype(np.int16)
+    # Irregular blocks, including empty and single-sample ones
+    sizes = [1024, 0, 1, 7, 4096, 333] * 10
+    streamed = resample_in_blocks(samples, rate, sizes)
+    reference = StreamingResampler(rate, 16000)
+    expected = signal.resample_poly(samples.astype(np.float64), reference.up, reference.down,
+                                    window=('kaiser', 5.0))
+    expected = np.clip(np.rint(expected), -32768, 32767).astype(np.int16)
+    assert len(streamed) == len(expected)
+    assert np.array_equal(streamed, expected)
+
+def test_block_size_does_not_change_the_output():
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(48000) * 4000).astype(np.int16)
+    small = resample_in_blocks(samples, 48000, [256] * 180)
+    large = resample_in_blocks(samples, 48000, [12000] * 3)
+    assert np.array_equal(small, large)
+
+def test_16khz_passes_through():
+    samples = np.arange(-500, 500, dtype=np.int16)
+    assert np.array_equal(resample_in_blocks(samples, 16000, [300, 300]), samples)
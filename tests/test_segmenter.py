@@ -0,0 +1,54 @@
+import numpy as np
+
+from segmenter import PauseSegmenter
+
+RATE = 16000
+
+def tone(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (8000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+def feed_in_blocks(segmenter, samples, block=320):
+    cuts = []
+    for start in range(0, len(samples), block):
+        cuts.extend(segmenter.feed(samples[start:start + block]))
+    return cuts
+
+def test_cuts_in_the_middle_of_the_first_long_enough_pause():
+    segmenter = PauseSegmenter(RATE, min_segment=2.0, min_pause=0.6)
+    audio = np.concatenate((tone(3.0), silence(1.0), tone(2.0)))
+    cuts = feed_in_blocks(segmenter, audio)
+    assert len(cuts) == 1
+    # Within the pause, with at least a quarter of it on either side
+    assert 3.2 * RATE <= cuts[0] <= 3.8 * RATE
+
+def test_no_cut_before_the_minimum_segment_length():
+    segmenter = PauseSegmenter(RATE, min_segment=5.0, min_pause=0.6)
+    audio = np.concatenate((tone(2.0), silence(1.0), tone(1.0)))
+    assert feed_in_blocks(segmenter, audio) == []
+
+def test_short_pauses_do_not_cut():
+    segmenter = PauseSegmenter(RATE, min_segment=1.0, min_pause=0.6)
+    audio = np.concatenate((tone(2.0), silence(0.3), tone(2.0)))
+    assert feed_in_blocks(segmenter, audio) == []
+
+def test_speech_without_pauses_is_cut_at_the_maximum_length():
+    segmenter = PauseSegmenter(RATE, min_segment=1.0, max_segment=2.0)
+    cuts = feed_in_blocks(segmenter, tone(5.0))
+    assert cuts == [2 * RATE, 4 * RATE]
+
+def test_every_pause_after_a_long_enough_segment_cuts():
+    segmenter = PauseSegmenter(RATE, min_segment=1.0, min_pause=0.5)
+    audio = np.concatenate([np.concatenate((tone(1.5), silence(0.8)))] * 3)
+    cuts = feed_in_blocks(segmenter, audio)
+    assert len(cuts) == 3
+    assert all(b - a >= RATE for a, b in zip([0] + cuts, cuts))
+
+def test_block_size_does_not_change_the_cuts():
+    audio = np.concatenate((tone(3.0), silence(1.0), tone(4.0), silence(0.7), tone(1.0)))
+    small = feed_in_blocks(PauseSegmenter(RATE, min_segment=2.0), audio, block=100)
+    large = feed_in_blocks(PauseSegmenter(RATE, min_segment=2.0), audio, block=16000)
+    assert small == large and len(small) == 2
@@ -0,0 +1,247 @@
+import http.server
+import json
+import threading
+import time
+import pytest
+
+import backends
+import transcriber
+from backends import RoutingBackend
+from encoder import EncodedAudio
+from transcript_cache import TranscriptCache
+
+class FakeEngine:
+    """A transcription engine that answers with its name and counts its calls"""
+
+    def __init__(self, name, model_name):
+        self.name = name
+        self.model_name = model_name
+        self.description = name
+        self.ready = threading.Event()
+        self.ready.set()
+        self.model = object()
+        self.calls = 0
+
+    @property
+    def engines(self):
+        return [self]
+
+    def served_by(self):
+        return self
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        self.calls += 1
+        return f"{self.name} text"
+
+@pytest.fixture
+def app():
+    from PyQt6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+@pytest.fixture
+def make_transcriber(app, fake_settings, monkeypatch, tmp_path):
+    """Build a WhisperTranscriber that sends its jobs to the given backend"""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    settings = fake_settings(transcriber, backends)
+    created = []
+
+    def make(backend, **values):
+        settings.update(values)
+        t = transcriber.WhisperTranscriber()
+        t.backend = backend
+        t.finished = []
+        t.errors = []
+        t.transcription_finished.connect(lambda job_id, text: t.finished.append((job_id, text)))
+        t.transcription_error.connect(lambda job_id, error: t.errors.append((job_id, error)))
+        created.append(t)
+        return t
+    yield make
+    for t in created:
+        t.shutdown()
+
+def wait_for(app, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    app.processEvents()
+    return condition()
+
+def recording(digest='digest', duration=2.0):
+    return EncodedAudio(b'RIFF' + bytes(64), 'recording.wav', duration, digest)
+
+def test_cache_is_keyed_on_the_engine_that_answered(app, make_transcriber):
+    local = FakeEngine('local', 'local-base')
+    api = FakeEngine('api', 'whisper-1')
+    router = RoutingBackend(local, api, local_seconds=10)
+    t = make_transcriber(router, cache_transcripts=True)
+    t.transcribe_file(recording())
+    assert wait_for(app, lambda: len(t.finished) == 1)
+    assert t.finished[0][1] == "local text"
+    assert t.cache.get(TranscriptCache.key('digest', 'local-base', '')) == "local text"
+    assert t.cache.get(TranscriptCache.key('digest', 'whisper-1', '')) is None
+
+def test_retried_recording_is_answered_from_the_cache(app, make_transcriber):
+    local = FakeEngine('local', 'local-base')
+    api = FakeEngine('api', 'whisper-1')
+    router = RoutingBackend(local, api, local_seconds=10)
+    t = make_transcriber(router, cache_transcripts=True)
+    audio = recording()
+    t.transcribe_file(audio)
+    assert wait_for(app, lambda: len(t.finished) == 1)
+    # The router would pick the API now, the local model's text is still good
+    router.local_seconds = 0
+    t.transcribe_file(audio)
+    assert wait_for(app, lambda: len(t.finished) == 2)
+    assert [text for _, text in t.finished] == ["local text", "local text"]
+    assert local.calls == 1 and api.calls == 0
+    assert t.cache.hits == 1
+
+def test_nothing_is_cached_when_caching_is_off(app, make_transcriber):
+    engine = FakeEngine('api', 'whisper-1')
+    t = make_transcriber(engine)
+    audio = recording()
+    t.transcribe_file(audio)
+    t.transcribe_file(audio)
+    assert wait_for(app, lambda: len(t.finished) == 2)
+    assert engine.calls == 2
+
+class SlowSegments(FakeEngine):
+    """Answers with the upload's contents, later segments faster than earlier ones"""
+
+    def __init__(self, delays):
+        super().__init__('api', 'whisper-1')
+        self.delays = delays
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        text = upload[1].decode()
+        time.sleep(self.delays.get(text, 0))
+        with self._lock:
+            self.finished.append(text)
+        return text
+
+def segment(text):
+    return EncodedAudio(text.encode(), 'segment.wav', 1.0)
+
+def test_segments_finishing_out_of_order_are_joined_in_order(app, make_transcriber):
+    from tracing import Trace
+    engine = SlowSegments({'one': 0.3, 'two': 0.15})
+    t = make_transcriber(engine, transcription_workers=3)
+    trace = Trace()
+    job_ids = {t.transcribe_segment(trace, index, segment(text), index == 2)
+               for index, text in enumerate(['one', 'two', 'three'])}
+    assert len(job_ids) == 1
+    assert wait_for(app, lambda: t.finished)
+    assert engine.finished == ['three', 'two', 'one']
+    assert t.finished == [(job_ids.pop(), "one two three")] and not t.errors
+    assert not t._sessions and not t._pipelines
+
+class Answers(FakeEngine):
+    """Answers with the upload's contents after a delay per answer, or fails on 'fail'"""
+
+    def __init__(self, delays=None):
+        super().__init__('api', 'whisper-1')
+        self.delays = delays or {}
+
+    def transcribe(self, upload, size, duration, prompt=None):
+        text = upload[1].decode()
+        time.sleep(self.delays.get(text, 0))
+        if text == 'fail':
+            raise RuntimeError("server on fire")
+        return text
+
+def test_results_are_delivered_in_submission_order(app, make_transcriber):
+    t = make_transcriber(Answers({'first': 0.3, 'second': 0.1}), transcription_workers=3)
+    order = []
+    t.transcription_finished.connect(lambda job_id, text: order.append(job_id))
+    ids = [t.transcribe_file(segment(text)) for text in ('first', 'second', 'third')]
+    assert wait_for(app, lambda: len(t.finished) == 3)
+    assert order == ids
+    assert [text for _, text in t.finished] == ['first', 'second', 'third']
+
+def test_failed_job_reports_its_error_in_turn(app, make_transcriber):
+    t = make_transcriber(Answers({'first': 0.2}), transcription_workers=2)
+    events = []
+    t.transcription_error.connect(lambda job_id, error: events.append(('error', job_id)))
+    t.transcription_finished.connect(lambda job_id, text: events.append(('finished', job_id)))
+    first, failed = t.transcribe_file(segment('first')), t.transcribe_file(segment('fail'))
+    assert wait_for(app, lambda: len(t.finished) == 2)
+    # The failure waits for the job before it, then comes with an empty text
+    assert events == [('finished', first), ('error', failed), ('finished', failed)]
+    assert t.finished[1] == (failed, "") and "server on fire" in t.errors[0][1]
+
+def test_pipeline_job_fails_once_its_tail_is_abandoned(app, make_transcriber):
+    from tracing import Trace
+    t = make_transcriber(Answers({'one': 0.2}), transcription_workers=2)
+    trace = Trace()
+    job_id = t.transcribe_segment(trace, 0, segment('one'), False)
+    t.transcribe_segment(trace, 1, segment('two'), False)
+    # Encoding the last segment failed, it will never arrive
+    assert t.abandon_segments(trace, "Failed to process recording")
+    later = t.transcribe_file(segment('later'))
+    assert wait_for(app, lambda: len(t.finished) == 2)
+    assert t.finished == [(job_id, "one two"), (later, "later")]
+    assert t.errors == [(job_id, "Failed to process recording")]
+    assert not t._sessions and not t._pipelines
+    # Nothing left to fail
+    assert not t.abandon_segments(trace, "again")
+
+def test_abandoned_pipeline_without_segments_in_flight_fails_at_once(app, make_transcriber):
+    from tracing import Trace
+    t = make_transcriber(Answers())
+    trace = Trace()
+    job_id = t.transcribe_segment(trace, 0, segment('one'), False)
+    assert wait_for(app, lambda: trace not in t._pipelines or t._sessions[job_id].texts)
+    assert t.abandon_segments(trace, "Failed to process recording")
+    assert wait_for(app, lambda: t.finished)
+    assert t.finished == [(job_id, "one")] and t.errors == [(job_id, "Failed to process recording")]
+
+def test_unknown_recording_has_nothing_to_abandon(make_transcriber):
+    from tracing import Trace
+    t = make_transcriber(Answers())
+    assert not t.abandon_segments(Trace(), "error")
+
+class TranscriptionServer(http.server.BaseHTTPRequestHandler):
+    """Minimal keep-alive stand-in for the transcription API"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'text': "hello"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def api_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), TranscriptionServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/v1'
+    server.shutdown()
+
+def test_prewarmed_connection_is_reused_by_the_transcription(app, fake_settings, make_transcriber, api_server):
+    import http_client
+    import request_policy
+    fake_settings(http_client, request_policy)
+    t = make_transcriber(None, openai_api_key='test', api_base_url=api_server)
+    t.load_model()
+    t.prewarm()
+    assert wait_for(app, lambda: t.connection_stats.requests == 1)
+    assert t.connection_stats.new_connections == 1
+    t.transcribe_file(recording())
+    assert wait_for(app, lambda: t.finished)
+    assert t.finished[0][1] == "hello"
+    assert t.connection_stats.requests == 2
+    assert t.connection_stats.new_connections == 1 and t.connection_stats.reused == 1
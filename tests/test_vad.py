@@ -0,0 +1,64 @@
+import numpy as np
+from vad import VoiceActivityDetector
+
+RATE = 16000
+
+def tone(seconds, amplitude=8000, frequency=220):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+def flags_for(*parts):
+    return VoiceActivityDetector(RATE).classify(np.concatenate(parts))
+
+def test_classify_flags_loud_frames():
+    flags = flags_for(silence(0.2), tone(0.2), silence(0.2))
+    assert flags.tolist() == [False] * 10 + [True] * 10 + [False] * 10
+
+def test_classify_keeps_incomplete_frame_for_next_call():
+    vad = VoiceActivityDetector(RATE)
+    samples = tone(0.04)  # exactly two 20ms frames
+    assert len(vad.classify(samples[:300])) == 0
+    assert vad.classify(samples[300:]).tolist() == [True, True]
+
+def test_classify_catches_quiet_fricatives_but_not_hum():
+    rng = np.random.default_rng(0)
+    # Below the loudness threshold, but crossing zero constantly like an "s"
+    hiss = (rng.standard_normal(RATE) * 200).astype(np.int16)
+    hum = tone(1.0, amplitude=280, frequency=50)
+    assert flags_for(hiss).all()
+    assert not flags_for(hum).any()
+
+def test_classify_views_matches_one_call():
+    samples = np.concatenate((silence(0.33), tone(0.51), silence(0.27)))
+    views = np.array_split(samples, 7)
+    assert (VoiceActivityDetector(RATE).classify_views(views).tolist()
+            == flags_for(samples)[:len(samples) // 320].tolist())
+
+def test_speech_ranges_trims_leading_and_trailing_silence():
+    vad = VoiceActivityDetector(RATE)
+    flags = flags_for(silence(1.0), tone(1.0), silence(1.0))
+    # Speech runs from 1.0s to 2.0s, padded by 0.2s on both sides
+    assert vad.speech_ranges(flags, padding=0.2) == [(int(0.8 * RATE), int(2.2 * RATE))]
+
+def test_speech_ranges_compresses_long_pauses_to_max_pause():
+    vad = VoiceActivityDetector(RATE)
+    flags = flags_for(tone(1.0), silence(3.0), tone(1.0))
+    (first_start, first_end), (second_start, second_end) = vad.speech_ranges(
+        flags, max_pause=1.0, padding=0.2)
+    assert (first_start, second_end) == (0, 5 * RATE)
+    # What is left of the pause is max_pause, plus the padding of the speech around it
+    kept = (first_end - 1 * RATE) + (4 * RATE - second_start)
+    assert kept == int((1.0 + 2 * 0.2) * RATE)
+
+def test_speech_ranges_keeps_short_pauses():
+    vad = VoiceActivityDetector(RATE)
+    flags = flags_for(tone(1.0), silence(0.5), tone(1.0))
+    assert vad.speech_ranges(flags, max_pause=1.0) == [(0, int(2.5 * RATE))]
+
+def test_speech_ranges_without_speech_is_empty():
+    vad = VoiceActivityDetector(RATE)
+    assert vad.speech_ranges(flags_for(silence(2.0))) == []
+    assert vad.speech_ranges(np.zeros(0, dtype=bool)) == []
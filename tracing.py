@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Stages reported in the summary: (name, from event, to event). Events that
+# happen more than once in a session (e.g. one request per pipeline
+# segment) count with their last occurrence, which is what the user waits on.
+STAGES = (
+    ('hotkey to stream open', 'start_requested', 'stream_open'),
+    ('stream open to first block', 'stream_open', 'first_block'),
+    ('hotkey to first sample', 'start_requested', 'first_sample'),
+    ('stop to finalize start', 'stop_requested', 'finalize_started'),
+    ('finalize', 'finalize_started', 'finalized'),
+    ('request', 'request_sent', 'response_received'),
+    ('response to clipboard', 'response_received', 'clipboard_set'),
+    ('stop to clipboard', 'stop_requested', 'clipboard_set'),
+)
+
+# Spans are summed per session, chunks and segments each add their own
+SPANS = ('resample', 'trim', 'encode', 'file_write')
+
+def default_trace_path():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state')
+    return os.path.join(base, 'telly-spelly', 'traces.jsonl')
+
+class Trace:
+    """Monotonic timestamps of one recording session, from hotkey to clipboard.
+
+    Marks and spans may come from any thread: the GUI, the audio callback,
+    the finalize worker or a transcription worker. A Trace without an id
+    is never written anywhere; it stands in when nobody is tracing.
+    """
+
+    def __init__(self, session_id=None):
+        self.id = session_id
+        self.events = []  # (name, time)
+        self.spans = []  # (name, start, end)
+        self._lock = threading.Lock()
+
+    def mark(self, name, at=None):
+        with self._lock:
+            self.events.append((name, time.monotonic() if at is None else at))
+
+    @contextmanager
+    def span(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                self.spans.append((name, start, end))
+
+    def last(self, name):
+        with self._lock:
+            times = [at for event, at in self.events if event == name]
+        return times[-1] if times else None
+
+    def durations(self):
+        """Seconds per stage and per span, for whatever this session got through"""
+        result = {}
+        for stage, start, end in STAGES:
+            start, end = self.last(start), self.last(end)
+            if start is not None and end is not None and end >= start:
+                result[stage] = end - start
+        with self._lock:
+            spans = list(self.spans)
+        for name in SPANS:
+            seconds = [end - start for span, start, end in spans if span == name]
+            if seconds:
+                result[name] = sum(seconds)
+        return result
+
+    def record(self, outcome):
+        """The session as one JSON-serializable dict, times in ms since the hotkey"""
+        with self._lock:
+            events, spans = list(self.events), list(self.spans)
+        origin = min([at for _, at in events] + [start for _, start, _ in spans], default=0)
+        return {
+            'session': self.id,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'outcome': outcome,
+            'events': [[name, round((at - origin) * 1000, 2)] for name, at in events],
+            'spans': [[name, round((start - origin) * 1000, 2), round((end - start) * 1000, 2)]
+                      for name, start, end in spans],
+            'durations': {name: round(seconds * 1000, 2)
+                          for name, seconds in self.durations().items()},
+        }
+
+class Tracer:
+    """Hands out session traces, logs finished ones and keeps rolling percentiles.
+
+    Every finished session is appended as one line to a JSONL file, which
+    is rotated once it grows past `max_bytes`. The summary only counts
+    sessions that ended with text on the clipboard.
+    """
+
+    def __init__(self, path=None, window=500, max_bytes=5 << 20):
+        self.path = path or default_trace_path()
+        self.max_bytes = max_bytes
+        self.window = window
+        self.outcomes = {}
+        self._durations = {}  # stage -> deque of recent seconds
+        self._next_id = 1
+        self._prefix = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def start_session(self):
+        with self._lock:
+            session_id = f"{self._prefix}-{self._next_id}"
+            self._next_id += 1
+        return Trace(session_id)
+
+    def finish(self, trace, outcome='ok'):
+        """Log a session once it is over; a trace is only finished once"""
+        if trace is None or trace.id is None:
+            return
+        record = trace.record(outcome)
+        trace.id = None
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome == 'ok':
+                for name, seconds in trace.durations().items():
+                    self._durations.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            self._write(record)
+        stages = ", ".join(f"{name} {ms:.0f} ms" for name, ms in record['durations'].items())
+        logger.info(f"Session {record['session']} {outcome}: {stages}")
+
+    def _write(self, record):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write the session trace: {e}")
+
+    def percentiles(self):
+        """Return {stage: (count, p50, p95, p99)} in seconds over the recent sessions"""
+        result = {}
+        with self._lock:
+            windows = {name: sorted(values) for name, values in self._durations.items()}
+        for name in [stage for stage, _, _ in STAGES] + list(SPANS):
+            values = windows.get(name)
+            if values:
+                result[name] = (len(values),) + tuple(
+                    values[min(len(values) - 1, int(fraction * len(values)))]
+                    for fraction in (0.5, 0.95, 0.99))
+        return result
+
+    def summary(self):
+        outcomes = ", ".join(f"{count} {outcome}" for outcome, count in sorted(self.outcomes.items()))
+        lines = [f"Sessions: {outcomes or 'none yet'}",
+                 f"{'stage':<28} {'n':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+        for name, (count, p50, p95, p99) in self.percentiles().items():
+            lines.append(f"{name:<28} {count:>4} {p50 * 1000:>8.0f} {p95 * 1000:>8.0f} {p99 * 1000:>8.0f}")
+        return "\n".join(lines)
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def tracer():
+    """Return the process-wide Tracer"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -1,78 +1,278 @@
-from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer
+from PyQt6.QtCore import QObject, pyqtSignal, QThread
 import os
 import logging
+import queue
+import re
 import time
-import openai
+from collections import deque
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from settings import Settings
+from encoder import ChunkedAudio
+from http_client import ConnectionStats, build_http_client, DEFAULT_BASE_URL
+from request_policy import RequestStats
+from backends import ApiBackend, create_local_backend, create_routing_backend
+from transcript_cache import TranscriptCache, pcm_digest
+from realtime import RealtimeSession
+from tracing import Trace
 logger = logging.getLogger(__name__)
 
+def _words(text):
+    return [re.sub(r'\W+', '', word).lower() for word in text.split()]
+
+def stitch_texts(texts, overlaps, max_overlap=12):
+    """Join chunk transcripts in order, dropping words repeated across overlapping seams"""
+    result = []
+    for text, overlap in zip(texts, overlaps):
+        words = text.split()
+        if result and words and overlap > 0:
+            tail = _words(" ".join(result[-max_overlap:]))
+            head = _words(" ".join(words[:max_overlap]))
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        result.extend(words)
+    return " ".join(result)
+
+class TranscriptionJob:
+    """One queued piece of audio and, once processed, its outcome"""
+    
+    def __init__(self, job_id, backend, audio, allow_empty=False, segment=None, trace=None):
+        self.id = job_id
+        self.backend = backend
+        # An in-memory EncodedAudio or ChunkedAudio, or the path of a temporary file
+        self.audio = audio
+        # Segments of a longer dictation may legitimately contain no speech
+        self.allow_empty = allow_empty
+        # Segment index when the job is part of a pipelined recording
+        self.segment = segment
+        # Trace of the recording session the audio belongs to
+        self.trace = trace or Trace()
+        self.text = ""
+        self.error = None
+
+class PipelineSession:
+    """Segment results of one pipelined recording, collected by index"""
+    
+    def __init__(self, trace):
+        self.trace = trace  # Of the recording, which the segments are matched by
+        self.texts = {}
+        self.errors = []
+        self.queued = 0
+        self.count = None  # Known once the last segment has arrived
+        
+    def is_complete(self):
+        return self.count is not None and len(self.texts) >= self.count
+
 class TranscriptionWorker(QThread):
-    finished = pyqtSignal(str)
+    """Long-lived worker that processes jobs from the shared queue until stopped"""
+    job_done = pyqtSignal(object)
     progress = pyqtSignal(str)
-    error = pyqtSignal(str)
     
-    def __init__(self, model, audio_file):
+    def __init__(self, jobs, cache):
         super().__init__()
-        self.model = model
-        self.audio_file = audio_file
+        self.jobs = jobs
+        self.cache = cache
+        self.backend = None
         
     def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:  # Shutdown sentinel
+                break
+            self.backend = job.backend
+            self._run_job(job)
+            self.job_done.emit(job)
+            
+    def _run_job(self, job):
+        audio = job.audio
         try:
-            if not os.path.exists(self.audio_file):
-                raise FileNotFoundError(f"Audio file not found: {self.audio_file}")
-                
-            self.progress.emit("Loading audio file...")
+            if isinstance(audio, str):
+                if not os.path.exists(audio):
+                    raise FileNotFoundError(f"Audio file not found: {audio}")
+                    
+                self.progress.emit("Loading audio file...")
+                with open(audio, "rb") as audio_file:
+                    upload = (os.path.basename(audio), audio_file.read())
+                size = len(upload[1])
+                # Only used to scale the deadline, assume 16kHz 16-bit WAV
+                duration = size / 32000
+            elif isinstance(audio, ChunkedAudio):
+                upload = None
+            else:
+                upload = audio.as_upload()
+                size = len(audio)
+                duration = audio.duration
             
-            # Load and transcribe using OpenAI API
-            self.progress.emit("Processing audio with OpenAI Whisper API...")
+            # Whichever engine transcribed this audio before, its text will do
+            digest = self._cache_digest(audio, upload)
+            text = None
+            if digest is not None:
+                text = self.cache.get(*(self._cache_key(digest, engine) for engine in self.backend.engines))
+            if text is not None:
+                logger.info(f"Job {job.id}: using cached transcription ({self.cache.summary()})")
+            else:
+                self.progress.emit(f"Processing audio with {self.backend.description}...")
+                
+                job.trace.mark('request_sent')
+                if upload is None:
+                    text, engine = self._transcribe_chunks(audio)
+                else:
+                    text = self.backend.transcribe(upload, size, duration)
+                    engine = self.backend.served_by()
+                job.trace.mark('response_received')
+                if digest is not None and engine is not None and text:
+                    self.cache.put(self._cache_key(digest, engine), text)
             
-            settings = Settings()
-            with open(self.audio_file, "rb") as audio_file:
-                # Use the OpenAI client to transcribe the audio
-                response = self.model.audio.transcriptions.create(
-                    file=audio_file,
-                    model=settings.get('model', 'whisper-1'),
-                    language=settings.get('language', '')
-                )
-            
-            text = response.text.strip()
-            if not text:
+            if not text and not job.allow_empty:
                 raise ValueError("No text was transcribed")
                 
             self.progress.emit("Transcription completed!")
-            logger.info(f"Transcribed text: {text[:100]}...")
-            self.finished.emit(text)
+            logger.info(f"Job {job.id}: transcribed text: {text[:100]}...")
+            job.text = text
             
         except Exception as e:
-            logger.error(f"Transcription error: {e}")
-            self.error.emit(f"Transcription failed: {str(e)}")
-            self.finished.emit("")
+            logger.error(f"Job {job.id}: transcription error: {e}")
+            job.error = f"Transcription failed: {str(e)}"
         finally:
-            # Clean up the temporary file
+            # Clean up the temporary file, if we were given one
             try:
-                if os.path.exists(self.audio_file):
-                    os.remove(self.audio_file)
+                if isinstance(audio, str) and os.path.exists(audio):
+                    os.remove(audio)
             except Exception as e:
                 logger.error(f"Failed to remove temporary file: {e}")
+            # Let the audio go as soon as it has been sent
+            job.audio = None
+                
+    def _cache_digest(self, audio, upload):
+        """Return the digest a job's audio is cached by, or None when caching is off"""
+        if not Settings().get('cache_transcripts', False):
+            return None
+        # Files only have their encoded bytes to go by
+        return pcm_digest([upload[1]]) if isinstance(audio, str) else audio.digest
+        
+    def _cache_key(self, digest, engine):
+        """Key of a transcript made by `engine`, the local model or the API, never the router"""
+        return TranscriptCache.key(digest, engine.model_name, Settings().get('language', ''))
+        
+    def _transcribe_chunks(self, audio):
+        """Transcribe the chunks of a long recording on a bounded thread pool.
+        
+        Chunks are submitted in order. When a chunk starts after its
+        predecessor has finished, the tail of the predecessor's text is sent
+        along as the prompt to keep wording and spelling consistent.
+        Returns the stitched text and the engine that transcribed every
+        chunk, or None if it took more than one.
+        """
+        try:
+            concurrency = max(1, int(Settings().get('chunk_concurrency', 4)))
+        except (ValueError, TypeError):
+            concurrency = 4
+        if self.backend.name == 'local':
+            # The local model runs one request at a time anyway, and going in
+            # order lets every chunk get its predecessor's text as prompt
+            concurrency = 1
+        count = len(audio.chunks)
+        texts = [None] * count
+        engines = set()
+        started = time.monotonic()
+        
+        def transcribe(index):
+            chunk_started = time.monotonic()
+            previous = texts[index - 1] if index > 0 else None
+            prompt = " ".join(previous.split()[-50:]) if previous else None
+            chunk = audio.chunks[index]
+            text = self.backend.transcribe(chunk.as_upload(), len(chunk), chunk.duration, prompt)
+            texts[index] = text
+            engines.add(self.backend.served_by())
+            logger.info(f"Chunk {index + 1}/{count} ({chunk.duration:.1f}s) transcribed "
+                        f"in {time.monotonic() - chunk_started:.2f}s")
+            self.progress.emit(f"Transcribed {sum(t is not None for t in texts)}/{count} chunks...")
+            return text
+        
+        with ThreadPoolExecutor(max_workers=min(concurrency, count)) as pool:
+            futures = [pool.submit(transcribe, index) for index in range(count)]
+            try:
+                results = [future.result() for future in futures]
+            except Exception:
+                # Don't start chunks whose result would be thrown away
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        logger.info(f"Transcribed {count} chunks ({audio.duration:.1f}s of audio) "
+                    f"in {time.monotonic() - started:.2f}s total")
+        return stitch_texts(results, audio.overlaps), engines.pop() if len(engines) == 1 else None
 
 class WhisperTranscriber(QObject):
+    """Queues transcription jobs for a fixed pool of long-lived workers.
+    
+    Every job gets an id, returned when it is submitted and carried by the
+    finished/error signals. Results are delivered in submission order even
+    when a later job completes first; each job ends with exactly one
+    transcription_finished (with empty text on failure), preceded by
+    transcription_error if something went wrong.
+    """
     transcription_progress = pyqtSignal(str)
-    transcription_finished = pyqtSignal(str)
-    transcription_error = pyqtSignal(str)
+    transcription_partial = pyqtSignal(int, str)  # job id, live text of a realtime session
+    transcription_finished = pyqtSignal(int, str)  # job id, text
+    transcription_error = pyqtSignal(int, str)  # job id, message
     
     def __init__(self):
         super().__init__()
         self.model = None
-        self.worker = None
-        self._cleanup_timer = QTimer()
-        self._cleanup_timer.timeout.connect(self._cleanup_worker)
-        self._cleanup_timer.setSingleShot(True)
+        # Engine jobs are sent to: the API, the resident local model, or a
+        # router choosing between the two per job
+        self.backend = None
+        self.local_backend = None
+        # Keep-alive connection pool shared by every request, and its counters
+        self.connection_stats = ConnectionStats()
+        # Retry, timeout and hedging counters of all workers
+        self.request_stats = RequestStats()
+        # Opt-in store of earlier results, so the same audio is never sent twice
+        self.cache = TranscriptCache(max_entries=self._int_setting('cache_max_entries', 1000),
+                                     max_age=self._int_setting('cache_max_age_days', 30) * 86400)
+        self.http_client = None
+        self.base_url = None
+        self._prewarming = threading.Lock()
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._next_job_id = 1
+        # Job ids awaiting delivery, oldest first, and results that are ready
+        self._order = deque()
+        self._results = {}
+        # Pipeline mode: sessions by job id, and their job ids by recording trace
+        self._sessions = {}
+        self._pipelines = {}
+        # Realtime mode: streaming sessions by job id
+        self._realtime = {}
         self.load_model()
+        self._start_workers()
         
     def load_model(self):
+        self._load_client()
+        mode = Settings().get('transcription_backend', 'api')
+        # Behind the router, going offline falls back to the local model without retrying
+        api = (ApiBackend(self.model, self.request_stats, retry_offline=mode != 'auto')
+               if self.model is not None else None)
+        if mode in ('local', 'auto') and self.local_backend is None:
+            # Loaded once and kept; the model takes a while to come up
+            self.local_backend = create_local_backend()
+        if mode == 'local':
+            self.backend = self.local_backend
+        elif mode == 'auto':
+            self.backend = create_routing_backend(self.local_backend, api)
+        else:
+            self.backend = api
+        logger.info(f"Transcribing with {self.backend.description if self.backend else 'nothing'}")
+        
+    def _load_client(self):
         try:
             settings = Settings()
             api_key = settings.get('openai_api_key', None)
+            # Lets the transcriber talk to a compatible or local stand-in server
+            base_url = settings.get('api_base_url', '') or None
             
             if not api_key:
                 logger.warning("OpenAI API key not found in settings. Transcription will not work until a key is provided.")
@@ -81,7 +281,16 @@ class WhisperTranscriber(QObject):
                 return
                 
             logger.info("Initializing OpenAI client")
-            self.model = openai.OpenAI(api_key=api_key)
+            # Only loaded once there is a key to use it with
+            import openai
+            if self.http_client:
+                self.http_client.close()
+            self.http_client = build_http_client(self.connection_stats)
+            self.base_url = base_url or DEFAULT_BASE_URL
+            # Passed on explicitly, openai ignores a client timeout that looks like httpx's default
+            self.model = openai.OpenAI(api_key=api_key, base_url=base_url,
+                                       http_client=self.http_client,
+                                       timeout=self.http_client.timeout)
             logger.info("OpenAI client initialized successfully")
             
         except Exception as e:
@@ -89,74 +298,261 @@ class WhisperTranscriber(QObject):
             # Don't raise the exception, just log it
             # This allows the app to start even if the client can't be initialized
             self.model = None
-        
-    def _cleanup_worker(self):
-        if self.worker:
-            if self.worker.isFinished():
-                self.worker.deleteLater()
-                self.worker = None
-                
-    def transcribe(self, audio_file):
-        """Transcribe audio file using OpenAI Whisper API"""
+            
+    def _int_setting(self, key, default):
         try:
-            # Check if model is initialized
-            if self.model is None:
-                error_msg = "OpenAI API key not configured. Please add your API key in Settings."
-                logger.error(error_msg)
-                self.transcription_error.emit(error_msg)
-                return
-                
-            settings = Settings()
-            language = settings.get('language', 'auto')
+            return max(1, int(Settings().get(key, default)))
+        except (ValueError, TypeError):
+            return default
             
-            # Emit progress update
-            self.transcription_progress.emit("Processing audio...")
+    def _start_workers(self):
+        count = self._int_setting('transcription_workers', 2)
+        for _ in range(count):
+            worker = TranscriptionWorker(self._jobs, self.cache)
+            worker.job_done.connect(self._job_done)
+            worker.progress.connect(self.transcription_progress)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {count} transcription workers")
+        
+    def shutdown(self):
+        """Drop queued jobs and stop the worker pool after its current jobs"""
+        try:
+            while True:
+                self._jobs.get_nowait()
+        except queue.Empty:
+            pass
+        for session in self._realtime.values():
+            session.close()
+        self._realtime = {}
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.wait()
+        self._workers = []
+        logger.info(f"HTTP connections: {self.connection_stats.summary()}")
+        logger.info(f"Transcription requests: {self.request_stats.summary()}")
+        logger.info(f"Transcript cache: {self.cache.summary()}")
+        self.cache.close()
+        if self.http_client:
+            self.http_client.close()
+            self.http_client = None
+        
+    def prewarm(self):
+        """Open (or refresh) a pooled connection to the API in the background.
+        
+        Called when a recording starts, so DNS, TCP and TLS setup are done by
+        the time the audio is ready to upload.
+        """
+        if (self.backend is None or self.backend.name == 'local' or self.http_client is None
+                or not self._prewarming.acquire(blocking=False)):
+            return
+        threading.Thread(target=self._prewarm, daemon=True).start()
+        
+    def _prewarm(self):
+        try:
+            # Any response will do, the point is the connection left in the pool
+            self.http_client.head(self.base_url)
+            logger.info(f"Connection pre-warmed ({self.connection_stats.summary()})")
+            self._set_online(True)
+        except Exception as e:
+            logger.warning(f"Connection pre-warm failed: {e}")
+            self._set_online(False)
+        finally:
+            self._prewarming.release()
+        
+    def _set_online(self, online):
+        # The pre-warm doubles as a connectivity check for the router
+        if self.backend is not None and self.backend.name == 'auto':
+            self.backend.set_online(online)
             
-            # Run transcription with language setting
-            with open(audio_file, "rb") as file:
-                response = self.model.audio.transcriptions.create(
-                    file=file,
-                    model="whisper-1",
-                    language=None if language == 'auto' else language
-                )
+    def _new_job_id(self):
+        job_id = self._next_job_id
+        self._next_job_id += 1
+        self._order.append(job_id)
+        return job_id
+        
+    def _complete(self, job_id, text, error=None):
+        self._results[job_id] = (text, error)
+        # Hand results out strictly in submission order
+        while self._order and self._order[0] in self._results:
+            done_id = self._order.popleft()
+            text, error = self._results.pop(done_id)
+            if error:
+                self.transcription_error.emit(done_id, error)
+            self.transcription_finished.emit(done_id, text)
             
-            text = response.text.strip()
-            if not text:
-                raise ValueError("No text was transcribed")
+    def _job_done(self, job):
+        if job.segment is not None:
+            self._segment_done(job)
+        else:
+            self._complete(job.id, job.text, job.error)
                 
-            self.transcription_progress.emit("Transcription completed!")
-            logger.info(f"Transcribed text: {text[:100]}...")
-            self.transcription_finished.emit(text)
+    def transcribe_file(self, audio, trace=None):
+        """Queue an EncodedAudio (or the path of a temporary file) and return its job id"""
+        job_id = self._new_job_id()
+        
+        # Check if there is anything to transcribe with
+        if self.backend is None:
+            error_msg = "OpenAI API key not configured. Please add your API key in Settings."
+            logger.error(error_msg)
+            self._complete(job_id, "", error_msg)
+            return job_id
             
-            # Clean up the temporary file
-            try:
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-            except Exception as e:
-                logger.error(f"Failed to remove temporary file: {e}")
+        # Emit initial progress status before the job is picked up
+        waiting = self._jobs.qsize()
+        if waiting:
+            self.transcription_progress.emit(f"Queued behind {waiting} other recording(s)...")
+        else:
+            self.transcription_progress.emit("Starting transcription...")
             
-        except Exception as e:
-            logger.error(f"Transcription failed: {e}")
-            self.transcription_error.emit(str(e))
+        logger.info(f"Queued transcription job {job_id}")
+        self._jobs.put(TranscriptionJob(job_id, self.backend, audio, trace=trace))
+        return job_id
 
-    def transcribe_file(self, audio_file):
-        if self.worker and self.worker.isRunning():
-            logger.warning("Transcription already in progress")
-            return
+    def transcribe_segment(self, trace, index, audio, is_last):
+        """Queue one segment of a recording, told apart from other recordings by its trace.
+        
+        All segments of a recording share one job id, returned here, which is
+        completed with the joined text once the last segment is back.
+        """
+        session_id = self._pipelines.get(trace)
+        if session_id is None:
+            session_id = self._new_job_id()
+            self._pipelines[trace] = session_id
+            self._sessions[session_id] = PipelineSession(trace)
+        session = self._sessions[session_id]
+        if session.count is not None:
+            # Abandoned, the job is already settled
+            return session_id
+        session.queued += 1
+        if is_last:
+            session.count = index + 1
             
-        # Check if model is initialized
-        if self.model is None:
+        if self.backend is None:
             error_msg = "OpenAI API key not configured. Please add your API key in Settings."
             logger.error(error_msg)
-            self.transcription_error.emit(error_msg)
+            session.errors.append(error_msg)
+            session.texts[index] = ""
+            self._check_session(session_id)
+            return session_id
+            
+        self._jobs.put(TranscriptionJob(session_id, self.backend, audio,
+                                        allow_empty=True, segment=index, trace=trace))
+        return session_id
+        
+    def abandon_segments(self, trace, error):
+        """Fail a pipeline recording whose remaining segments will never arrive.
+        
+        The job completes with the error once the segments already queued
+        are back. Returns whether the recording had a job to fail.
+        """
+        session_id = self._pipelines.get(trace)
+        if session_id is None:
+            return False
+        session = self._sessions[session_id]
+        session.errors.append(error)
+        session.count = session.queued
+        self._check_session(session_id)
+        return True
+        
+    def _segment_done(self, job):
+        session = self._sessions.get(job.id)
+        if session is None:
+            return
+        session.texts[job.segment] = job.text
+        if job.error:
+            session.errors.append(job.error)
+        if session.count is not None:
+            self.transcription_progress.emit(
+                f"Transcribed {len(session.texts)}/{session.count} segments...")
+        self._check_session(job.id)
+        
+    def _check_session(self, session_id):
+        session = self._sessions[session_id]
+        if not session.is_complete():
+            return
+        del self._sessions[session_id]
+        self._pipelines.pop(session.trace, None)
+            
+        text = " ".join(session.texts[i] for i in range(session.count)
+                        if session.texts.get(i))
+        if session.errors:
+            error = session.errors[0]
+        elif not text:
+            error = "No text was transcribed"
+        else:
+            error = None
+        if text:
+            logger.info(f"Job {session_id}: transcribed text: {text[:100]}...")
+        self._complete(session_id, text, error)
+        
+    def start_realtime(self, trace=None):
+        """Open a streaming session for a recording that is about to start.
+        
+        Returns the session, which the recorder feeds as it captures, or None
+        when streaming is not possible and the recording should be uploaded
+        once it is done.
+        """
+        api_key = Settings().get('openai_api_key', None)
+        if not api_key or (self.backend is not None and self.backend.name == 'local'):
+            return None
+        job_id = self._new_job_id()
+        session = RealtimeSession(job_id, api_key)
+        session.trace = trace
+        session.partial.connect(self.transcription_partial)
+        session.finished.connect(self._realtime_finished)
+        session.failed.connect(self._realtime_failed)
+        self._realtime[job_id] = session
+        session.start()
+        return session
+        
+    def finish_realtime(self, job_id, audio):
+        """Hand over the finished recording of a realtime session.
+        
+        The session completes the job by itself; the audio is only uploaded
+        if streaming failed.
+        """
+        session = self._realtime.get(job_id)
+        if session is None:
             return
+        session.audio = audio
+        if session.error:
+            self._realtime_fallback(session)
+        else:
+            self.transcription_progress.emit("Finishing live transcription...")
+            
+    def cancel_realtime(self, job_id):
+        session = self._realtime.pop(job_id, None)
+        if session is not None:
+            session.close()
+            self._complete(job_id, "")
             
-        # Emit initial progress status before starting worker
-        self.transcription_progress.emit("Starting transcription...")
+    def _realtime_finished(self, job_id, text):
+        session = self._realtime.pop(job_id, None)
+        if session is None:
+            return
+        session.close()
+        if session.trace is not None:
+            session.trace.mark('response_received')
+        logger.info(f"Job {job_id}: realtime transcription: {text[:100]}...")
+        self._complete(job_id, text, None if text else "No text was transcribed")
+        
+    def _realtime_failed(self, job_id, error):
+        session = self._realtime.get(job_id)
+        if session is None:
+            return
+        session.error = error
+        # Without the recording yet, the fallback waits for finish_realtime
+        if session.audio is not None:
+            self._realtime_fallback(session)
             
-        self.worker = TranscriptionWorker(self.model, audio_file)
-        self.worker.finished.connect(self.transcription_finished)
-        self.worker.progress.connect(self.transcription_progress)
-        self.worker.error.connect(self.transcription_error)
-        self.worker.finished.connect(lambda: self._cleanup_timer.start(1000))
-        self.worker.start() 
\ No newline at end of file
+    def _realtime_fallback(self, session):
+        del self._realtime[session.job_id]
+        session.close()
+        if self.backend is None:
+            self._complete(session.job_id, "", session.error)
+            return
+        logger.warning(f"Job {session.job_id}: {session.error}, uploading the recording instead")
+        self.transcription_progress.emit("Live transcription failed, uploading recording...")
+        self._jobs.put(TranscriptionJob(session.job_id, self.backend, session.audio, trace=session.trace))
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def default_cache_path():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'telly-spelly', 'transcripts.sqlite')
+
+def pcm_digest(blocks):
+    """Hash int16 PCM blocks; equal audio gives an equal digest whatever the upload format"""
+    digest = hashlib.blake2b(digest_size=20)
+    for block in blocks:
+        digest.update(block)
+    return digest.hexdigest()
+
+class TranscriptCache:
+    """Transcripts stored on disk by audio digest, engine model and language.
+
+    Entries older than `max_age` seconds are dropped and, beyond
+    `max_entries`, the least recently used ones go first. The database is
+    only opened on first use.
+    """
+
+    def __init__(self, path=None, max_entries=1000, max_age=30 * 86400):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    @staticmethod
+    def key(digest, model, language):
+        return hashlib.blake2b(f"{digest}:{model}:{language or ''}".encode(), digest_size=20).hexdigest()
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS transcripts "
+                             "(key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL, used REAL)")
+            self._evict()
+        return self._db
+
+    def get(self, *keys):
+        """Return the cached text of the first of `keys` found, or None"""
+        with self._lock:
+            db = self._connect()
+            now = time.time()
+            for key in keys:
+                row = db.execute("SELECT text, created FROM transcripts WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.max_age:
+                    db.execute("UPDATE transcripts SET used = ? WHERE key = ?", (now, key))
+                    db.commit()
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            db = self._connect()
+            now = time.time()
+            db.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?)", (key, text, now, now))
+            self._evict()
+
+    def _evict(self):
+        self._db.execute("DELETE FROM transcripts WHERE created < ?", (time.time() - self.max_age,))
+        self._db.execute("DELETE FROM transcripts WHERE key NOT IN "
+                         "(SELECT key FROM transcripts ORDER BY used DESC LIMIT ?)", (self.max_entries,))
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM transcripts")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = f"{100 * self.hits / lookups:.0f}%" if lookups else "n/a"
+        return f"{self.hits} hits, {self.misses} misses ({rate} hit rate)"
@@ -12,10 +12,11 @@ def uninstall_application():
     if app_dir.exists():
         shutil.rmtree(app_dir)
     
-    # Remove launcher
-    launcher = home / ".local/bin/telly-spelly"
-    if launcher.exists():
-        launcher.unlink()
+    # Remove launchers
+    for name in ("telly-spelly", "telly-spelly-ctl"):
+        launcher = home / ".local/bin" / name
+        if launcher.exists():
+            launcher.unlink()
     
     # Remove desktop file
     desktop_file = home / ".local/share/applications/org.kde.telly_spelly.desktop"
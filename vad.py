@@ -0,0 +1,92 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class VoiceActivityDetector:
+    """Frame-level energy / zero-crossing voice activity detector.
+
+    Works on 16kHz int16 audio in fixed-size frames. A frame counts as
+    speech when it is loud enough, or when it is quieter but crosses zero
+    often, which catches unvoiced consonants such as "s" and "f".
+    Samples can be fed incrementally; an incomplete trailing frame is kept
+    until the next call.
+    """
+
+    def __init__(self, rate=16000, frame_duration=0.02, threshold=0.01,
+                 zcr_threshold=0.25):
+        self.rate = rate
+        self.frame_size = int(rate * frame_duration)
+        # RMS threshold on the int16 scale
+        self.threshold = threshold * 32768.0
+        self.zcr_threshold = zcr_threshold
+        self.reset()
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.int16)
+
+    def classify(self, samples):
+        """Return one speech/non-speech flag per complete frame"""
+        data = np.concatenate((self._pending, samples)) if len(self._pending) else samples
+        frame_count = len(data) // self.frame_size
+        used = frame_count * self.frame_size
+        self._pending = data[used:].copy()
+        if not frame_count:
+            return np.zeros(0, dtype=bool)
+
+        frames = data[:used].astype(np.float32).reshape(frame_count, self.frame_size)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_size
+        return (rms >= self.threshold) | ((rms >= self.threshold / 3) & (zcr >= self.zcr_threshold))
+
+    def classify_views(self, views):
+        """Classify a recording handed over as a sequence of array views"""
+        self.reset()
+        flags = [self.classify(view) for view in views]
+        self.reset()
+        return np.concatenate(flags) if flags else np.zeros(0, dtype=bool)
+
+    def speech_ranges(self, flags, max_pause=1.0, padding=0.2):
+        """Turn frame flags into the sample ranges worth keeping.
+
+        Leading and trailing silence is dropped, speech is padded by
+        `padding` seconds on each side and any pause longer than
+        `max_pause` seconds is shortened to exactly that.
+        """
+        if not flags.any():
+            return []
+        pad = int(round(padding * self.rate / self.frame_size))
+        max_gap = int(round(max_pause * self.rate / self.frame_size))
+
+        # Boundaries of speech runs as [start, end) frame indices
+        edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        starts = np.maximum(starts - pad, 0)
+        ends = np.minimum(ends + pad, len(flags))
+
+        # Close every gap down to at most max_gap frames
+        gaps = starts[1:] - ends[:-1]
+        keep = np.minimum(np.maximum(gaps, 0), max_gap)
+        ends[:-1] += keep // 2
+        starts[1:] -= keep - keep // 2
+
+        ranges = []
+        for start, end in zip(starts * self.frame_size, ends * self.frame_size):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return [(int(start), int(end)) for start, end in ranges]
+
+    def longest_pause(self, flags):
+        """Return (start, end) frame indices of the longest non-speech run, or None"""
+        silent = ~flags
+        if not silent.any():
+            return None
+        edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        longest = np.argmax(ends - starts)
+        return int(starts[longest]), int(ends[longest])
@@ -1,7 +1,6 @@
 from PyQt6.QtWidgets import QWidget
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPainter, QColor, QLinearGradient
-import numpy as np
 from collections import deque
 
 class VolumeMeter(QWidget):
@@ -40,9 +39,9 @@ class VolumeMeter(QWidget):
         # Calculate smoothed value
         if len(self.value_buffer) > 0:
             # Use weighted average favoring recent values
-            weights = np.array([0.5, 0.3, 0.2][:len(self.value_buffer)])
-            weights = weights / weights.sum()  # Normalize weights
-            avg_value = np.average(self.value_buffer, weights=weights)
+            # Plain Python for three values, so the GUI doesn't have to load numpy
+            weights = [0.5, 0.3, 0.2][:len(self.value_buffer)]
+            avg_value = sum(w * v for w, v in zip(weights, self.value_buffer)) / sum(weights)
             
             # More responsive scaling
             target_value = min(1.0, avg_value / self.sensitivity)
@@ -52,7 +51,7 @@ class VolumeMeter(QWidget):
                        (1 - self.smoothing) * target_value)
             
             # Less aggressive curve
-            self.value = np.power(smoothed, 0.9)
+            self.value = smoothed ** 0.9
             self.last_value = smoothed
         else:
             self.value = 0
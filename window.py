@@ -67,7 +67,8 @@ class RecordingDialog(QDialog):
         self.stop_btn = QPushButton(QIcon.fromTheme('media-playback-stop'), "Stop Recording")
         layout.addWidget(self.stop_btn)
         
-        # Timer for updating volume meter
+        # Timer for polling the recorder's level meter
+        self.meter_reader = None
         self.update_timer = QTimer()
         self.update_timer.setInterval(50)  # 20fps
         self.update_timer.timeout.connect(self.update_volume)
@@ -94,13 +95,12 @@ class RecordingDialog(QDialog):
         self.volume_meter.set_value(0)
         
     def update_volume(self, value=None):
-        if hasattr(self.parent(), 'recorder'):
-            if value is None and self.parent().recorder.frames:
-                # Calculate RMS of the last frame if no value provided
-                last_frame = np.frombuffer(self.parent().recorder.frames[-1], dtype=np.int16)
-                value = np.sqrt(np.mean(np.square(last_frame))) / 32768.0
-            if value is not None:
-                self.volume_meter.set_value(value)
+        if value is None and getattr(self.parent(), 'recorder', None):
+            if self.meter_reader is None:
+                self.meter_reader = self.parent().recorder.meter.reader()
+            value, _ = self.meter_reader.level()
+        if value is not None:
+            self.volume_meter.set_value(value)
 
 class WhisperWindow(QMainWindow):
     start_recording = pyqtSignal()
@@ -153,10 +153,11 @@ class WhisperWindow(QMainWindow):
         main_layout = QVBoxLayout(central_widget)
         
         # Model selection frame
-        model_frame = ModernFrame("Whisper Model")
+        model_frame = ModernFrame("Local Whisper Model")
         self.model_combo = QComboBox()
-        self.model_combo.addItems(['tiny', 'base', 'small', 'medium', 'large', 'turbo'])
-        self.model_combo.setCurrentText(self.settings.get('model', 'turbo'))
+        self.model_combo.addItems(Settings.VALID_LOCAL_MODELS)
+        self.model_combo.setCurrentText(self.settings.get('local_model', 'base'))
+        self.model_combo.currentTextChanged.connect(lambda name: self.settings.set('local_model', name))
         model_frame.content_layout.addWidget(self.model_combo)
         main_layout.addWidget(model_frame)
         
@@ -226,7 +227,8 @@ class WhisperWindow(QMainWindow):
         main_layout.addLayout(record_layout)
         main_layout.addStretch()
         
-        # Timer for updating volume meter
+        # Timer for polling the recorder's level meter
+        self.meter_reader = None
         self.update_timer = QTimer()
         self.update_timer.setInterval(50)
         self.update_timer.timeout.connect(self.update_volume)
@@ -240,22 +242,18 @@ class WhisperWindow(QMainWindow):
         if not self.recorder:
             return
             
-        for i in range(self.recorder.audio.get_device_count()):
-            device_info = self.recorder.audio.get_device_info_by_index(i)
-            if device_info.get('maxInputChannels') > 0:
-                name = device_info.get('name')
-                self.mic_combo.addItem(name, i)  # Store index directly as integer
+        for device_info in self.recorder.get_device_list():
+            name = device_info.get('name')
+            self.mic_combo.addItem(name, device_info['index'])  # Store index directly as integer
                 
-        # Select previously used mic
-        try:
-            mic_index = int(self.settings.get('mic_index', -1))
-            if mic_index >= 0:
-                for i in range(self.mic_combo.count()):
-                    if self.mic_combo.itemData(i) == mic_index:
-                        self.mic_combo.setCurrentIndex(i)
-                        break
-        except (ValueError, TypeError):
-            pass
+        # Select previously used mic, by name unless only an index was saved
+        mic_name = self.settings.get('mic_name', '')
+        if mic_name:
+            index = self.mic_combo.findText(mic_name)
+        else:
+            index = self.mic_combo.findData(self.settings.get('mic_index', -1))
+        if index >= 0:
+            self.mic_combo.setCurrentIndex(index)
         
     def setup_shortcuts(self):
         self.shortcut = QKeySequence("Ctrl+Alt+R")
@@ -286,7 +284,7 @@ class WhisperWindow(QMainWindow):
         if self.recording_dialog:
             self.recording_dialog.set_message(message)
             
-    def handle_transcription_finished(self, text):
+    def handle_transcription_finished(self, job_id, text):
         if self.recording_dialog:
             self.recording_dialog.close()
             self.recording_dialog = None
@@ -295,7 +293,7 @@ class WhisperWindow(QMainWindow):
         self.settings.set('output_method', method)
         self.output_method_changed.emit(method)
 
-    def handle_transcription_error(self, error_message):
+    def handle_transcription_error(self, job_id, error_message):
         QMessageBox.warning(self, "Transcription Error", error_message)
         if self.recording_dialog:
             self.recording_dialog.close()
@@ -340,11 +338,13 @@ class WhisperWindow(QMainWindow):
         try:
             device_index = self.mic_combo.currentData()
             if device_index is not None:
-                self.recorder.start_mic_test(device_index)
+                mic_name = self.mic_combo.currentText()
+                self.recorder.start_mic_test(mic_name)
                 self.update_timer.start()
                 self.mic_combo.setEnabled(False)
-                # Save the selected mic index
+                # Save the selected mic
                 self.settings.set('mic_index', device_index)
+                self.settings.set('mic_name', mic_name)
         except Exception as e:
             logger.error(f"Failed to start mic test: {e}")
             self.test_button.setChecked(False)